@@ -0,0 +1,385 @@
+import argparse
+import os
+import sys
+from src.data_processor import DataProcessor
+
+def build_gemini_api(args):
+    """Real Gemini client, or the offline fake with --fake-gemini"""
+    from src.cache import ClassificationCache
+    from src.gemini_api import GeminiAPI
+    from src.rate_limiter import TokenBucket
+    
+    rate_limiter = TokenBucket(rate=args.rate, capacity=args.burst)
+    cache = ClassificationCache(os.path.join(args.models_path, "classification_cache.db"))
+    if args.fake_gemini:
+        from src.fakes import FakeGenerativeModel
+        model = FakeGenerativeModel(latency=args.fake_latency)
+        return GeminiAPI(None, model=model, rate_limiter=rate_limiter, batch_size=args.batch_size, cache=cache)
+    
+    api_key = args.api_key or os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        sys.exit("A Gemini API key is required (--api-key or GEMINI_API_KEY), or use --fake-gemini.")
+    return GeminiAPI(api_key, rate_limiter=rate_limiter, batch_size=args.batch_size, cache=cache)
+
+def build_embedding_processor(args):
+    """EmbeddingProcessor with the encoder settings from the global options"""
+    from src.embedding import EmbeddingProcessor
+    return EmbeddingProcessor(cache_dir=args.models_path, backend=args.encoder_backend, onnx_file=args.onnx_file,
+                              tolerance=args.encoder_tolerance, processes=args.encode_processes)
+
+def build_duplicate_detector(args, embedding_processor=None, required=False):
+    """DuplicateDetector over <data-path>/duplicates.db; None if not required and never built"""
+    from src.dedup import DuplicateDetector
+    path = os.path.join(args.data_path, "duplicates.db")
+    if not required and not os.path.exists(path):
+        return None
+    return DuplicateDetector(path, threshold=getattr(args, "dedupe_threshold", 0.8),
+                             embedding_processor=embedding_processor)
+
+def build_lexical_index(args, required=False):
+    """BM25Index over <data-path>/bm25.log; None if not required and never built"""
+    from src.lexical_index import BM25Index
+    path = os.path.join(args.data_path, "bm25.log")
+    if not required and not os.path.exists(path):
+        return None
+    return BM25Index(path)
+
+def run_analyze(args):
+    """Analyze every topic and store the generated conclusions"""
+    from src.batch import BatchAnalyzer
+    from src.cache import ConclusionCache
+    
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    embedding_processor = build_embedding_processor(args)
+    batch = BatchAnalyzer(
+        data_processor,
+        embedding_processor,
+        build_gemini_api(args),
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        top_k=args.top_k,
+        threshold=args.threshold,
+        conclusion_cache=ConclusionCache(os.path.join(args.models_path, "conclusion_cache.db")),
+        duplicate_detector=build_duplicate_detector(args),
+    )
+    summary = batch.run(limit=args.limit, reset=args.reset)
+    data_processor.save_data()
+    print(f"Done: {summary}")
+
+def run_assign_topics(args):
+    """Assign unassigned opinions to their best matching topic"""
+    from src.similarity_join import assign_topics
+    
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    embedding_processor = build_embedding_processor(args)
+    assignments = assign_topics(
+        data_processor,
+        embedding_processor,
+        threshold=args.threshold,
+        block_size=args.block_size,
+        workers=args.workers,
+        only_unassigned=not args.all,
+        write_back=not args.dry_run,
+    )
+    if args.output:
+        assignments.to_csv(args.output, index=False)
+    data_processor.save_data()
+    print(f"{len(assignments)} opinion/topic assignments.")
+
+def run_ingest(args):
+    """Stream opinions from a JSONL/CSV file or stdin into the dataset"""
+    from src.ingest import StreamingIngestor, read_records
+    
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    embedding_processor = None
+    if not args.no_embed:
+        embedding_processor = build_embedding_processor(args)
+    
+    ingestor = StreamingIngestor(
+        data_processor,
+        embedding_processor,
+        batch_size=args.batch_size,
+        max_pending_batches=args.max_pending,
+        duplicate_detector=build_duplicate_detector(args, required=True) if args.dedupe else None,
+        lexical_index=build_lexical_index(args),
+    )
+    ingestor.ingest(read_records(args.source, text_field=args.text_field))
+    data_processor.save_data()
+
+def run_dedupe(args):
+    """Link near-duplicate opinions in the existing corpus to their canonical opinion"""
+    import time
+    
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    embedding_processor = build_embedding_processor(args) if args.confirm_embeddings else None
+    detector = build_duplicate_detector(args, embedding_processor, required=True)
+    if args.reset:
+        detector.reset()
+    
+    opinions = data_processor.opinions
+    start = time.monotonic()
+    for chunk_start in range(0, len(opinions), args.chunk_size):
+        chunk = opinions.iloc[chunk_start:chunk_start + args.chunk_size]
+        detector.add_many(chunk["id"].tolist(), chunk["text"].tolist())
+        done = min(chunk_start + args.chunk_size, len(opinions))
+        print(f"{done}/{len(opinions)} opinions, {len(detector.duplicate_ids)} near-duplicates, "
+              f"{done / max(time.monotonic() - start, 1e-9):.0f} opinions/s")
+    print(f"Done: {detector.stats()}")
+
+def run_lexical_index(args):
+    """Index opinions missing from the BM25 index (or all of them with --rebuild) and try a query"""
+    import time
+    
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    index = build_lexical_index(args, required=True)
+    if args.rebuild:
+        index.reset()
+    
+    opinions = data_processor.opinions
+    start = time.monotonic()
+    added = index.sync(opinions["id"].tolist(), opinions["text"].tolist())
+    if args.rebuild or added:
+        index.compact()
+    print(f"Indexed {added} opinions in {time.monotonic() - start:.1f}s; "
+          f"{len(index)} opinions, {len(index.postings)} terms.")
+    
+    if args.query:
+        texts = dict(zip(opinions["id"], opinions["text"]))
+        found_ids, scores = index.search(args.query, top_k=args.top_k)
+        for opinion_id, score in zip(found_ids, scores.tolist()):
+            print(f"{score:>8.3f}  {opinion_id}  {str(texts.get(opinion_id, ''))[:80]}")
+
+def run_cluster(args):
+    """Build opinion clusters, show their stats and candidate topics, or promote one to a topic"""
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    embedding_processor = build_embedding_processor(args)
+    
+    if args.promote is not None:
+        clusterer = embedding_processor.clusterer
+        if clusterer is None:
+            sys.exit("No clusters yet; run `cluster` first.")
+        candidates = {c["cluster"]: c for c in clusterer.candidate_topics(data_processor, min_size=1, limit=None)}
+        text = args.text or (candidates[args.promote]["text"] if args.promote in candidates else None)
+        if not text:
+            sys.exit(f"Cluster {args.promote} is not a candidate topic; pass --text to promote it anyway.")
+        topic_id = clusterer.promote(args.promote, data_processor, text)
+        data_processor.save_data()
+        print(f"Created topic {topic_id} from cluster {args.promote}.")
+        return
+    
+    if embedding_processor.clusterer is None or args.rebuild:
+        opinions = data_processor.opinions
+        if opinions.empty:
+            sys.exit("No opinions in the dataset.")
+        clusterer = embedding_processor.build_clusters(opinions["id"].tolist(), opinions["text"].tolist(),
+                                                       n_clusters=args.n_clusters, spawn_threshold=args.spawn_threshold)
+        print(f"Built {len(clusterer)} clusters over {len(clusterer.assignments)} opinions.")
+    
+    clusters = sorted(embedding_processor.clusterer.stats(), key=lambda row: -row["size"])
+    print(f"{'cluster':>7} {'size':>7} {'cohesion':>8} {'topic':>14}")
+    for row in clusters[:args.top]:
+        print(f"{row['cluster']:>7} {row['size']:>7} {row['cohesion']:>8.3f} {row['topic_id'] or '-':>14}")
+    
+    print("\nCandidate topics (promote with --promote CLUSTER):")
+    for candidate in embedding_processor.clusterer.candidate_topics(data_processor, min_size=args.min_size, limit=args.top):
+        print(f"{candidate['cluster']:>7} {candidate['unassigned']:>5} unassigned  {candidate['text'][:80]}")
+
+def run_quantize(args):
+    """Build a compact opinion index and report memory and recall for every mode"""
+    import numpy as np
+    from src.quantization import MODES, quantization_report
+    
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    embedding_processor = build_embedding_processor(args)
+    opinions = data_processor.opinions
+    if opinions.empty:
+        sys.exit("No opinions in the dataset.")
+    opinion_ids = opinions["id"].tolist()
+    vectors = embedding_processor.embed_opinions(opinion_ids, opinions["text"].tolist())
+    
+    # Topics are the real queries; sample them for the recall measurement
+    topics = data_processor.topics
+    sample = topics.sample(min(args.queries, len(topics)), random_state=0) if not topics.empty else topics
+    queries = embedding_processor.embed_topics(sample["id"].tolist(), sample["text"].tolist()) if not sample.empty \
+        else vectors[np.random.default_rng(0).choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    
+    print(f"{'mode':<8} {'MB':>10} {'bytes/vec':>10} {'x smaller':>10} {'recall@k':>9} {'rescored':>9}")
+    for row in quantization_report(opinion_ids, vectors, queries, top_k=args.top_k, modes=MODES,
+                                   rescore_factor=args.rescore_factor):
+        print(f"{row['mode']:<8} {row['bytes'] / 1e6:>10.2f} {row['bytes_per_vector']:>10.1f} "
+              f"{row['compression']:>10.1f} {row['recall']:>9.3f} {row['recall_rescored']:>9.3f}")
+    
+    if args.mode:
+        embedding_processor.build_quantized_index(opinion_ids, opinions["text"].tolist(), mode=args.mode,
+                                                  rescore_factor=args.rescore_factor)
+        print(f"Saved {args.mode} index to {embedding_processor.quantized_index_path}")
+
+def run_index(args):
+    """Build the approximate (IVF) opinion index and report its recall against the exact search"""
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    embedding_processor = build_embedding_processor(args)
+    opinions = data_processor.opinions
+    if opinions.empty:
+        sys.exit("No opinions in the dataset.")
+    opinion_ids = opinions["id"].tolist()
+    
+    if embedding_processor.ann_index is None or args.rebuild:
+        index = embedding_processor.build_index(opinion_ids, opinions["text"].tolist(), n_lists=args.n_lists,
+                                                n_probe=args.n_probe)
+        print(f"Built IVF index with {index.n_lists} lists over {len(index)} opinions "
+              f"({embedding_processor.index_path}).")
+    
+    # Topics are the real queries; sample them for the recall measurement
+    topics = data_processor.topics
+    sample = topics.sample(min(args.queries, len(topics)), random_state=0) if not topics.empty \
+        else opinions.sample(min(args.queries, len(opinions)), random_state=0)
+    recall = embedding_processor.index_recall(sample["text"].tolist(), opinion_ids, opinions["text"].tolist(),
+                                              top_k=args.top_k)
+    print(f"recall@{args.top_k} over {len(sample)} queries: {recall:.3f}")
+
+def run_export_csv(args):
+    """Write the SQLite tables back out as <data-path>/<table>.csv"""
+    if args.backend != "sqlite":
+        sys.exit("The csv backend already keeps the CSV files current.")
+    data_processor = DataProcessor(data_path=args.data_path, backend=args.backend)
+    data_processor.storage.export_csv(args.data_path)
+    print(f"Exported topics, opinions and conclusions to {args.data_path}.")
+
+def run_bench(args):
+    """Time every analysis stage offline and compare against a saved baseline"""
+    from src.benchmark import compare_results, format_comparison, format_results, load_results, run_benchmarks, save_results
+    
+    results = run_benchmarks(args.data_path, scale=args.scale, backend=args.backend, queries=args.queries,
+                             repeat=args.repeat, seed=args.seed)
+    print(format_results(results))
+    if args.output:
+        save_results(results, args.output)
+        print(f"Saved results to {args.output}")
+    
+    if args.compare:
+        baseline = load_results(args.compare)
+        for key in ("scale", "backend", "queries"):
+            if baseline["meta"].get(key) != results["meta"][key]:
+                print(f"Warning: baseline {key}={baseline['meta'].get(key)} differs from this run ({results['meta'][key]})")
+        rows = compare_results(baseline, results, tolerance=args.tolerance)
+        print(format_comparison(rows))
+        regressions = [row["stage"] for row in rows if row["regression"]]
+        if regressions:
+            sys.exit(f"{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DigitalPulse headless tools")
+    parser.add_argument("--data-path", default="data")
+    parser.add_argument("--models-path", default="models")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="sqlite",
+                        help="Storage backend; sqlite (<data-path>/digitalpulse.db) is the store the app uses")
+    parser.add_argument("--encoder-backend", choices=["torch", "torch-int8", "onnx"], default="torch",
+                        help="CPU backend for the embedding model")
+    parser.add_argument("--onnx-file", help="ONNX file inside the model repo, e.g. onnx/model_qint8_avx512_vnni.onnx")
+    parser.add_argument("--encoder-tolerance", type=float, default=0.01,
+                        help="Max 1 - cosine vs. the torch model before falling back to torch")
+    parser.add_argument("--encode-processes", type=int, default=0, help="Worker processes for large encoding jobs")
+    parser.add_argument("--telemetry", action="store_true", help="Record stage timings and Gemini usage")
+    parser.add_argument("--trace-log", help="Write every timed stage as a JSON line to this file (implies --telemetry)")
+    parser.add_argument("--metrics-file", help="Write Prometheus text metrics here on exit (implies --telemetry)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    analyze = subparsers.add_parser("analyze", help="Analyze every topic and store generated conclusions")
+    analyze.add_argument("--api-key", help="Gemini API key (defaults to $GEMINI_API_KEY)")
+    analyze.add_argument("--fake-gemini", action="store_true", help="Use the offline fake Gemini model")
+    analyze.add_argument("--fake-latency", type=float, default=0.05)
+    analyze.add_argument("--rate", type=float, default=1.0, help="Gemini requests per second")
+    analyze.add_argument("--burst", type=int, default=5)
+    analyze.add_argument("--batch-size", type=int, default=10, help="Opinions per classification request")
+    analyze.add_argument("--workers", type=int, default=4)
+    analyze.add_argument("--top-k", type=int, default=7)
+    analyze.add_argument("--threshold", type=float, default=0.85)
+    analyze.add_argument("--limit", type=int, help="Analyze at most this many topics")
+    analyze.add_argument("--checkpoint", help="Checkpoint file (defaults to <data-path>/batch_checkpoint.log)")
+    analyze.add_argument("--reset", action="store_true", help="Ignore the checkpoint and start over")
+    analyze.set_defaults(func=run_analyze)
+    
+    assign = subparsers.add_parser("assign-topics", help="Fill in topic_id for opinions from a bulk similarity join")
+    assign.add_argument("--threshold", type=float, default=0.85)
+    assign.add_argument("--block-size", type=int, default=1024, help="Rows per similarity tile")
+    assign.add_argument("--workers", type=int, help="Threads computing tiles (defaults to CPU count)")
+    assign.add_argument("--all", action="store_true", help="Also re-assign opinions that already have a topic")
+    assign.add_argument("--dry-run", action="store_true", help="Do not write topic_id back")
+    assign.add_argument("--output", help="Write the assignment table to this CSV")
+    assign.set_defaults(func=run_assign_topics)
+    
+    ingest = subparsers.add_parser("ingest", help="Bulk-load opinions from a JSONL/CSV file or stdin ('-')")
+    ingest.add_argument("source", help="Path to a .jsonl or .csv file, or - for JSONL on stdin")
+    ingest.add_argument("--text-field", default="text")
+    ingest.add_argument("--batch-size", type=int, default=512, help="Records per storage write and encode call")
+    ingest.add_argument("--max-pending", type=int, default=4, help="Batches queued for embedding before reading pauses")
+    ingest.add_argument("--no-embed", action="store_true", help="Only store opinions, embed them later")
+    ingest.add_argument("--dedupe", action="store_true", help="Link near-duplicates to their canonical opinion")
+    ingest.add_argument("--dedupe-threshold", type=float, default=0.8, help="Estimated Jaccard similarity for a match")
+    ingest.set_defaults(func=run_ingest)
+    
+    dedupe = subparsers.add_parser("dedupe", help="Link near-duplicate opinions (MinHash/LSH) in the existing corpus")
+    dedupe.add_argument("--dedupe-threshold", type=float, default=0.8, help="Estimated Jaccard similarity for a match")
+    dedupe.add_argument("--confirm-embeddings", action="store_true", help="Also require embedding similarity")
+    dedupe.add_argument("--chunk-size", type=int, default=5000)
+    dedupe.add_argument("--reset", action="store_true", help="Forget existing links and start over")
+    dedupe.set_defaults(func=run_dedupe)
+    
+    cluster = subparsers.add_parser("cluster", help="Cluster opinions for two-stage retrieval and topic discovery")
+    cluster.add_argument("--n-clusters", type=int, help="Initial clusters (defaults to sqrt of the opinion count)")
+    cluster.add_argument("--spawn-threshold", type=float, default=0.55,
+                         help="New opinions less similar than this to every centroid start a new cluster")
+    cluster.add_argument("--rebuild", action="store_true", help="Recluster from scratch")
+    cluster.add_argument("--top", type=int, default=20, help="Clusters and candidates to list")
+    cluster.add_argument("--min-size", type=int, default=5, help="Smallest cluster offered as a candidate topic")
+    cluster.add_argument("--promote", type=int, help="Create a topic from this cluster via add_topic")
+    cluster.add_argument("--text", help="Topic text for --promote (defaults to the cluster's representative opinion)")
+    cluster.set_defaults(func=run_cluster)
+    
+    lexical = subparsers.add_parser("lexical-index", help="Build the BM25 index used for prefiltering and hybrid ranking")
+    lexical.add_argument("--rebuild", action="store_true", help="Reindex every opinion from scratch")
+    lexical.add_argument("--query", help="Print the best BM25 matches for this text")
+    lexical.add_argument("--top-k", type=int, default=10)
+    lexical.set_defaults(func=run_lexical_index)
+    
+    quantize = subparsers.add_parser("quantize", help="Report memory/recall of compact vector modes and build one")
+    quantize.add_argument("--mode", choices=["float16", "int8", "binary"], help="Build and save an index in this mode")
+    quantize.add_argument("--rescore-factor", type=int, default=10, help="Shortlist size as a multiple of top-k")
+    quantize.add_argument("--top-k", type=int, default=7)
+    quantize.add_argument("--queries", type=int, default=200, help="Topics sampled as recall queries")
+    quantize.set_defaults(func=run_quantize)
+    
+    index = subparsers.add_parser("index", help="Build the approximate (IVF) opinion index and report its recall")
+    index.add_argument("--n-lists", type=int, help="Inverted lists (defaults to sqrt of the opinion count)")
+    index.add_argument("--n-probe", type=int, default=8, help="Lists scored per query")
+    index.add_argument("--rebuild", action="store_true", help="Rebuild an existing index")
+    index.add_argument("--top-k", type=int, default=7)
+    index.add_argument("--queries", type=int, default=200, help="Topics sampled as recall queries")
+    index.set_defaults(func=run_index)
+    
+    export = subparsers.add_parser("export-csv", help="Write the SQLite tables back to the CSV files")
+    export.set_defaults(func=run_export_csv)
+    
+    bench = subparsers.add_parser("bench", help="Offline benchmark of storage, encoding, retrieval and analysis")
+    bench.add_argument("--scale", type=int, default=1, help="Repeat the corpus this many times")
+    bench.add_argument("--queries", type=int, default=50, help="Topics used as queries")
+    bench.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is kept")
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--output", help="Save results as JSON (e.g. benchmarks/baseline.json)")
+    bench.add_argument("--compare", help="Baseline JSON to compare against; exits non-zero on regressions")
+    bench.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown per stage before flagging")
+    bench.set_defaults(func=run_bench)
+    
+    args = parser.parse_args(argv)
+    if args.telemetry or args.trace_log or args.metrics_file:
+        from src.telemetry import telemetry
+        telemetry.enable(args.trace_log)
+    try:
+        args.func(args)
+    finally:
+        if args.metrics_file:
+            telemetry.write_prometheus(args.metrics_file)
+            print(f"Wrote metrics to {args.metrics_file}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
 import streamlit as st
 import pandas as pd
 import os
-import time
-from src.data_processor import DataProcessor
-from src.embedding import EmbeddingProcessor
-from src.gemini_api import GeminiAPI
+from src.resources import SharedResources
+from src.analysis import TopicAnalyzer
+from src.telemetry import telemetry
 
 # Set page configuration
 st.set_page_config(
@@ -13,12 +12,19 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state
-if "data_processor" not in st.session_state:
-    st.session_state.data_processor = DataProcessor(data_path="data")
+@st.cache_resource
+def get_shared_resources():
+    """Dataset, embedding model and caches shared by every session in this process"""
+    resources = SharedResources(data_path="data", models_path="models", backend="sqlite")
+    # Load the embedding model in the background so the first page renders right away
+    resources.warm_up()
+    return resources
 
-if "embedding_processor" not in st.session_state:
-    st.session_state.embedding_processor = EmbeddingProcessor(cache_dir="models")
+# Initialize session state from the shared resources
+resources = get_shared_resources()
+st.session_state.data_processor = resources.data_processor
+st.session_state.embedding_processor = resources.embedding_processor
+st.session_state.conclusion_cache = resources.conclusion_cache
 
 # Sidebar for API key
 with st.sidebar:
@@ -29,22 +35,36 @@ with st.sidebar:
     api_key = st.text_input("Enter Gemini API Key:", type="password")
     
     if api_key:
-        st.session_state.gemini_api = GeminiAPI(api_key)
+        st.session_state.gemini_api = resources.gemini_api(api_key)
         st.success("API key set!")
     else:
         st.warning("Please enter a Gemini API key to use classification and conclusion generation.")
     
+    # Lexical prefilter / hybrid ranking over the BM25 index, or embeddings only
+    retrieval = st.selectbox(
+        "Retrieval:",
+        options=["dense", "hybrid", "prefilter"],
+        help="dense: embeddings only; hybrid: rank related opinions and keyword matches by BM25 and embedding "
+             "scores; prefilter: rank only the best BM25 matches by embedding"
+    )
+    
     # Show data statistics
     st.subheader("Dataset Statistics")
-    st.write(f"Topics: {len(st.session_state.data_processor.topics)}")
-    st.write(f"Opinions: {len(st.session_state.data_processor.opinions)}")
-    st.write(f"Conclusions: {len(st.session_state.data_processor.conclusions)}")
+    st.write(f"Topics: {st.session_state.data_processor.count('topics')}")
+    st.write(f"Opinions: {st.session_state.data_processor.count('opinions')}")
+    st.write(f"Conclusions: {st.session_state.data_processor.count('conclusions')}")
+    
+    # Filled in at the end of the script, after this run's analysis finished
+    timing_panel = st.container()
 
 # Main content
 st.title("DigitalPulse Social Media Analyzer")
 
+# Root tracing span of an analysis run in this script run, if any
+trace = None
+
 # Choose between adding a comment or analyzing a topic
-tab1, tab2 = st.tabs(["Add Comment", "Analyze Topic"])
+tab1, tab2, tab3 = st.tabs(["Add Comment", "Analyze Topic", "Candidate Topics"])
 
 with tab1:
     st.header("Add New Comment/Opinion")
@@ -62,6 +82,9 @@ with tab1:
                     effectiveness=None
                 )
                 st.success(f"Comment added successfully with ID: {opinion_id}")
+                canonical_id = resources.duplicate_detector.canonical_of([opinion_id]).get(opinion_id)
+                if canonical_id and canonical_id != opinion_id:
+                    st.info(f"This looks like a repost of opinion {canonical_id}; analyses will use that one.")
         else:
             st.error("Please enter a comment.")
 
@@ -76,57 +99,38 @@ with tab2:
         
         if st.button("Analyze Topic"):
             if topic_text and 'gemini_api' in st.session_state:
-                with st.spinner("Analyzing topic..."):
+                with st.spinner("Analyzing topic..."), telemetry.span("app.analyze_topic", option="enter") as trace:
                     # Find related opinions without adding to topics.csv
-                    processor = st.session_state.embedding_processor
-                    data_processor = st.session_state.data_processor
-                    
-                    # Get all opinions
-                    opinions_texts = data_processor.opinions["text"].tolist()
-                    opinion_ids = data_processor.opinions["id"].tolist()
+                    analyzer = TopicAnalyzer(
+                        st.session_state.data_processor,
+                        st.session_state.embedding_processor,
+                        st.session_state.gemini_api,
+                        conclusion_cache=st.session_state.conclusion_cache,
+                        duplicate_detector=resources.duplicate_detector,
+                        lexical_index=resources.lexical_index if retrieval != "dense" else None,
+                        retrieval=retrieval
+                    )
                     
-                    if opinions_texts:
-                        # Find related opinions
-                        found_opinions, similarity_scores, relevant_idxs = processor.find_related_opinions(
-                            topic_text, opinions_texts, threshold=0.85
-                        )
-                        
-                        # Sort the opinions by similarity score (highest first)
-                        sorted_indices = sorted(range(len(similarity_scores)), key=lambda i: similarity_scores[i], reverse=True)
-                        
-                        # Take only the top 7 opinions (or fewer if less than 7 are found)
-                        top_indices = sorted_indices[:min(7, len(sorted_indices))]
-                        
-                        # Get the top opinions and their indices
-                        top_opinions = [found_opinions[i] for i in top_indices]
-                        top_relevant_idxs = [relevant_idxs[i] for i in top_indices]
-                        top_scores = [similarity_scores[i] for i in top_indices]
+                    if st.session_state.data_processor.count('opinions'):
+                        # Find the top 7 related opinions (highest similarity first)
+                        top_opinions = analyzer.related_opinions(topic_text)
                         
                         st.subheader("Topic:")
                         st.write(topic_text)
                         
                         if top_opinions:
-                            related_opinions_with_types = []
-                            
                             st.subheader("Related Opinions:")
                             
-                            for i, (opinion, score, idx) in enumerate(zip(top_opinions, top_scores, top_relevant_idxs)):
-                                # Classify the opinion
-                                opinion_type = st.session_state.gemini_api.classify_opinion(opinion)
-                                
+                            # Reuse stored/cached classifications, classify the rest concurrently
+                            opinion_types = analyzer.classify(top_opinions)
+                            
+                            for i, (opinion, opinion_type) in enumerate(zip(top_opinions, opinion_types)):
                                 # Display in the required format
-                                st.write(f"Related Opinion {i+1} ({opinion_type})- {opinion}")
-                                
-                                related_opinions_with_types.append((opinion, opinion_type))
-                                
-                                # Add a delay between API calls to avoid rate limits
-                                time.sleep(1)
+                                st.write(f"Related Opinion {i+1} ({opinion_type})- {opinion['text']}")
                             
                             # Generate conclusion
                             st.subheader("Conclusion")
-                            conclusion = st.session_state.gemini_api.generate_conclusion(
-                                topic_text, related_opinions_with_types
-                            )
+                            conclusion = analyzer.conclude(topic_text, top_opinions, opinion_types)
                             
                             st.write(f"Conclusion- {conclusion}")
                         else:
@@ -156,8 +160,10 @@ with tab2:
             
             selected_topic_id = topic_dict[selected_topic_text]
             
+            save_conclusion = st.checkbox("Save generated conclusion to the dataset")
+            
             if st.button("Analyze Topic"):
-                with st.spinner("Analyzing topic..."):
+                with st.spinner("Analyzing topic..."), telemetry.span("app.analyze_topic", option="select") as trace:
                     # Get topic details
                     topic_row = st.session_state.data_processor.get_topic_by_id(selected_topic_id)
                     
@@ -168,59 +174,44 @@ with tab2:
                         st.write(topic_text)
                         
                         # Get all opinions to analyze with embeddings
-                        processor = st.session_state.embedding_processor
+                        analyzer = TopicAnalyzer(
+                            st.session_state.data_processor,
+                            st.session_state.embedding_processor,
+                            st.session_state.gemini_api,
+                            conclusion_cache=st.session_state.conclusion_cache,
+                            duplicate_detector=resources.duplicate_detector,
+                            lexical_index=resources.lexical_index if retrieval != "dense" else None,
+                            retrieval=retrieval
+                        )
                         data_processor = st.session_state.data_processor
                         
-                        # Get all opinions
-                        opinions_texts = data_processor.opinions["text"].tolist()
-                        opinion_ids = data_processor.opinions["id"].tolist()
-                        
-                        if opinions_texts:
-                            # Find related opinions
-                            found_opinions, similarity_scores, relevant_idxs = processor.find_related_opinions(
-                                topic_text, opinions_texts, threshold=0.85
-                            )
-                            
-                            # Sort the opinions by similarity score (highest first)
-                            sorted_indices = sorted(range(len(similarity_scores)), key=lambda i: similarity_scores[i], reverse=True)
-                            
-                            # Take only the top 7 opinions (or fewer if less than 7 are found)
-                            top_indices = sorted_indices[:min(7, len(sorted_indices))]
-                            
-                            # Get the top opinions and their indices
-                            top_opinions = [found_opinions[i] for i in top_indices]
-                            top_relevant_idxs = [relevant_idxs[i] for i in top_indices]
-                            top_scores = [similarity_scores[i] for i in top_indices]
+                        if data_processor.count('opinions'):
+                            # Find the top 7 related opinions (highest similarity first)
+                            top_opinions = analyzer.related_opinions(topic_text, topic_id=selected_topic_id)
                             
                             if top_opinions:
-                                related_opinions_with_types = []
-                                
                                 st.subheader("Related Opinions:")
                                 
-                                for i, (opinion, score, idx) in enumerate(zip(top_opinions, top_scores, top_relevant_idxs)):
-                                    # Classify the opinion
-                                    opinion_type = st.session_state.gemini_api.classify_opinion(opinion)
-                                    
+                                # Reuse stored/cached classifications, classify the rest concurrently
+                                opinion_types = analyzer.classify(top_opinions)
+                                
+                                for i, (opinion, opinion_type) in enumerate(zip(top_opinions, opinion_types)):
                                     # Display in the required format
-                                    st.write(f"Related Opinion {i+1} ({opinion_type})- {opinion}")
-                                    
-                                    related_opinions_with_types.append((opinion, opinion_type))
-                                    
-                                    # Add a delay between API calls to avoid rate limits
-                                    time.sleep(1)
+                                    st.write(f"Related Opinion {i+1} ({opinion_type})- {opinion['text']}")
                                 
-                                # Generate new conclusion but don't save it
+                                # Generate new conclusion (or reuse a cached one), saving it only if asked
                                 st.subheader("New Generated Conclusion")
-                                new_conclusion = st.session_state.gemini_api.generate_conclusion(
-                                    topic_text, related_opinions_with_types
+                                new_conclusion = analyzer.conclude(
+                                    topic_text, top_opinions, opinion_types,
+                                    topic_id=selected_topic_id, persist=save_conclusion
                                 )
                                 
                                 st.write(f"Conclusion- {new_conclusion}")
                                 
-                                # Display existing conclusion from CSV if it exists
+                                # Display the stored conclusion if there is one
                                 existing_conclusion = data_processor.get_conclusion_by_topic_id(selected_topic_id)
                                 if not existing_conclusion.empty:
-                                    st.subheader("Existing Conclusion from CSV")
+                                    st.subheader("Existing Conclusion")
                                     st.write(f"Conclusion- {existing_conclusion['text'].values[0]}")
                                 else:
                                     st.info("No existing conclusion found in CSV for this topic.")
@@ -233,6 +224,46 @@ with tab2:
         else:
             st.info("No topics in the dataset. Create a new topic first.")
 
+with tab3:
+    st.header("Candidate Topics")
+    
+    # Clusters of new opinions that no topic covers yet (built with `python cli.py cluster`)
+    clusterer = st.session_state.embedding_processor.clusterer
+    if clusterer is None:
+        st.info("No opinion clusters yet. Run `python cli.py cluster` to build them.")
+    elif st.checkbox("Show candidate topics"):
+        # Reads the opinions table, so only when asked for
+        candidates = clusterer.candidate_topics(st.session_state.data_processor)
+        if not candidates:
+            st.info("No candidate topics right now.")
+        for candidate in candidates:
+            st.write(f"Cluster {candidate['cluster']} ({candidate['unassigned']} unassigned opinions, "
+                     f"cohesion {candidate['cohesion']:.2f})- {candidate['text']}")
+            if st.button("Create topic", key=f"promote_{candidate['cluster']}"):
+                topic_id = clusterer.promote(candidate["cluster"], st.session_state.data_processor, candidate["text"])
+                st.success(f"Topic {topic_id} created.")
+
+# Stage timings of the last analysis in this session (DIGITALPULSE_TELEMETRY=1)
+if telemetry.enabled:
+    if trace is not None and trace.records:
+        st.session_state.last_trace = list(trace.records)
+        if os.environ.get("DIGITALPULSE_METRICS_FILE"):
+            telemetry.write_prometheus(os.environ["DIGITALPULSE_METRICS_FILE"])
+    
+    with timing_panel:
+        st.subheader("Last Analysis Timings")
+        last_trace = st.session_state.get("last_trace")
+        if last_trace:
+            timings = pd.DataFrame(last_trace)
+            st.dataframe(timings[["span", "ms"]], hide_index=True)
+        else:
+            st.caption("Run an analysis to see stage timings.")
+        
+        counters, _ = telemetry.snapshot()
+        gemini_calls = sum(value for (name, _), value in counters.items() if name == "gemini_requests_total")
+        gemini_failures = sum(value for (name, _), value in counters.items() if name == "gemini_failures_total")
+        st.caption(f"Gemini calls: {gemini_calls}, failures: {gemini_failures}")
+
 # Footer
 st.markdown("---")
 st.caption("DigitalPulse Social Media Analysis Tool - Event Driven System")
\ No newline at end of file
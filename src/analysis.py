@@ -0,0 +1,161 @@
+from src.cache import conclusion_fingerprint
+from src.gemini_api import CONCLUSION_PROMPT_VERSION, VALID_CATEGORIES
+from src.telemetry import telemetry
+
+RETRIEVAL_MODES = ("dense", "prefilter", "hybrid")
+
+class TopicAnalyzer:
+    """Topic analysis flow shared by the Streamlit app: retrieve, classify, conclude"""
+    def __init__(self, data_processor, embedding_processor, gemini_api=None, top_k=7, threshold=0.85,
+                 conclusion_cache=None, duplicate_detector=None, lexical_index=None, retrieval="dense",
+                 prefilter_k=1000, alpha=0.7, lexical_min_cosine=0.5):
+        self.data_processor = data_processor
+        self.embedding_processor = embedding_processor
+        self.gemini_api = gemini_api
+        self.top_k = top_k
+        self.threshold = threshold
+        self.conclusion_cache = conclusion_cache
+        
+        # Optional dedup.DuplicateDetector; near-duplicates of another opinion are never ranked
+        self.duplicate_detector = duplicate_detector
+        
+        # Optional lexical_index.BM25Index. "prefilter" ranks only its top `prefilter_k` opinions by
+        # embedding; "hybrid" fuses both scores: alpha * cosine + (1 - alpha) * BM25 / best BM25.
+        # Opinions sharing terms with the topic only need `lexical_min_cosine`, others `threshold`
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"retrieval must be one of {RETRIEVAL_MODES}")
+        self.lexical_index = lexical_index
+        self.retrieval = retrieval if lexical_index is not None else "dense"
+        self.prefilter_k = prefilter_k
+        self.alpha = alpha
+        self.lexical_min_cosine = lexical_min_cosine
+    
+    def unique_opinions(self, opinions):
+        """Drop opinions linked to a canonical opinion by the duplicate detector"""
+        if self.duplicate_detector is None or not self.duplicate_detector.duplicate_ids:
+            return opinions
+        return opinions[~opinions["id"].isin(self.duplicate_detector.duplicate_ids)].reset_index(drop=True)
+    
+    @telemetry.traced("analysis.related_opinions")
+    def related_opinions(self, topic_text, topic_id=None):
+        """Top-k opinions related to the topic, best first, as dicts with a `score`.
+
+        When `topic_id` is given and opinions were already assigned to it (see
+        similarity_join.assign_topics), only those opinions are ranked. In hybrid
+        mode the dicts also carry `dense_score` and `lexical_score`.
+        """
+        if topic_id is not None:
+            assigned = self.unique_opinions(self.data_processor.get_opinions_by_topic_id(topic_id).reset_index(drop=True))
+            if not assigned.empty:
+                if self.retrieval == "hybrid":
+                    return self._fuse(topic_text, assigned, self.lexical_index.lexical_scores(topic_text, assigned["id"]),
+                                      threshold=None)
+                return self._rank(topic_text, assigned, threshold=None, quantized=False)
+        
+        opinions = self.unique_opinions(self.data_processor.opinions)
+        if opinions.empty:
+            return []
+        # A quantized index (cli.py quantize), an IVF index (cli.py index) or opinion clusters
+        # (cli.py cluster) built for this deployment serve full-corpus searches, in that order
+        search = {"quantized": self.embedding_processor.quantized_index is not None,
+                  "use_index": self.embedding_processor.ann_index is not None,
+                  "clustered": self.embedding_processor.clusterer is not None}
+        if self.retrieval == "dense":
+            return self._rank(topic_text, opinions, threshold=self.threshold, **search)
+        
+        with telemetry.span("retrieve.lexical", mode=self.retrieval) as span:
+            found_ids, scores = self.lexical_index.search(topic_text, top_k=self.prefilter_k)
+            lexical = dict(zip(found_ids, scores.tolist()))
+            span.set(hits=len(lexical))
+        if self.retrieval == "prefilter":
+            candidates = opinions[opinions["id"].isin(lexical)].reset_index(drop=True)
+            if candidates.empty:
+                # No shared terms at all: fall back to the dense search
+                return self._rank(topic_text, opinions, threshold=self.threshold, **search)
+            return self._rank(topic_text, candidates, threshold=min(self.threshold, self.lexical_min_cosine),
+                              quantized=False)
+        
+        # Hybrid: the lexical shortlist plus the dense hits, which catch opinions sharing no terms with the topic
+        dense = self._rank(topic_text, opinions, threshold=self.threshold, **search)
+        candidate_ids = set(lexical) | {opinion["id"] for opinion in dense}
+        candidates = opinions[opinions["id"].isin(candidate_ids)].reset_index(drop=True)
+        return self._fuse(topic_text, candidates, lexical, threshold=self.threshold)
+    
+    def _fuse(self, topic_text, candidates, lexical, threshold):
+        """Rank candidates by alpha * cosine + (1 - alpha) * normalized BM25.
+
+        Candidates must reach the cosine `threshold`, or `lexical_min_cosine` when
+        they share terms with the topic, so a keyword match still needs to be related.
+        """
+        if candidates.empty:
+            return []
+        floor = None if threshold is None else min(threshold, self.lexical_min_cosine)
+        related = self._rank(topic_text, candidates, threshold=floor, quantized=False, top_k=len(candidates))
+        if threshold is not None:
+            related = [opinion for opinion in related if opinion["score"] > threshold or lexical.get(opinion["id"], 0.0) > 0]
+        best = max(lexical.values(), default=0.0) or 1.0
+        for opinion in related:
+            opinion["dense_score"] = opinion["score"]
+            opinion["lexical_score"] = lexical.get(opinion["id"], 0.0)
+            opinion["score"] = self.alpha * opinion["dense_score"] + (1.0 - self.alpha) * opinion["lexical_score"] / best
+        related.sort(key=lambda opinion: -opinion["score"])
+        return related[:self.top_k]
+    
+    def _rank(self, topic_text, opinions, threshold, quantized, use_index=False, clustered=False, top_k=None):
+        opinions_texts = opinions["text"].tolist()
+        opinion_ids = opinions["id"].tolist()
+        _, scores, idxs = self.embedding_processor.search_related_opinions(
+            topic_text, opinion_ids, opinions_texts, top_k=top_k or self.top_k, threshold=threshold,
+            quantized=quantized, use_index=use_index, clustered=clustered
+        )
+        
+        related = []
+        for idx, score in zip(idxs, scores):
+            opinion = opinions.iloc[idx].to_dict()
+            opinion["score"] = score
+            related.append(opinion)
+        return related
+    
+    @telemetry.traced("analysis.classify")
+    def classify(self, opinions):
+        """Classify opinions, reusing the stored `type` and back-filling it for new answers"""
+        opinion_types = [opinion.get("type") if opinion.get("type") in VALID_CATEGORIES else None
+                         for opinion in opinions]
+        missing = [i for i, opinion_type in enumerate(opinion_types) if opinion_type is None]
+        if not missing:
+            return opinion_types
+        
+        # The client's classification cache covers texts that were classified elsewhere
+        new_types = self.gemini_api.classify_opinions([opinions[i]["text"] for i in missing])
+        for i, opinion_type in zip(missing, new_types):
+            opinion_types[i] = opinion_type
+            opinion = opinions[i]
+            opinion["type"] = opinion_type
+            self.data_processor.update_opinion_metadata(
+                opinion["id"], opinion.get("topic_id"), opinion_type, opinion.get("effectiveness")
+            )
+        return opinion_types
+    
+    @telemetry.traced("analysis.conclude")
+    def conclude(self, topic_text, opinions, opinion_types, topic_id=None, persist=False):
+        """Generate a conclusion from the classified opinions, reusing a cached one when nothing changed.
+
+        With `persist`, the conclusion is also stored for `topic_id` via DataProcessor.add_conclusion.
+        """
+        fingerprint = conclusion_fingerprint(
+            topic_text, [opinion["id"] for opinion in opinions], opinion_types,
+            self.gemini_api.model_name, CONCLUSION_PROMPT_VERSION
+        )
+        conclusion = self.conclusion_cache.get(fingerprint) if self.conclusion_cache is not None else None
+        telemetry.incr("cache_requests_total", cache="conclusion", outcome="miss" if conclusion is None else "hit")
+        if conclusion is None:
+            opinions_with_types = [(opinion["text"], opinion_type) for opinion, opinion_type in zip(opinions, opinion_types)]
+            conclusion = self.gemini_api.generate_conclusion(topic_text, opinions_with_types)
+            if self.conclusion_cache is not None:
+                self.conclusion_cache.put(fingerprint, conclusion)
+        
+        if persist and topic_id is not None:
+            existing = self.data_processor.get_conclusion_by_topic_id(topic_id)
+            if conclusion not in existing["text"].tolist():
+                self.data_processor.add_conclusion(topic_id, conclusion, conclusion_type="Generated Conclusion")
+        return conclusion
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+from src.analysis import TopicAnalyzer
+from src.table_log import TableLog
+from src.vector_index import normalize, top_k_scores
+
+class BatchAnalyzer:
+    """Headless analysis of every topic: retrieve, classify, conclude and store the conclusion.
+
+    Topic texts are embedded in bulk, topics are processed by a pool of workers
+    sharing the Gemini client's rate limiter, and every finished topic is
+    appended to a checkpoint log so an interrupted run resumes where it stopped.
+    """
+    def __init__(self, data_processor, embedding_processor, gemini_api, checkpoint_path=None,
+                 workers=4, chunk_size=256, top_k=7, threshold=0.85, conclusion_cache=None, duplicate_detector=None):
+        self.data_processor = data_processor
+        self.embedding_processor = embedding_processor
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.analyzer = TopicAnalyzer(
+            data_processor, embedding_processor, gemini_api,
+            top_k=top_k, threshold=threshold, conclusion_cache=conclusion_cache,
+            duplicate_detector=duplicate_detector
+        )
+        self.checkpoint = TableLog(
+            checkpoint_path or os.path.join(data_processor.data_path, "batch_checkpoint.log"), fsync_every=1
+        )
+        self._checkpoint_lock = threading.Lock()
+    
+    def completed_topics(self):
+        """Ids of the topic rows already finished by earlier runs.
+
+        Rows are keyed by `id`, since several rows of topics.csv share a `topic_id`.
+        """
+        return {str(record["id"]) for record in self.checkpoint.replay() if "id" in record}
+    
+    def _analyze_topic(self, topic, topic_embedding, opinions, opinion_embeddings):
+        scores = opinion_embeddings @ topic_embedding
+        best = top_k_scores(scores, self.analyzer.top_k, self.analyzer.threshold)
+        related = []
+        for idx in best:
+            opinion = opinions.iloc[idx].to_dict()
+            opinion["score"] = float(scores[idx])
+            related.append(opinion)
+        
+        conclusion = None
+        if related:
+            opinion_types = self.analyzer.classify(related)
+            conclusion = self.analyzer.conclude(
+                topic["text"], related, opinion_types, topic_id=topic["topic_id"], persist=True
+            )
+        
+        with self._checkpoint_lock:
+            self.checkpoint.append({"id": str(topic["id"]), "topic_id": topic["topic_id"], "opinions": len(related),
+                                    "concluded": conclusion is not None})
+        return conclusion is not None
+    
+    def run(self, limit=None, reset=False):
+        """Analyze every unfinished topic; returns a summary dict"""
+        if reset:
+            self.checkpoint.truncate()
+        done = self.completed_topics()
+        
+        topics = self.data_processor.topics
+        pending = topics[~topics["id"].astype(str).isin(done)]
+        if limit is not None:
+            pending = pending.head(limit)
+        print(f"{len(done)} topics already done, {len(pending)} to analyze.")
+        
+        # Opinion embeddings come from the persistent store, so only new opinions are encoded
+        opinions = self.analyzer.unique_opinions(self.data_processor.opinions)
+        if opinions.empty:
+            print("No opinions in the dataset. Add some opinions first.")
+            return {"processed": 0, "concluded": 0, "skipped": len(done), "seconds": 0.0}
+        opinion_embeddings = self.embedding_processor.embed_opinions(opinions["id"].tolist(), opinions["text"].tolist())
+        
+        start = time.monotonic()
+        processed = 0
+        concluded = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for chunk_start in range(0, len(pending), self.chunk_size):
+                chunk = pending.iloc[chunk_start:chunk_start + self.chunk_size]
+                records = chunk.to_dict("records")
+                
+                # One bulk encode per chunk keeps memory bounded on large topic sets
+                topic_embeddings = normalize(self.embedding_processor.encode_texts([str(t["text"]) for t in records]))
+                
+                futures = [
+                    executor.submit(self._analyze_topic, topic, embedding, opinions, opinion_embeddings)
+                    for topic, embedding in zip(records, topic_embeddings)
+                ]
+                
+                for future in futures:
+                    try:
+                        concluded += bool(future.result())
+                    except Exception as e:
+                        # Leave the topic out of the checkpoint so the next run retries it
+                        print(f"Topic analysis failed: {e}")
+                processed += len(records)
+                
+                elapsed = time.monotonic() - start
+                print(f"{processed}/{len(pending)} topics, {concluded} conclusions, {processed / max(elapsed, 1e-9):.2f} topics/s")
+        
+        self.data_processor.flush()
+        self.checkpoint.close()
+        return {"processed": processed, "concluded": concluded, "skipped": len(done),
+                "seconds": time.monotonic() - start}
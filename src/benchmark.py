@@ -0,0 +1,220 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from src.analysis import TopicAnalyzer
+from src.cache import ClassificationCache, ConclusionCache
+from src.data_processor import DataProcessor
+from src.embedding import EmbeddingProcessor
+from src.fakes import FakeEmbeddingModel, FakeGenerativeModel
+from src.gemini_api import GeminiAPI
+from src.rate_limiter import TokenBucket
+
+STAGES = (
+    "data.load", "data.insert_one", "data.insert_many", "data.lookup_topic", "data.existing_ids",
+    "embed.encode_bulk", "embed.encode_query", "embed.sync_warm",
+    "retrieve.exact", "retrieve.ivf", "retrieve.int8",
+    "analysis.flow",
+)
+
+def scaled_corpus(source_path, scale=1, seed=0):
+    """Topics and opinions built from the shipped topics.csv and conclusions.csv.
+
+    Topics come from topics.csv; opinions are the conclusions plus the topic
+    texts, as the repo ships no opinions.csv. With scale > 1 every row is
+    repeated with suffixed ids (topics' `id` and `topic_id`) and one extra word,
+    so copies stay unique and embed differently.
+    """
+    topics = pd.read_csv(os.path.join(source_path, "topics.csv"), dtype=str)
+    conclusions = pd.read_csv(os.path.join(source_path, "conclusions.csv"), dtype=str)
+    opinions = pd.concat([conclusions, topics.assign(type=None, effectiveness=None)], ignore_index=True)
+    opinions = opinions.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+    
+    def scale_up(df, id_columns):
+        if scale <= 1:
+            return df
+        copies = []
+        for copy in range(scale):
+            part = df.copy()
+            if copy:
+                for column in id_columns:
+                    part[column] = part[column] + f"-{copy}"
+                part["text"] = part["text"] + f" variant{copy}"
+            copies.append(part)
+        return pd.concat(copies, ignore_index=True)
+    
+    return scale_up(topics, ("id", "topic_id")), scale_up(opinions, ("id",))
+
+def _timed(fn, repeat=1):
+    """Run fn `repeat` times; returns (last result, per-call seconds)"""
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    return result, latencies
+
+def _summary(latencies, items=1):
+    """Timing summary for one stage; `items` is the work done per call"""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    total = float(latencies.sum())
+    return {
+        "calls": int(len(latencies)),
+        "items": int(items * len(latencies)),
+        "seconds": total,
+        "per_item_ms": 1000.0 * total / max(items * len(latencies), 1),
+        "p50_ms": 1000.0 * float(np.percentile(latencies, 50)),
+        "p95_ms": 1000.0 * float(np.percentile(latencies, 95)),
+    }
+
+def run_suite(source_path="data", scale=1, backend="csv", queries=50, seed=0):
+    """Run every stage once against a fresh copy of the corpus; returns {stage: summary}"""
+    rng = np.random.default_rng(seed)
+    topics, opinions = scaled_corpus(source_path, scale=scale, seed=seed)
+    work_dir = tempfile.mkdtemp(prefix="digitalpulse-bench-")
+    results = {}
+    try:
+        data_path = os.path.join(work_dir, "data")
+        models_path = os.path.join(work_dir, "models")
+        os.makedirs(data_path)
+        topics.to_csv(os.path.join(data_path, "topics.csv"), index=False)
+        opinions.to_csv(os.path.join(data_path, "opinions.csv"), index=False)
+        pd.DataFrame(columns=topics.columns).to_csv(os.path.join(data_path, "conclusions.csv"), index=False)
+        
+        # DataProcessor: load, inserts and lookups
+        def load():
+            processor = DataProcessor(data_path=data_path, backend=backend)
+            processor.topics, processor.opinions
+            return processor
+        
+        data_processor, latencies = _timed(load)
+        results["data.load"] = _summary(latencies, items=len(topics) + len(opinions))
+        
+        new_texts = [f"benchmark opinion number {i} about public transport" for i in range(200)]
+        _, latencies = _timed(lambda: data_processor.add_opinion(new_texts[0]), repeat=50)
+        results["data.insert_one"] = _summary(latencies)
+        _, latencies = _timed(lambda: data_processor.add_opinions([{"text": text} for text in new_texts], notify=False), repeat=5)
+        results["data.insert_many"] = _summary(latencies, items=len(new_texts))
+        data_processor.flush()
+        
+        sample_topics = topics.iloc[rng.choice(len(topics), min(queries, len(topics)), replace=False)]
+        topic_ids = iter(np.tile(sample_topics["topic_id"].to_numpy(), 2))
+        _, latencies = _timed(lambda: data_processor.get_opinions_by_topic_id(next(topic_ids)), repeat=len(sample_topics))
+        results["data.lookup_topic"] = _summary(latencies)
+        probe_ids = opinions["id"].sample(min(1000, len(opinions)), random_state=seed).tolist()
+        _, latencies = _timed(lambda: data_processor.existing_opinion_ids(probe_ids), repeat=10)
+        results["data.existing_ids"] = _summary(latencies, items=len(probe_ids))
+        
+        # EmbeddingProcessor: bulk encode into a cold store, query encoding, warm sync
+        embedding_processor = EmbeddingProcessor(model_name="fake-hash-384", cache_dir=models_path,
+                                                 model=FakeEmbeddingModel())
+        stored = data_processor.opinions
+        opinion_ids = stored["id"].tolist()
+        opinion_texts = stored["text"].tolist()
+        _, latencies = _timed(lambda: embedding_processor.embed_opinions(opinion_ids, opinion_texts))
+        results["embed.encode_bulk"] = _summary(latencies, items=len(opinion_ids))
+        query_texts = iter(np.tile(sample_topics["text"].to_numpy(), 2))
+        _, latencies = _timed(lambda: embedding_processor.encode_query(next(query_texts)), repeat=len(sample_topics))
+        results["embed.encode_query"] = _summary(latencies)
+        _, latencies = _timed(lambda: embedding_processor.embed_opinions(opinion_ids, opinion_texts))
+        results["embed.sync_warm"] = _summary(latencies, items=len(opinion_ids))
+        
+        # Retrieval over the whole corpus: exact, IVF and int8 with rescoring
+        embedding_processor.build_index(opinion_ids, opinion_texts)
+        embedding_processor.build_quantized_index(opinion_ids, opinion_texts, mode="int8")
+        for stage, options in (("retrieve.exact", {}), ("retrieve.ivf", {"use_index": True}),
+                               ("retrieve.int8", {"quantized": True})):
+            query_texts = iter(np.tile(sample_topics["text"].to_numpy(), 2))
+            _, latencies = _timed(lambda: embedding_processor.search_related_opinions(
+                next(query_texts), opinion_ids, opinion_texts, top_k=7, threshold=0.0, **options
+            ), repeat=len(sample_topics))
+            results[stage] = _summary(latencies)
+        
+        # Full topic analysis flow as in main.py on the exact path, with a zero-latency, unthrottled fake Gemini
+        embedding_processor.quantized_index = None
+        embedding_processor.ann_index = None
+        gemini_api = GeminiAPI(None, model=FakeGenerativeModel(latency=0.0), rate_limiter=TokenBucket(rate=1e9, capacity=10**9),
+                               cache=ClassificationCache(os.path.join(models_path, "classification_cache.db")))
+        analyzer = TopicAnalyzer(data_processor, embedding_processor, gemini_api, threshold=0.0,
+                                 conclusion_cache=ConclusionCache(os.path.join(models_path, "conclusion_cache.db")))
+        topic_rows = iter(sample_topics.to_dict("records"))
+        
+        def analyze():
+            topic = next(topic_rows)
+            related = analyzer.related_opinions(topic["text"])
+            types = analyzer.classify(related)
+            return analyzer.conclude(topic["text"], related, types)
+        
+        _, latencies = _timed(analyze, repeat=len(sample_topics))
+        results["analysis.flow"] = _summary(latencies)
+        data_processor.flush()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_benchmarks(source_path="data", scale=1, backend="csv", queries=50, repeat=3, seed=0):
+    """Best-of-`repeat` results for every stage, with the run parameters, as a JSON-ready dict"""
+    runs = [run_suite(source_path, scale=scale, backend=backend, queries=queries, seed=seed) for _ in range(repeat)]
+    results = {}
+    for stage in STAGES:
+        # The fastest run is the least disturbed by other load on the machine
+        results[stage] = min((run[stage] for run in runs if stage in run), key=lambda r: r["p50_ms"])
+    return {
+        "meta": {
+            "scale": scale, "backend": backend, "queries": queries, "repeat": repeat, "seed": seed,
+            "commit": _git_commit(), "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+def save_results(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def compare_results(baseline, current, tolerance=0.2):
+    """Per-stage ratio of current to baseline median call time; ratios above 1 + tolerance are regressions.
+
+    Medians keep a single slow call (an fsync, a GC pause) from flagging a stage.
+    """
+    rows = []
+    for stage in STAGES:
+        before = baseline["results"].get(stage)
+        after = current["results"].get(stage)
+        if before is None or after is None:
+            continue
+        ratio = after["p50_ms"] / max(before["p50_ms"], 1e-9)
+        rows.append({"stage": stage, "baseline_ms": before["p50_ms"], "current_ms": after["p50_ms"],
+                     "ratio": ratio, "regression": ratio > 1.0 + tolerance})
+    return rows
+
+def format_results(results):
+    lines = [f"{'stage':<22} {'items':>9} {'ms/item':>10} {'p50 ms':>9} {'p95 ms':>9}"]
+    for stage, r in results["results"].items():
+        lines.append(f"{stage:<22} {r['items']:>9} {r['per_item_ms']:>10.4f} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f}")
+    return "\n".join(lines)
+
+def format_comparison(rows):
+    lines = [f"{'stage':<22} {'base p50':>10} {'p50 ms':>10} {'ratio':>7}"]
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(f"{row['stage']:<22} {row['baseline_ms']:>10.4f} {row['current_ms']:>10.4f} {row['ratio']:>7.2f}{flag}")
+    return "\n".join(lines)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+def text_hash(text):
+    """Stable hash of a text used in cache keys"""
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()
+
+class ClassificationCache:
+    """Persistent opinion classification cache keyed by (model name, prompt version, text hash).
+
+    Entries live in a small SQLite file so they survive restarts; once the cache
+    holds more than `max_entries` rows the least recently used ones are evicted.
+    """
+    def __init__(self, path=os.path.join("models", "classification_cache.db"), max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        
+        # Create cache directory if it doesn't exist
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            "model_name TEXT, prompt_version TEXT, text_hash TEXT, category TEXT, last_used REAL, "
+            "PRIMARY KEY (model_name, prompt_version, text_hash))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS classifications_last_used ON classifications (last_used)")
+        self.conn.commit()
+    
+    def get_many(self, model_name, prompt_version, texts):
+        """Return {text: category} for every text that is cached"""
+        hashes = {text_hash(text): text for text in texts}
+        found = {}
+        with self._lock:
+            keys = list(hashes)
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.conn.execute(
+                    "SELECT text_hash, category FROM classifications WHERE model_name = ? AND prompt_version = ? "
+                    f"AND text_hash IN ({', '.join('?' * len(chunk))})",
+                    [model_name, prompt_version] + chunk,
+                ).fetchall()
+                for hashed, category in rows:
+                    found[hashes[hashed]] = category
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE classifications SET last_used = ? WHERE model_name = ? AND prompt_version = ? AND text_hash = ?",
+                    [(now, model_name, prompt_version, text_hash(text)) for text in found],
+                )
+                self.conn.commit()
+        return found
+    
+    def put_many(self, model_name, prompt_version, texts, categories):
+        """Store categories for texts, evicting the least recently used entries if over capacity"""
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?)",
+                [(model_name, prompt_version, text_hash(text), category, now)
+                 for text, category in zip(texts, categories) if category],
+            )
+            self._evict()
+            self.conn.commit()
+    
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM classifications WHERE rowid IN "
+                "(SELECT rowid FROM classifications ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+    
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+
+def conclusion_fingerprint(topic_text, opinion_ids, opinion_types, model_name, prompt_version):
+    """Fingerprint of everything a generated conclusion depends on"""
+    payload = json.dumps(
+        [str(topic_text), [str(opinion_id) for opinion_id in opinion_ids], list(opinion_types), model_name, prompt_version]
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+class ConclusionCache:
+    """Generated conclusions keyed by a fingerprint of topic, ordered opinions/types and prompt/model.
+
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted beyond `max_entries`. Shares the SQLite file layout of ClassificationCache.
+    """
+    def __init__(self, path=os.path.join("models", "conclusion_cache.db"), max_entries=10000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        
+        # Create cache directory if it doesn't exist
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conclusions ("
+            "fingerprint TEXT PRIMARY KEY, conclusion TEXT, created REAL, last_used REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS conclusions_last_used ON conclusions (last_used)")
+        self.conn.commit()
+    
+    def get(self, fingerprint):
+        """Return the cached conclusion, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT conclusion, created FROM conclusions WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM conclusions WHERE fingerprint = ?", (fingerprint,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE conclusions SET last_used = ? WHERE fingerprint = ?", (now, fingerprint))
+            self.conn.commit()
+            return row[0]
+    
+    def put(self, fingerprint, conclusion):
+        now = time.time()
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO conclusions VALUES (?, ?, ?, ?)", (fingerprint, conclusion, now, now))
+            count = self.conn.execute("SELECT COUNT(*) FROM conclusions").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM conclusions WHERE rowid IN "
+                    "(SELECT rowid FROM conclusions ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self.conn.commit()
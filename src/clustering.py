@@ -0,0 +1,246 @@
+import atexit
+import json
+import os
+import threading
+import time
+import numpy as np
+from src.table_log import TableLog
+from src.vector_index import kmeans, normalize, top_k_scores
+
+class OpinionClusterer:
+    """Incremental spherical mini-batch k-means over opinion embeddings.
+
+    Each new opinion joins its nearest centroid, which moves towards it with a
+    per-cluster learning rate of 1 / size. An opinion farther than
+    `spawn_threshold` (cosine) from every centroid starts a new cluster, so new
+    subjects show up as new clusters that can be offered as candidate topics.
+    Centroids, per-cluster stats and the spawn settings are saved to
+    `clusters.npz` (saved settings win over the constructor's on load);
+    membership is an append-only log (`membership.log`) replayed on load.
+    """
+    def __init__(self, cluster_dir, spawn_threshold=0.55, max_clusters=4096, save_every=100):
+        self.cluster_dir = cluster_dir
+        self.spawn_threshold = spawn_threshold
+        self.max_clusters = max_clusters
+        self.save_every = save_every
+        self.centroids_path = os.path.join(cluster_dir, "clusters.npz")
+        self.membership = TableLog(os.path.join(cluster_dir, "membership.log"))
+        self._lock = threading.RLock()
+        self._dirty = 0
+        
+        self.centroids = None
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sim_sums = np.zeros(0, dtype=np.float64)
+        self.created = []          # cluster -> creation time
+        self.representatives = []  # cluster -> id of the member closest to the centroid when it joined
+        self.rep_scores = []
+        self.topic_ids = []        # cluster -> topic created from it, if any
+        self.assignments = {}      # opinion id -> cluster
+        self.members = {}          # cluster -> set of opinion ids
+        
+        os.makedirs(cluster_dir, exist_ok=True)
+        self._load()
+        atexit.register(self._save_if_dirty)
+    
+    def __len__(self):
+        return 0 if self.centroids is None else len(self.centroids)
+    
+    @classmethod
+    def exists(cls, cluster_dir):
+        return os.path.exists(os.path.join(cluster_dir, "clusters.npz"))
+    
+    def _load(self):
+        if not os.path.exists(self.centroids_path):
+            return
+        with np.load(self.centroids_path) as data:
+            self.centroids = data["centroids"]
+            self.counts = data["counts"]
+            self.sim_sums = data["sim_sums"]
+            params = json.loads(str(data["params"]))
+        self.created = params["created"]
+        self.representatives = params["representatives"]
+        self.rep_scores = params["rep_scores"]
+        self.topic_ids = params["topic_ids"]
+        self.spawn_threshold = params.get("spawn_threshold", self.spawn_threshold)
+        self.max_clusters = params.get("max_clusters", self.max_clusters)
+        for record in self.membership.replay():
+            self._set_member(record["id"], record["cluster"])
+    
+    def save(self):
+        """Write centroids and cluster stats; membership is already in the log"""
+        with self._lock:
+            if self.centroids is None:
+                return
+            params = {"created": self.created, "representatives": self.representatives,
+                      "rep_scores": self.rep_scores, "topic_ids": self.topic_ids,
+                      "spawn_threshold": self.spawn_threshold, "max_clusters": self.max_clusters}
+            tmp_path = self.centroids_path + ".tmp.npz"
+            np.savez(tmp_path, centroids=self.centroids, counts=self.counts, sim_sums=self.sim_sums,
+                     params=np.array(json.dumps(params)))
+            os.replace(tmp_path, self.centroids_path)
+            self.membership.sync()
+            self._dirty = 0
+    
+    def _save_if_dirty(self):
+        # Only unsaved incremental updates are written at exit, so a stale instance never
+        # overwrites clusters saved since
+        if self._dirty:
+            self.save()
+    
+    def _set_member(self, opinion_id, cluster):
+        previous = self.assignments.get(opinion_id)
+        if previous is not None:
+            self.members.get(previous, set()).discard(opinion_id)
+        self.assignments[opinion_id] = cluster
+        self.members.setdefault(cluster, set()).add(opinion_id)
+    
+    def _new_cluster(self, opinion_id, vector):
+        self.centroids = vector[None, :].copy() if self.centroids is None else np.vstack([self.centroids, vector])
+        self.counts = np.append(self.counts, 0)
+        self.sim_sums = np.append(self.sim_sums, 0.0)
+        self.created.append(time.time())
+        self.representatives.append(opinion_id)
+        self.rep_scores.append(1.0)
+        self.topic_ids.append(None)
+        return len(self.centroids) - 1
+    
+    def build(self, opinion_ids, vectors, n_clusters=None, sample_size=20000, chunk_size=65536, seed=0):
+        """Initial clustering of an existing corpus: k-means on a sample, then assign everything"""
+        opinion_ids = list(opinion_ids)
+        with self._lock:
+            self.membership.truncate()
+            self.centroids = None
+            self.counts = np.zeros(0, dtype=np.int64)
+            self.sim_sums = np.zeros(0, dtype=np.float64)
+            self.created, self.representatives, self.rep_scores, self.topic_ids = [], [], [], []
+            self.assignments, self.members = {}, {}
+            if not opinion_ids:
+                return self
+            
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(len(opinion_ids), min(sample_size, len(opinion_ids)), replace=False))
+            n_clusters = n_clusters or max(1, int(np.sqrt(len(opinion_ids))))
+            self.centroids, _ = kmeans(vectors[sample], n_clusters, seed=seed)
+            k = len(self.centroids)
+            self.counts = np.zeros(k, dtype=np.int64)
+            self.sim_sums = np.zeros(k, dtype=np.float64)
+            self.created = [time.time()] * k
+            self.representatives = [None] * k
+            self.rep_scores = [-1.0] * k
+            self.topic_ids = [None] * k
+            
+            # Assign in chunks so a memory-mapped matrix is never fully copied
+            for start in range(0, len(opinion_ids), chunk_size):
+                chunk_ids = opinion_ids[start:start + chunk_size]
+                sims = normalize(vectors[start:start + chunk_size]) @ self.centroids.T
+                best = np.argmax(sims, axis=1)
+                scores = sims[np.arange(len(best)), best]
+                np.add.at(self.counts, best, 1)
+                np.add.at(self.sim_sums, best, scores)
+                for opinion_id, cluster, score in zip(chunk_ids, best.tolist(), scores.tolist()):
+                    self._set_member(opinion_id, cluster)
+                    if score > self.rep_scores[cluster]:
+                        self.representatives[cluster] = opinion_id
+                        self.rep_scores[cluster] = score
+                self.membership.append_many([{"id": opinion_id, "cluster": cluster}
+                                             for opinion_id, cluster in zip(chunk_ids, best.tolist())])
+            self.save()
+        return self
+    
+    def partial_fit(self, opinion_ids, vectors):
+        """Assign new or changed opinions and move their centroids (one mini-batch step)"""
+        vectors = normalize(vectors)
+        records = []
+        with self._lock:
+            for opinion_id, vector in zip(opinion_ids, vectors):
+                if self.centroids is None:
+                    cluster, score = self._new_cluster(opinion_id, vector), 1.0
+                else:
+                    sims = self.centroids @ vector
+                    cluster = int(np.argmax(sims))
+                    score = float(sims[cluster])
+                    if score < self.spawn_threshold and len(self.centroids) < self.max_clusters:
+                        cluster, score = self._new_cluster(opinion_id, vector), 1.0
+                
+                # A re-embedded opinion leaves its old cluster
+                previous = self.assignments.get(opinion_id)
+                if previous is not None and self.counts[previous] > 0:
+                    self.counts[previous] -= 1
+                
+                # Per-cluster learning rate 1 / n keeps each centroid the running mean of its members
+                self.counts[cluster] += 1
+                self.sim_sums[cluster] += score
+                eta = 1.0 / self.counts[cluster]
+                self.centroids[cluster] = normalize((1.0 - eta) * self.centroids[cluster] + eta * vector)
+                if score > self.rep_scores[cluster]:
+                    self.representatives[cluster] = opinion_id
+                    self.rep_scores[cluster] = score
+                self._set_member(opinion_id, cluster)
+                records.append({"id": opinion_id, "cluster": cluster})
+            
+            self.membership.append_many(records)
+            self._dirty += len(records)
+            if self._dirty >= self.save_every:
+                self.save()
+        return [record["cluster"] for record in records]
+    
+    def nearest_clusters(self, query, n_probe=8):
+        with self._lock:
+            if self.centroids is None:
+                return np.zeros(0, dtype=np.int64)
+            return top_k_scores(self.centroids @ normalize(query), n_probe)
+    
+    def candidates(self, query, n_probe=8):
+        """Ids of the members of the `n_probe` clusters nearest to the query"""
+        with self._lock:
+            ids = []
+            for cluster in self.nearest_clusters(query, n_probe).tolist():
+                ids.extend(self.members.get(cluster, ()))
+            return ids
+    
+    def stats(self):
+        """Per-cluster size, cohesion (mean member similarity when joining), representative and topic"""
+        with self._lock:
+            return [{
+                "cluster": cluster,
+                "size": len(self.members.get(cluster, ())),
+                "cohesion": float(self.sim_sums[cluster] / self.counts[cluster]) if self.counts[cluster] else 0.0,
+                "representative_id": self.representatives[cluster],
+                "topic_id": self.topic_ids[cluster],
+                "created": self.created[cluster],
+            } for cluster in range(len(self))]
+    
+    def candidate_topics(self, data_processor, min_size=5, limit=10):
+        """Clusters without a topic whose members are mostly unassigned, largest first"""
+        clusters = [row for row in self.stats() if row["topic_id"] is None and row["size"] >= min_size]
+        if not clusters:
+            return []
+        opinions = data_processor.opinions.set_index("id")
+        candidates = []
+        for row in clusters:
+            members = [opinion_id for opinion_id in self.members.get(row["cluster"], ()) if opinion_id in opinions.index]
+            unassigned = int(opinions.loc[members, "topic_id"].isna().sum()) if members else 0
+            if unassigned * 2 < max(len(members), 1) or row["representative_id"] not in opinions.index:
+                continue
+            text = opinions.loc[row["representative_id"], "text"]
+            if not isinstance(text, str):
+                text = text.iloc[0]
+            candidates.append(dict(row, unassigned=unassigned, text=text))
+        candidates.sort(key=lambda candidate: -candidate["unassigned"])
+        return candidates[:limit]
+    
+    def promote(self, cluster, data_processor, text, assign_members=True):
+        """Create a topic from a cluster via DataProcessor.add_topic; returns the topic id"""
+        topic_id = data_processor.add_topic(text)
+        with self._lock:
+            self.topic_ids[cluster] = topic_id
+            members = list(self.members.get(cluster, ()))
+            self.save()
+        
+        if assign_members and members:
+            # Only opinions that have no topic yet move to the new one
+            opinions = data_processor.opinions
+            unassigned = opinions.loc[opinions["id"].isin(members) & opinions["topic_id"].isna(), "id"]
+            # One storage write for the whole cluster; only topic_id changes, so listeners keyed on the text have nothing to do
+            data_processor.update_opinions(((opinion_id, {"topic_id": topic_id}) for opinion_id in unassigned), notify=False)
+        return topic_id
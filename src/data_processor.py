@@ -1,52 +1,92 @@
-import pandas as pd
+import atexit
 import os
+from src.storage import CSVStorage, SQLiteStorage
+from src.telemetry import telemetry
 
 class DataProcessor:
-    def __init__(self, data_path="data"):
+    def __init__(self, data_path="data", backend="csv", compact_every=1000, fsync_every=32):
         self.data_path = data_path
         self.topics_path = os.path.join(data_path, "topics.csv")
         self.opinions_path = os.path.join(data_path, "opinions.csv")
         self.conclusion_path = os.path.join(data_path, "conclusions.csv")
         
-        # Create files if they don't exist
-        self._create_files_if_not_exist()
+        # Pick the storage backend; the SQLite one is seeded from the CSVs on first use
+        with telemetry.span("data.load", backend=backend if isinstance(backend, str) else type(backend).__name__):
+            self.storage = self._open_storage(data_path, backend, compact_every, fsync_every)
         
-        # Load data
-        self.topics = self._load_data(self.topics_path)
-        self.opinions = self._load_data(self.opinions_path)
-        self.conclusions = self._load_data(self.conclusion_path)
-    
-    def _create_files_if_not_exist(self):
-        # Define columns for each CSV file
-        columns = ["id", "topic_id", "text", "type", "effectiveness"]
+        # Callbacks notified with the opinion row whenever an opinion is added or updated
+        self.opinion_listeners = []
         
-        # Create topics.csv if it doesn't exist
-        if not os.path.exists(self.topics_path):
-            df = pd.DataFrame(columns=columns)
-            df.to_csv(self.topics_path, index=False)
-        
-        # Create opinions.csv if it doesn't exist
-        if not os.path.exists(self.opinions_path):
-            df = pd.DataFrame(columns=columns)
-            df.to_csv(self.opinions_path, index=False)
-        
-        # Create conclusion.csv if it doesn't exist
-        if not os.path.exists(self.conclusion_path):
-            df = pd.DataFrame(columns=columns)
-            df.to_csv(self.conclusion_path, index=False)
-    
-    def _load_data(self, file_path):
-        try:
-            return pd.read_csv(file_path)
-        except Exception as e:
-            print(f"Error loading {file_path}: {e}")
-            return pd.DataFrame(columns=["id", "topic_id", "text", "type", "effectiveness"])
+        atexit.register(self.flush)
+    
+    def _open_storage(self, data_path, backend, compact_every, fsync_every):
+        if backend == "csv":
+            return CSVStorage(data_path, compact_every=compact_every, fsync_every=fsync_every)
+        if backend == "sqlite":
+            db_path = os.path.join(data_path, "digitalpulse.db")
+            storage = SQLiteStorage(db_path)
+            if not storage.is_imported():
+                storage.import_csv(data_path)
+            return storage
+        return backend
+    
+    @property
+    def topics(self):
+        with telemetry.span("data.read", table="topics"):
+            return self.storage.frame("topics")
+    
+    @topics.setter
+    def topics(self, df):
+        self.storage.replace("topics", df)
+    
+    @property
+    def opinions(self):
+        with telemetry.span("data.read", table="opinions"):
+            return self.storage.frame("opinions")
+    
+    @opinions.setter
+    def opinions(self, df):
+        self.storage.replace("opinions", df)
+    
+    @property
+    def conclusions(self):
+        with telemetry.span("data.read", table="conclusions"):
+            return self.storage.frame("conclusions")
+    
+    @conclusions.setter
+    def conclusions(self, df):
+        self.storage.replace("conclusions", df)
+    
+    def count(self, table):
+        """Number of rows in a table without materializing it"""
+        return self.storage.count(table)
+    
+    def existing_opinion_ids(self, opinion_ids):
+        """Which of the given opinion ids are already stored"""
+        return self.storage.existing_ids("opinions", opinion_ids)
+    
+    def add_opinion_listener(self, listener):
+        """Register a callback that receives each added or updated opinion as a dict"""
+        self.opinion_listeners.append(listener)
+    
+    def _notify_opinion_listeners(self, opinion):
+        for listener in self.opinion_listeners:
+            try:
+                listener(opinion)
+            except Exception as e:
+                print(f"Opinion listener failed for {opinion.get('id')}: {e}")
+    
+    def flush(self):
+        """Make every logged change durable"""
+        self.storage.flush()
+    
+    def compact(self, names=None):
+        """Fold logged changes back into the canonical files"""
+        self.storage.compact(names)
     
     def save_data(self):
-        """Save all dataframes to their respective CSV files"""
-        self.topics.to_csv(self.topics_path, index=False)
-        self.opinions.to_csv(self.opinions_path, index=False)
-        self.conclusions.to_csv(self.conclusion_path, index=False)
+        """Save all changed dataframes to their respective CSV files"""
+        self.compact()
     
     def add_opinion(self, text, topic_id=None, opinion_type=None, effectiveness=None):
         """Add a new opinion to the opinions dataframe"""
@@ -60,10 +100,28 @@ class DataProcessor:
             "effectiveness": effectiveness
         }
         
-        self.opinions = pd.concat([self.opinions, pd.DataFrame([new_opinion])], ignore_index=True)
-        self.save_data()
+        self.storage.insert("opinions", new_opinion)
+        self._notify_opinion_listeners(new_opinion)
         return new_opinion["id"]
     
+    def add_opinions(self, opinions, notify=True):
+        """Add several opinions (dicts with at least `text`) in one storage write; returns their ids"""
+        import uuid
+        
+        new_opinions = [{
+            "id": opinion.get("id") or uuid.uuid4().hex[:12],
+            "topic_id": opinion.get("topic_id"),
+            "text": opinion["text"],
+            "type": opinion.get("type"),
+            "effectiveness": opinion.get("effectiveness")
+        } for opinion in opinions]
+        
+        self.storage.insert_many("opinions", new_opinions)
+        if notify:
+            for new_opinion in new_opinions:
+                self._notify_opinion_listeners(new_opinion)
+        return [new_opinion["id"] for new_opinion in new_opinions]
+    
     def add_topic(self, text, topic_type="Position", effectiveness="Adequate"):
         """Add a new topic to the topics dataframe"""
         import uuid
@@ -76,8 +134,7 @@ class DataProcessor:
             "effectiveness": effectiveness
         }
         
-        self.topics = pd.concat([self.topics, pd.DataFrame([new_topic])], ignore_index=True)
-        self.save_data()
+        self.storage.insert("topics", new_topic)
         return new_topic["topic_id"]
     
     def add_conclusion(self, topic_id, text, conclusion_type="Concluding Statement", effectiveness="Adequate"):
@@ -92,29 +149,38 @@ class DataProcessor:
             "effectiveness": effectiveness
         }
         
-        self.conclusions = pd.concat([self.conclusions, pd.DataFrame([new_conclusion])], ignore_index=True)
-        self.save_data()
+        self.storage.insert("conclusions", new_conclusion)
         return new_conclusion["id"]
     
     def get_topic_by_id(self, topic_id):
         """Get a topic by its topic_id"""
-        return self.topics[self.topics["topic_id"] == topic_id]
+        return self.storage.find("topics", "topic_id", topic_id)
     
     def get_opinions_by_topic_id(self, topic_id):
         """Get all opinions for a specific topic"""
-        return self.opinions[self.opinions["topic_id"] == topic_id]
+        return self.storage.find("opinions", "topic_id", topic_id)
     
     def get_conclusion_by_topic_id(self, topic_id):
         """Get conclusion for a specific topic"""
-        return self.conclusions[self.conclusions["topic_id"] == topic_id]
+        return self.storage.find("conclusions", "topic_id", topic_id)
     
     def update_opinion_metadata(self, opinion_id, topic_id, opinion_type, effectiveness="Adequate"):
         """Update metadata for an opinion"""
-        opinion_idx = self.opinions[self.opinions["id"] == opinion_id].index
-        if len(opinion_idx) > 0:
-            self.opinions.loc[opinion_idx[0], "topic_id"] = topic_id
-            self.opinions.loc[opinion_idx[0], "type"] = opinion_type
-            self.opinions.loc[opinion_idx[0], "effectiveness"] = effectiveness
-            self.save_data()
+        fields = {"topic_id": topic_id, "type": opinion_type, "effectiveness": effectiveness}
+        opinion = self.storage.update("opinions", opinion_id, fields)
+        if opinion is not None:
+            self._notify_opinion_listeners(opinion)
             return True
-        return False
\ No newline at end of file
+        return False
+    
+    def update_opinions(self, updates, notify=True):
+        """Set fields of several opinions in one storage write.
+
+        `updates` are (opinion id, {column: value}) pairs; columns not given keep
+        their value. Returns the number of opinions updated.
+        """
+        opinions = self.storage.update_many("opinions", list(updates))
+        if notify:
+            for opinion in opinions:
+                self._notify_opinion_listeners(opinion)
+        return len(opinions)
@@ -0,0 +1,175 @@
+import os
+import re
+import sqlite3
+import threading
+import zlib
+import numpy as np
+from src.vector_index import normalize
+
+# Mersenne prime for the MinHash permutations; 31-bit hashes keep a * x + b inside uint64
+PRIME = (1 << 31) - 1
+
+def shingles(text, size=5):
+    """Character shingles of the text after lowercasing and collapsing punctuation/whitespace"""
+    text = re.sub(r"[\W_]+", " ", str(text).lower()).strip()
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+class DuplicateDetector:
+    """Near-duplicate opinion detection with MinHash signatures and LSH banding.
+
+    Every added opinion is linked to a canonical opinion: itself when it is new
+    content, or the canonical of the most similar earlier opinion whose estimated
+    Jaccard similarity reaches `threshold`. With an `embedding_processor`, a match
+    must also reach `embedding_threshold` cosine similarity when both vectors are
+    available. Signatures, LSH buckets and links live in their own SQLite file.
+    """
+    def __init__(self, path=os.path.join("data", "duplicates.db"), num_perm=128, bands=16, threshold=0.8,
+                 shingle_size=5, embedding_processor=None, embedding_threshold=0.95, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.embedding_processor = embedding_processor
+        self.embedding_threshold = embedding_threshold
+        self._lock = threading.Lock()
+        
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS opinions (id TEXT PRIMARY KEY, canonical TEXT, signature BLOB)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket INTEGER, id TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_key ON buckets (band, bucket)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS opinions_canonical ON opinions (canonical)")
+        self.conn.commit()
+        
+        # Ids linked to another opinion; retrieval skips them
+        self.duplicate_ids = {row[0] for row in self.conn.execute("SELECT id FROM opinions WHERE canonical != id")}
+    
+    def signature(self, text):
+        """MinHash signature (num_perm uint32 values) of the text's shingles"""
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) & PRIME for shingle in shingles(text, self.shingle_size)),
+            dtype=np.uint64,
+        )
+        return (((self._a[:, None] * hashes[None, :] + self._b[:, None]) % PRIME).min(axis=1)).astype(np.uint32)
+    
+    def _band_keys(self, signature):
+        return [(band, zlib.crc32(signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+                for band in range(self.bands)]
+    
+    def _candidates(self, signature, exclude):
+        """(id, canonical, estimated Jaccard) of stored opinions sharing an LSH bucket"""
+        ids = set()
+        for band, bucket in self._band_keys(signature):
+            ids.update(row[0] for row in self.conn.execute(
+                "SELECT id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)
+            ))
+        ids.discard(exclude)
+        candidates = []
+        for opinion_id in ids:
+            canonical, stored = self.conn.execute(
+                "SELECT canonical, signature FROM opinions WHERE id = ?", (opinion_id,)
+            ).fetchone()
+            similarity = float(np.mean(np.frombuffer(stored, dtype=np.uint32) == signature))
+            candidates.append((opinion_id, canonical, similarity))
+        return sorted(candidates, key=lambda candidate: -candidate[2])
+    
+    def _confirmed(self, opinion_id, text, candidate_id):
+        """Embedding check of a MinHash match; passes when the candidate has no stored vector"""
+        store = self.embedding_processor.store if self.embedding_processor is not None else None
+        if store is None or candidate_id not in store.rows:
+            return True
+        if opinion_id in store.rows:
+            query = normalize(store.get([opinion_id])[0])
+        else:
+            query = normalize(self.embedding_processor.encode_query(text))
+        candidate = normalize(store.get([candidate_id])[0])
+        return float(candidate @ query) >= self.embedding_threshold
+    
+    def _link(self, opinion_id, text, signature):
+        canonical = opinion_id
+        for candidate_id, candidate_canonical, similarity in self._candidates(signature, opinion_id):
+            if similarity < self.threshold:
+                break
+            if self._confirmed(opinion_id, text, candidate_id):
+                canonical = candidate_canonical
+                break
+        
+        self.conn.execute("INSERT OR REPLACE INTO opinions VALUES (?, ?, ?)", (opinion_id, canonical, signature.tobytes()))
+        self.conn.executemany(
+            "INSERT INTO buckets VALUES (?, ?, ?)",
+            [(band, bucket, opinion_id) for band, bucket in self._band_keys(signature)],
+        )
+        if canonical != opinion_id:
+            self.duplicate_ids.add(opinion_id)
+        return canonical
+    
+    def add_many(self, opinion_ids, texts):
+        """Link every new opinion to its canonical; returns {id: canonical id}.
+
+        Opinions are processed in order, so duplicates within one batch are found
+        too. Ids seen before keep their existing link.
+        """
+        opinion_ids = [str(opinion_id) for opinion_id in opinion_ids]
+        with self._lock:
+            known = self._canonical_of(opinion_ids)
+            result = {}
+            for opinion_id, text in zip(opinion_ids, texts):
+                if opinion_id in known:
+                    result[opinion_id] = known[opinion_id]
+                    continue
+                result[opinion_id] = known[opinion_id] = self._link(opinion_id, text, self.signature(text))
+            self.conn.commit()
+        return result
+    
+    def add(self, opinion_id, text):
+        """Link one opinion; returns its canonical id"""
+        return self.add_many([opinion_id], [text])[str(opinion_id)]
+    
+    def on_opinion_changed(self, opinion):
+        """DataProcessor listener that links every added opinion as it is stored"""
+        self.add(opinion["id"], opinion["text"])
+    
+    def _canonical_of(self, opinion_ids):
+        found = {}
+        for start in range(0, len(opinion_ids), 500):
+            chunk = opinion_ids[start:start + 500]
+            found.update(self.conn.execute(
+                f"SELECT id, canonical FROM opinions WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return found
+    
+    def canonical_of(self, opinion_ids):
+        """{id: canonical id} for the given ids that have been seen"""
+        with self._lock:
+            return self._canonical_of([str(opinion_id) for opinion_id in opinion_ids])
+    
+    def duplicates_of(self, canonical_id):
+        """Ids linked to the given canonical opinion (excluding itself)"""
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT id FROM opinions WHERE canonical = ? AND id != ?", (canonical_id, canonical_id)
+            )]
+    
+    def stats(self):
+        with self._lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM opinions").fetchone()[0]
+        return {"opinions": total, "duplicates": len(self.duplicate_ids), "unique": total - len(self.duplicate_ids)}
+    
+    def reset(self):
+        """Forget every signature and link"""
+        with self._lock:
+            self.conn.execute("DELETE FROM opinions")
+            self.conn.execute("DELETE FROM buckets")
+            self.conn.commit()
+            self.duplicate_ids = set()
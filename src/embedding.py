@@ -1,31 +1,110 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import atexit
 import numpy as np
 import os
+import threading
+from src.encoder import EncodingEngine, backend_error, check_backend, load_sentence_transformer
+from src.clustering import OpinionClusterer
+from src.embedding_store import EmbeddingStore
+from src.quantization import QuantizedIndex
+from src.telemetry import telemetry
+from src.vector_index import ExactIndex, IVFIndex, normalize, recall_at_k, top_k_scores
 
 class EmbeddingProcessor:
-    def __init__(self, model_name="all-MiniLM-L6-v2", cache_dir="models"):
+    def __init__(self, model_name="all-MiniLM-L6-v2", cache_dir="models", store_dir=None, backend="torch",
+                 onnx_file=None, tolerance=0.01, processes=0, max_batch_tokens=16384, model=None, save_every=256):
         self.model_name = model_name
         self.cache_dir = cache_dir
-        self.model = None
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.tolerance = tolerance
+        self.processes = processes
+        self.max_batch_tokens = max_batch_tokens
+        # An injected model (e.g. fakes.FakeEmbeddingModel) is used as is
+        self.model = model
+        self.engine = EncodingEngine(model, max_batch_tokens=max_batch_tokens, processes=processes) if model else None
+        self._model_lock = threading.Lock()
+        self._index_lock = threading.RLock()
+        atexit.register(self.close)
+        
+        # Incrementally updated indexes are saved every `save_every` added opinions and on close
+        self.save_every = save_every
+        self._unsaved_adds = 0
+        self._dirty_indexes = set()
         
         # Create cache directory if it doesn't exist
         os.makedirs(cache_dir, exist_ok=True)
+        
+        # Persistent opinion embeddings, invalidated (with the indexes built from them) when the model changes
+        self.store = EmbeddingStore(store_dir or os.path.join(cache_dir, "opinion_store"), model_name,
+                                    derived=("ivf_index.npz", "quantized_index.npz", "clusters"))
+        self.topic_store = EmbeddingStore(os.path.join(cache_dir, "topic_store"), model_name)
+        
+        # Optional approximate index over the store, loaded if one was saved before
+        self.index_path = os.path.join(self.store.store_dir, "ivf_index.npz")
+        self.ann_index = None
+        if os.path.exists(self.index_path) and self.store.count:
+            self.ann_index = IVFIndex.load(self.index_path)
+        
+        # Optional compact (float16/int8/binary) copy of the opinion vectors
+        self.quantized_index_path = os.path.join(self.store.store_dir, "quantized_index.npz")
+        self.quantized_index = None
+        if os.path.exists(self.quantized_index_path) and self.store.count:
+            self.quantized_index = QuantizedIndex.load(self.quantized_index_path)
+        
+        # Optional incremental opinion clusters for two-stage retrieval
+        self.cluster_dir = os.path.join(self.store.store_dir, "clusters")
+        self.clusterer = OpinionClusterer(self.cluster_dir) if OpinionClusterer.exists(self.cluster_dir) else None
+        self._row_clusters = None  # store row -> cluster (-1 if none), built on first clustered query
     
     def load_model(self):
-        """Load the sentence transformer model"""
+        """Load the sentence transformer model (once, even with concurrent callers)"""
         if self.model is None:
-            print(f"Loading model {self.model_name}...")
-            self.model = SentenceTransformer(self.model_name, cache_folder=self.cache_dir)
-            print("Model loaded.")
+            # Includes waiting for a background warm-up that is still loading
+            with telemetry.span("model.load", model=self.model_name), self._model_lock:
+                if self.model is None:
+                    backend = self.backend
+                    error = backend_error(backend)
+                    if error:
+                        print(f"Not using {backend}: {error}; using torch.")
+                        backend = "torch"
+                    print(f"Loading model {self.model_name} ({backend})...")
+                    model = load_sentence_transformer(self.model_name, self.cache_dir, backend, self.onnx_file)
+                    if backend != "torch":
+                        # Optimized backends must reproduce the reference embeddings closely enough
+                        ok, deviation = check_backend(model, self.model_name, self.cache_dir, self.backend,
+                                                      self.tolerance, self.onnx_file)
+                        if not ok:
+                            print(f"{self.backend} backend deviates by {deviation:.4f} (> {self.tolerance}), using torch.")
+                            model = load_sentence_transformer(self.model_name, self.cache_dir, "torch")
+                    self.engine = EncodingEngine(model, max_batch_tokens=self.max_batch_tokens,
+                                                 processes=self.processes)
+                    self.model = model
+                    print("Model loaded.")
         return self.model
     
-    def encode_texts(self, texts):
-        """Encode a list of texts into embeddings"""
-        model = self.load_model()
-        embeddings = model.encode(texts, show_progress_bar=True)
-        print(f"{len(embeddings)} examples, each with {embeddings.shape[1]} dimensions ready.")
-        return embeddings
+    def warm_up(self):
+        """Load the model in a background thread so the first query does not wait for it"""
+        thread = threading.Thread(target=self.load_model, daemon=True)
+        thread.start()
+        return thread
+    
+    def encode_texts(self, texts, show_progress_bar=False):
+        """Encode a list of texts into embeddings (length-bucketed batches, pool for large jobs)"""
+        self.load_model()
+        with telemetry.span("embed.encode", texts=len(texts)):
+            return self.engine.encode(texts, show_progress_bar=show_progress_bar)
+    
+    def encode_query(self, text):
+        """Low-latency encoding of a single query text"""
+        self.load_model()
+        with telemetry.span("embed.encode_query"):
+            return self.engine.encode_one(str(text))
+    
+    def close(self):
+        """Save incrementally updated indexes and stop the encoding process pool, if one was started"""
+        self.save_indexes()
+        if self.engine is not None:
+            self.engine.close()
     
     def get_related_opinions(self, topic_idx, topic_embeddings, opinion_embeddings, topics_text, opinions_text, threshold=0.85):
         """Find opinions related to a topic based on cosine similarity"""
@@ -33,34 +112,248 @@ class EmbeddingProcessor:
         topic_embedding = topic_embeddings[topic_idx]
         
         # Calculate cosine similarity between topic and all opinions
-        sims = cosine_similarity([topic_embedding], opinion_embeddings)[0]
+        sims = normalize(opinion_embeddings) @ normalize(topic_embedding)
         
         # Find indices of opinions that exceed the threshold
-        relevant_idxs = [i for i, s in enumerate(sims) if s > threshold]
+        relevant_idxs = np.flatnonzero(sims > threshold).tolist()
         
         # Get the texts of relevant opinions
         found_opinions = [opinions_text[i] for i in relevant_idxs]
         
         # Get the similarity scores
-        similarity_scores = [sims[i] for i in relevant_idxs]
+        similarity_scores = sims[relevant_idxs].tolist()
         
         # Get the topic text
         topic_text = topics_text[topic_idx]
         
         return topic_text, found_opinions, similarity_scores, relevant_idxs
     
-    def find_related_opinions(self, topic_text, opinions_texts, threshold=0.85):
-        """Find opinions related to a given topic text"""
-        # Encode the topic and opinions
-        topic_embedding = self.encode_texts([topic_text])[0]
-        opinion_embeddings = self.encode_texts(opinions_texts)
+    def embed_opinions(self, opinion_ids, opinions_texts):
+        """Get opinion embeddings from the store, encoding only new or changed texts"""
+        return self.store.sync(opinion_ids, opinions_texts, self.encode_texts)
+    
+    def embed_opinion_rows(self, opinion_ids, opinions_texts):
+        """Store embeddings for the opinions; returns the memory-mapped store vectors and each opinion's row in them"""
+        opinion_ids = list(opinion_ids)
+        self.store.upsert(opinion_ids, opinions_texts, self.encode_texts)
+        return self.store.vectors(), self.store.rows_of(opinion_ids)
+    
+    def _sync_for_query(self, opinion_ids, opinions_texts):
+        """Store embeddings for opinions not seen yet; listeners and bulk paths keep changed texts current"""
+        with telemetry.span("retrieve.sync", opinions=len(opinion_ids)):
+            self.store.add_missing(opinion_ids, opinions_texts, self.encode_texts)
+    
+    def embed_topics(self, topic_ids, topics_texts):
+        """Get topic embeddings from the topic store (keyed by topic row id), encoding only new or changed texts"""
+        return self.topic_store.sync(topic_ids, topics_texts, self.encode_texts)
+    
+    def on_opinion_changed(self, opinion):
+        """DataProcessor listener that keeps the store and index in sync with added/updated opinions"""
+        if self.store.upsert([opinion["id"]], [opinion["text"]], self.encode_texts):
+            with self._index_lock:
+                if self.ann_index is not None:
+                    self.ann_index.add([opinion["id"]], self.store.get([opinion["id"]]))
+                    self._mark_unsaved("ann_index")
+                if self.quantized_index is not None:
+                    self.quantized_index.add([opinion["id"]], self.store.get([opinion["id"]]))
+                    self._mark_unsaved("quantized_index")
+            if self.clusterer is not None:
+                clusters = self.clusterer.partial_fit([opinion["id"]], self.store.get([opinion["id"]]))
+                self._set_row_clusters([opinion["id"]], clusters)
+    
+    def _mark_unsaved(self, name, count=1):
+        """Record `count` opinions added to the named index, saving the indexes every `save_every` adds"""
+        with self._index_lock:
+            self._dirty_indexes.add(name)
+            self._unsaved_adds += count
+            if self._unsaved_adds >= self.save_every:
+                self.save_indexes()
+    
+    def save_indexes(self):
+        """Save the indexes changed since their last save (an index is a full .npz rewrite)"""
+        paths = {"ann_index": self.index_path, "quantized_index": self.quantized_index_path}
+        with self._index_lock:
+            for name in self._dirty_indexes:
+                index = getattr(self, name)
+                if index is not None:
+                    index.save(paths[name])
+            self._dirty_indexes = set()
+            self._unsaved_adds = 0
+    
+    def _add_missing_to_index(self, index, opinion_ids, name):
+        """Add stored opinions that an index has not seen yet (e.g. after a bulk ingest)"""
+        missing = [opinion_id for opinion_id in opinion_ids if opinion_id not in index.positions]
+        if missing:
+            with self._index_lock:
+                index.add(missing, self.store.get(missing))
+                self._mark_unsaved(name, len(missing))
+    
+    @staticmethod
+    def _index_mask(index, opinion_ids):
+        """Boolean mask of the index positions holding `opinion_ids`; None when they cover the whole index"""
+        positions = np.fromiter((index.positions.get(opinion_id, -1) for opinion_id in opinion_ids),
+                                dtype=np.int64, count=len(opinion_ids))
+        mask = np.zeros(len(index), dtype=bool)
+        mask[positions[positions >= 0]] = True
+        return None if mask.all() else mask
+    
+    def build_index(self, opinion_ids, opinions_texts, n_lists=None, n_probe=8):
+        """Build and save the approximate (IVF) index over the given opinions"""
+        embeddings = self.embed_opinions(opinion_ids, opinions_texts)
+        with self._index_lock:
+            self.ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe).build(opinion_ids, embeddings)
+            self.ann_index.save(self.index_path)
+            self._dirty_indexes.discard("ann_index")
+        return self.ann_index
+    
+    def build_quantized_index(self, opinion_ids, opinions_texts, mode="int8", rescore_factor=10):
+        """Build and save a compact float16/int8/binary index over the given opinions"""
+        self.store.upsert(opinion_ids, opinions_texts, self.encode_texts)
+        vectors = self.store.vectors()
+        row_ids = self.store.row_ids[:len(vectors)]
+        with self._index_lock:
+            self.quantized_index = QuantizedIndex(mode, rescore_factor=rescore_factor).build(row_ids, vectors)
+            self.quantized_index.save(self.quantized_index_path)
+            self._dirty_indexes.discard("quantized_index")
+        return self.quantized_index
+    
+    def build_clusters(self, opinion_ids, opinions_texts, n_clusters=None, spawn_threshold=0.55):
+        """Cluster the given opinions from scratch; new opinions then join incrementally"""
+        self.store.upsert(opinion_ids, opinions_texts, self.encode_texts)
+        vectors = self.store.vectors()
+        row_ids = self.store.row_ids[:len(vectors)]
+        # Rebuild the existing clusterer in place; a second instance would share its files
+        if self.clusterer is None:
+            self.clusterer = OpinionClusterer(self.cluster_dir, spawn_threshold=spawn_threshold)
+        self.clusterer.spawn_threshold = spawn_threshold
+        self.clusterer.build(row_ids, vectors, n_clusters=n_clusters)
+        with self._index_lock:
+            self._row_clusters = None
+        return self.clusterer
+    
+    def _set_row_clusters(self, opinion_ids, clusters):
+        """Record the clusters of re-assigned opinions in the row -> cluster map, if it is built"""
+        with self._index_lock:
+            if self._row_clusters is None:
+                return
+            rows = self.store.rows_of(opinion_ids)
+            if len(rows) and rows.max() >= len(self._row_clusters):
+                grown = np.full(max(rows.max() + 1, 2 * len(self._row_clusters)), -1, dtype=np.int64)
+                grown[:len(self._row_clusters)] = self._row_clusters
+                self._row_clusters = grown
+            self._row_clusters[rows] = clusters
+    
+    def _row_cluster_map(self):
+        """Cluster of every store row (-1 if not clustered); rebuilt from the clusterer only after loading or a rebuild"""
+        with self._index_lock:
+            if self._row_clusters is None:
+                row_clusters = np.full(self.store.count, -1, dtype=np.int64)
+                for opinion_id, cluster in self.clusterer.assignments.items():
+                    row = self.store.rows.get(opinion_id)
+                    if row is not None:
+                        row_clusters[row] = cluster
+                self._row_clusters = row_clusters
+            return self._row_clusters
+    
+    def _cluster_positions(self, topic_embedding, opinion_ids, n_probe):
+        """Positions in opinion_ids of the members of the clusters nearest to the topic"""
+        probe = self.clusterer.nearest_clusters(topic_embedding, n_probe)
+        # Vectorized over store rows; rows added after the map was built count as not clustered
+        rows = self.store.rows_of(opinion_ids)
+        row_clusters = self._row_cluster_map()
+        clusters = np.full(len(rows), -1, dtype=np.int64)
+        known = rows < len(row_clusters)
+        clusters[known] = row_clusters[rows[known]]
+        # Opinions not clustered yet are always scored, so nothing new is missed
+        return np.flatnonzero(np.isin(clusters, probe) | (clusters < 0))
+    
+    def index_recall(self, query_texts, opinion_ids, opinions_texts, top_k=7):
+        """Recall@k of the approximate index against the exact path for the given queries"""
+        exact = ExactIndex().build(opinion_ids, self.embed_opinions(opinion_ids, opinions_texts))
+        return recall_at_k(self.ann_index, exact, normalize(self.encode_texts(query_texts)), top_k=top_k)
+    
+    def find_related_opinions(self, topic_text, opinions_texts, threshold=0.85, opinion_ids=None, n_probe=8):
+        """Find opinions related to a given topic text.
+
+        With opinion ids and clusters (build_clusters), this is two-stage: only the
+        members of the `n_probe` clusters nearest to the topic are scored.
+        """
+        # Encode the topic; opinions come from the store when their ids are known
+        topic_embedding = normalize(self.encode_query(topic_text))
+        if opinion_ids is not None and self.clusterer is not None and len(self.clusterer):
+            opinion_ids = list(opinion_ids)
+            self._sync_for_query(opinion_ids, opinions_texts)
+            positions = self._cluster_positions(topic_embedding, opinion_ids, n_probe)
+            sims = self.store.get([opinion_ids[i] for i in positions]) @ topic_embedding if len(positions) else np.zeros(0)
+            keep = np.flatnonzero(sims > threshold)
+            relevant_idxs = positions[keep].tolist()
+            similarity_scores = sims[keep].tolist()
+            return [opinions_texts[i] for i in relevant_idxs], similarity_scores, relevant_idxs
+        
+        if opinion_ids is not None:
+            opinion_ids = list(opinion_ids)
+            self._sync_for_query(opinion_ids, opinions_texts)
+            opinion_embeddings = self.store.get(opinion_ids)
+        else:
+            opinion_embeddings = self.encode_texts(opinions_texts)
         
         # Calculate similarities
-        sims = cosine_similarity([topic_embedding], opinion_embeddings)[0]
+        sims = normalize(opinion_embeddings) @ topic_embedding
         
         # Find relevant opinions
-        relevant_idxs = [i for i, s in enumerate(sims) if s > threshold]
+        relevant_idxs = np.flatnonzero(sims > threshold).tolist()
         found_opinions = [opinions_texts[i] for i in relevant_idxs]
-        similarity_scores = [sims[i] for i in relevant_idxs]
+        similarity_scores = sims[relevant_idxs].tolist()
         
-        return found_opinions, similarity_scores, relevant_idxs
\ No newline at end of file
+        return found_opinions, similarity_scores, relevant_idxs
+    
+    def search_related_opinions(self, topic_text, opinion_ids, opinions_texts, top_k=7, threshold=0.85,
+                                use_index=False, quantized=False, clustered=False, n_probe=8):
+        """Return the top-k opinions above threshold, best first, as (texts, scores, idxs)"""
+        topic_embedding = normalize(self.encode_query(topic_text))
+        
+        quantized = quantized and self.quantized_index is not None
+        if quantized or (use_index and self.ann_index is not None):
+            # Index paths never copy the full matrix into RAM; they only make sure the store is current
+            self._sync_for_query(opinion_ids, opinions_texts)
+            with telemetry.span("retrieve.score", mode=self.quantized_index.mode if quantized else "ivf"):
+                # Only the given opinions are candidates (the index may hold removed or filtered ones),
+                # so the top-k is never cut short by hits that are dropped afterwards
+                if quantized:
+                    # Shortlist on the compact codes, rescore it at full precision from the memory-mapped store
+                    self._add_missing_to_index(self.quantized_index, opinion_ids, "quantized_index")
+                    found_ids, scores = self.quantized_index.search(
+                        topic_embedding, top_k=top_k, threshold=threshold, rescore_fn=self.store.get,
+                        mask=self._index_mask(self.quantized_index, opinion_ids)
+                    )
+                else:
+                    self._add_missing_to_index(self.ann_index, opinion_ids, "ann_index")
+                    found_ids, scores = self.ann_index.search(topic_embedding, top_k=top_k, threshold=threshold,
+                                                              mask=self._index_mask(self.ann_index, opinion_ids))
+                
+                positions = {opinion_id: i for i, opinion_id in enumerate(opinion_ids)}
+                hits = [(positions[opinion_id], score) for opinion_id, score in zip(found_ids, scores)
+                        if opinion_id in positions]
+                relevant_idxs = [i for i, _ in hits]
+                similarity_scores = [float(score) for _, score in hits]
+        elif clustered and self.clusterer is not None and len(self.clusterer):
+            self._sync_for_query(opinion_ids, opinions_texts)
+            with telemetry.span("retrieve.score", mode="clusters"):
+                # Two-stage: nearest centroids first, then exact scores for their members only
+                positions = self._cluster_positions(topic_embedding, opinion_ids, n_probe)
+                sims = self.store.get([opinion_ids[i] for i in positions]) @ topic_embedding if len(positions) else np.zeros(0)
+                best = top_k_scores(sims, top_k, threshold)
+                relevant_idxs = positions[best].tolist()
+                similarity_scores = sims[best].tolist()
+        else:
+            self._sync_for_query(opinion_ids, opinions_texts)
+            opinion_embeddings = self.store.get(opinion_ids)
+            with telemetry.span("retrieve.score", mode="exact"):
+                # Exact path: stored vectors are normalized, so a dot product is cosine similarity
+                sims = opinion_embeddings @ topic_embedding if len(opinion_embeddings) else np.zeros(0)
+                best = top_k_scores(sims, top_k, threshold)
+                relevant_idxs = best.tolist()
+                similarity_scores = sims[best].tolist()
+        
+        found_opinions = [opinions_texts[i] for i in relevant_idxs]
+        return found_opinions, similarity_scores, relevant_idxs
@@ -0,0 +1,208 @@
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+class EmbeddingStore:
+    """On-disk store of opinion embeddings keyed by opinion id and text hash.
+
+    Vectors live in a memory-mapped float32 .npy matrix (one row per opinion,
+    L2-normalized) and the id -> row map is an append-only JSON lines file,
+    so adding or re-embedding one opinion never rewrites the whole store.
+    `derived` names files or directories in `store_dir` built from the vectors
+    (indexes, clusters); they are deleted with them on reset.
+    """
+    def __init__(self, store_dir, model_name, initial_capacity=1024, derived=()):
+        self.store_dir = store_dir
+        self.model_name = model_name
+        self.initial_capacity = initial_capacity
+        self.derived = derived
+        self.matrix_path = os.path.join(store_dir, "embeddings.npy")
+        self.ids_path = os.path.join(store_dir, "ids.jsonl")
+        self.meta_path = os.path.join(store_dir, "meta.json")
+
+        self.dim = None
+        self.matrix = None
+        self.rows = {}      # opinion id -> row in matrix
+        self.row_ids = []   # row -> opinion id
+        self.hashes = []    # row -> text hash
+
+        # Guards the matrix and id map; readers and writers may be on different sessions' threads
+        self._lock = threading.RLock()
+
+        # Create store directory if it doesn't exist
+        os.makedirs(store_dir, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def text_hash(text):
+        """Stable short hash of an opinion text"""
+        return hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def count(self):
+        return len(self.row_ids)
+
+    def _load(self):
+        """Load the store from disk, resetting it if it was built with another model"""
+        if not os.path.exists(self.meta_path):
+            return
+
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        # Embeddings from a different model are not comparable, start over
+        if meta.get("model_name") != self.model_name or not os.path.exists(self.matrix_path):
+            print(f"Embedding store built with {meta.get('model_name')}, resetting for {self.model_name}.")
+            self.reset()
+            return
+
+        self.dim = meta["dim"]
+        self.matrix = np.load(self.matrix_path, mmap_mode="r+")
+
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line from an interrupted write
+                        continue
+                    self._set_row(entry["id"], entry["row"], entry["hash"])
+
+    def _save_meta(self):
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+
+    def _set_row(self, opinion_id, row, text_hash):
+        while len(self.row_ids) <= row:
+            self.row_ids.append(None)
+            self.hashes.append(None)
+        self.rows[opinion_id] = row
+        self.row_ids[row] = opinion_id
+        self.hashes[row] = text_hash
+
+    def reset(self):
+        """Drop every stored embedding and everything derived from them"""
+        with self._lock:
+            for path in (self.matrix_path, self.ids_path, self.meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            for name in self.derived:
+                path = os.path.join(self.store_dir, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            self.dim = None
+            self.matrix = None
+            self.rows = {}
+            self.row_ids = []
+            self.hashes = []
+
+    def _ensure_capacity(self, needed):
+        """Grow the memory-mapped matrix (by doubling) so it can hold `needed` rows"""
+        if self.matrix is not None and self.matrix.shape[0] >= needed:
+            return
+
+        capacity = max(self.initial_capacity, needed)
+        if self.matrix is not None:
+            capacity = max(capacity, self.matrix.shape[0] * 2)
+
+        tmp_path = self.matrix_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        if self.matrix is not None:
+            grown[:self.count] = self.matrix[:self.count]
+        grown.flush()
+        del grown
+
+        self.matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self.matrix = np.load(self.matrix_path, mmap_mode="r+")
+
+    def upsert(self, opinion_ids, texts, encode_fn):
+        """Embed opinions whose id is new or whose text changed; returns how many were encoded"""
+        with self._lock:
+            pending_ids = []
+            pending_texts = []
+            pending_hashes = []
+            seen = set()
+            for opinion_id, text in zip(opinion_ids, texts):
+                if opinion_id in seen:
+                    continue
+                seen.add(opinion_id)
+                text = "" if text is None or text != text else str(text)
+                text_hash = self.text_hash(text)
+                row = self.rows.get(opinion_id)
+                if row is None or self.hashes[row] != text_hash:
+                    pending_ids.append(opinion_id)
+                    pending_texts.append(text)
+                    pending_hashes.append(text_hash)
+
+            if not pending_ids:
+                return 0
+
+            embeddings = np.asarray(encode_fn(pending_texts), dtype=np.float32)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                self._save_meta()
+
+            new_rows = sum(1 for opinion_id in pending_ids if opinion_id not in self.rows)
+            self._ensure_capacity(self.count + new_rows)
+
+            with open(self.ids_path, "a", encoding="utf-8") as f:
+                for opinion_id, text_hash, embedding in zip(pending_ids, pending_hashes, embeddings):
+                    row = self.rows.get(opinion_id)
+                    if row is None:
+                        row = self.count
+                    self.matrix[row] = embedding
+                    self._set_row(opinion_id, row, text_hash)
+                    f.write(json.dumps({"id": opinion_id, "row": row, "hash": text_hash}) + "\n")
+                self.matrix.flush()
+
+            return len(pending_ids)
+
+    def add_missing(self, opinion_ids, texts, encode_fn):
+        """Embed only opinions whose id is not stored yet; returns how many were encoded.
+
+        Unlike `upsert`, stored texts are not re-hashed, so a query over a large,
+        current store costs one dict lookup per opinion. Changed texts are left
+        to `upsert` callers (the opinion listener and bulk paths).
+        """
+        with self._lock:
+            missing = [(opinion_id, text) for opinion_id, text in zip(opinion_ids, texts) if opinion_id not in self.rows]
+            if not missing:
+                return 0
+            return self.upsert([opinion_id for opinion_id, _ in missing], [text for _, text in missing], encode_fn)
+
+    def get(self, opinion_ids):
+        """Return the stored embeddings for the given ids, in order"""
+        with self._lock:
+            if self.matrix is None:
+                return np.zeros((0, 0), dtype=np.float32)
+            rows = [self.rows[opinion_id] for opinion_id in opinion_ids]
+            return np.asarray(self.matrix[rows])
+
+    def rows_of(self, opinion_ids):
+        """Rows of the given stored ids in `vectors()`, as an int64 array"""
+        with self._lock:
+            return np.fromiter((self.rows[opinion_id] for opinion_id in opinion_ids), dtype=np.int64,
+                               count=len(opinion_ids))
+
+    def sync(self, opinion_ids, texts, encode_fn):
+        """Bring the store up to date with the given opinions and return their embeddings"""
+        opinion_ids = list(opinion_ids)
+        self.upsert(opinion_ids, texts, encode_fn)
+        return self.get(opinion_ids)
+
+    def vectors(self):
+        """All stored embeddings, row-aligned with `row_ids`"""
+        with self._lock:
+            if self.matrix is None:
+                return np.zeros((0, 0), dtype=np.float32)
+            return self.matrix[:self.count]
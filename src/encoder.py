@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import threading
+import numpy as np
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+# SentenceTransformer(backend=..., model_kwargs=...) first appeared in sentence-transformers 3.2
+ONNX_MIN_VERSION = (3, 2)
+
+# Fixed probe sentences for comparing an optimized backend against the reference model
+PROBE_TEXTS = [
+    "The new policy will improve public transport in the city.",
+    "I disagree, the costs are far too high for taxpayers.",
+    "Remote work has made my team more productive.",
+    "Social media platforms should do more to stop misinformation.",
+    "ok",
+    "This is a much longer opinion that goes on for a while about housing prices, interest rates, "
+    "the lack of new construction and what the local council should be doing about all of it.",
+]
+
+def installed_version():
+    """(major, minor) of the installed sentence-transformers"""
+    import sentence_transformers
+    return tuple(int(part) for part in re.findall(r"\d+", sentence_transformers.__version__)[:2])
+
+def backend_error(backend):
+    """Why the installed sentence-transformers cannot run the backend, or None if it can"""
+    if backend == "onnx" and installed_version() < ONNX_MIN_VERSION:
+        return (f"the onnx backend needs sentence-transformers>={'.'.join(map(str, ONNX_MIN_VERSION))} with the "
+                f"onnx extras (pip install 'sentence-transformers[onnx]>=3.2'), "
+                f"found {'.'.join(map(str, installed_version()))}")
+    return None
+
+def load_sentence_transformer(model_name, cache_dir, backend="torch", onnx_file=None):
+    """Load the model on the requested CPU backend"""
+    # Imported here so importing this module does not pull in torch
+    from sentence_transformers import SentenceTransformer
+    
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend}")
+    error = backend_error(backend)
+    if error:
+        raise RuntimeError(f"Cannot load {model_name}: {error}")
+    if backend == "onnx":
+        model_kwargs = {"file_name": onnx_file} if onnx_file else None
+        return SentenceTransformer(model_name, cache_folder=cache_dir, backend="onnx", model_kwargs=model_kwargs)
+    
+    model = SentenceTransformer(model_name, cache_folder=cache_dir, device="cpu" if backend == "torch-int8" else None)
+    if backend == "torch-int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def max_deviation(candidate, reference):
+    """Largest 1 - cosine similarity between row-aligned embeddings"""
+    candidate = np.asarray(candidate, dtype=np.float32)
+    reference = np.asarray(reference, dtype=np.float32)
+    cos = np.sum(candidate * reference, axis=1) / (
+        np.linalg.norm(candidate, axis=1) * np.linalg.norm(reference, axis=1) + 1e-12
+    )
+    return float(np.max(1.0 - cos)) if len(cos) else 0.0
+
+class EncodingEngine:
+    """Batched sentence encoding tuned for throughput, with a low-latency single-text path.
+
+    Texts are sorted by token length and cut into batches under a token budget,
+    so short texts share large batches and long ones are not padded against each
+    other. Jobs of at least `pool_threshold` texts fan out to a multi-process CPU
+    pool when `processes` > 1. Results are always returned in input order.
+    """
+    def __init__(self, model, max_batch_tokens=16384, max_batch_size=256, processes=0, pool_threshold=20000):
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.processes = processes
+        self.pool_threshold = pool_threshold
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    
+    def token_lengths(self, texts):
+        """Token count per text, capped at the model's sequence length"""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        if tokenizer is None:
+            return [min(len(text.split()) + 2, max_length) for text in texts]
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+    
+    def plan_batches(self, lengths):
+        """Positions grouped into length-sorted batches that fit the token budget"""
+        order = np.argsort(lengths, kind="stable")
+        batches = []
+        batch = []
+        longest = 0
+        for pos in order:
+            longest = max(longest, lengths[pos])
+            # Every row in a batch is padded to its longest text
+            if batch and (longest * (len(batch) + 1) > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch = []
+                longest = lengths[pos]
+            batch.append(int(pos))
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def encode_one(self, text):
+        """Single text, no sorting, pool or progress bar"""
+        return self.model.encode([text], batch_size=1, show_progress_bar=False, convert_to_numpy=True)[0]
+    
+    def encode(self, texts, show_progress_bar=False):
+        """Encode texts in input order, choosing batching or the process pool by job size"""
+        texts = [str(text) for text in texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if len(texts) == 1:
+            return self.encode_one(texts[0])[None, :]
+        if self.processes and self.processes > 1 and len(texts) >= self.pool_threshold:
+            return self._encode_pool(texts)
+        
+        batches = self.plan_batches(self.token_lengths(texts))
+        embeddings = None
+        done = 0
+        for batch in batches:
+            vectors = self.model.encode([texts[pos] for pos in batch], batch_size=len(batch),
+                                        show_progress_bar=False, convert_to_numpy=True)
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+            embeddings[batch] = vectors
+            done += len(batch)
+            if show_progress_bar:
+                print(f"Encoded {done}/{len(texts)} texts", end="\r")
+        if show_progress_bar:
+            print()
+        return embeddings
+    
+    def _encode_pool(self, texts):
+        with self._pool_lock:
+            if self._pool is None:
+                devices = ["cpu"] * self.processes
+                self._pool = self.model.start_multi_process_pool(target_devices=devices)
+        
+        # Length-sorted chunks keep padding low inside every worker
+        lengths = self.token_lengths(texts)
+        order = np.argsort(lengths, kind="stable")
+        chunk_size = max(1, min(len(texts) // (self.processes * 4), 5000))
+        batch_size = max(1, min(self.max_batch_size, self.max_batch_tokens // max(int(np.median(lengths)), 1)))
+        vectors = self.model.encode_multi_process([texts[pos] for pos in order], self._pool,
+                                                  batch_size=batch_size, chunk_size=chunk_size)
+        embeddings = np.empty_like(vectors)
+        embeddings[order] = vectors
+        return embeddings
+    
+    def close(self):
+        """Stop the process pool, if one was started"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+def check_backend(model, model_name, cache_dir, backend, tolerance=0.01, onnx_file=None):
+    """Whether `model` (loaded on `backend`) stays within `tolerance` (1 - cosine) of the torch model.
+
+    The measured deviation is stored in `cache_dir`, so the reference model is
+    only loaded the first time a model/backend pair is used.
+    """
+    path = os.path.join(cache_dir, "encoder_checks.json")
+    key = f"{model_name}|{backend}|{onnx_file or ''}"
+    checks = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            checks = json.load(f)
+    
+    if key not in checks:
+        reference = load_sentence_transformer(model_name, cache_dir, "torch")
+        checks[key] = max_deviation(
+            model.encode(PROBE_TEXTS, show_progress_bar=False, convert_to_numpy=True),
+            reference.encode(PROBE_TEXTS, show_progress_bar=False, convert_to_numpy=True),
+        )
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checks, f, indent=2)
+        os.replace(tmp_path, path)
+    return checks[key] <= tolerance, checks[key]
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import numpy as np
+
+CATEGORIES = ["Claim", "Counterclaim", "Rebuttal", "Evidence"]
+
+class FakeQuotaError(Exception):
+    """Stand-in for the 429 / ResourceExhausted error raised by the Gemini client"""
+    code = 429
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    """Offline stand-in for genai.GenerativeModel.
+
+    Replies deterministically after `latency` seconds and raises a 429 on every
+    `quota_error_every`-th call, so the rate limiter and retries can be exercised
+    without network access. Every `partial_batch_every`-th batch reply drops its
+    last entry to exercise split-and-retry.
+    """
+    def __init__(self, latency=0.05, quota_error_every=0, partial_batch_every=0):
+        self.latency = latency
+        self.quota_error_every = quota_error_every
+        self.partial_batch_every = partial_batch_every
+        self.calls = 0
+        self.batch_calls = 0
+        self.quota_errors = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def classify(text):
+        """Deterministic category for a text"""
+        digest = hashlib.md5(text.encode("utf-8")).digest()
+        return CATEGORIES[digest[0] % len(CATEGORIES)]
+    
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+            fail = self.quota_error_every and self.calls % self.quota_error_every == 0
+            if fail:
+                self.quota_errors += 1
+        
+        time.sleep(self.latency)
+        if fail:
+            raise FakeQuotaError("429 Resource has been exhausted (e.g. check quota).")
+        
+        if prompt.startswith("Classify each of the following texts"):
+            texts = json.loads(prompt.split("JSON object mapping index to text:\n", 1)[1].split("\n", 1)[0])
+            reply = {index: self.classify(text) for index, text in texts.items()}
+            with self._lock:
+                self.batch_calls += 1
+                partial = self.partial_batch_every and self.batch_calls % self.partial_batch_every == 0
+            if partial and reply:
+                reply.pop(list(reply)[-1])
+            return FakeResponse(json.dumps(reply))
+        
+        if prompt.startswith("Classify the following text"):
+            text = prompt.split('Text to classify: "', 1)[1].rsplit('"', 1)[0]
+            return FakeResponse(self.classify(text))
+        
+        return FakeResponse(f"Fake conclusion over {prompt.count(chr(10))} prompt lines.")
+
+class FakeEmbeddingModel:
+    """Offline, deterministic stand-in for SentenceTransformer.
+
+    Each text is embedded by signed feature hashing of its lowercased words, so
+    texts sharing words get similar vectors. `latency_per_token` simulates model
+    cost proportional to padded batch size, which makes batching effects visible.
+    """
+    tokenizer = None
+    
+    def __init__(self, dim=384, max_seq_length=256, latency_per_token=0.0):
+        self.dim = dim
+        self.max_seq_length = max_seq_length
+        self.latency_per_token = latency_per_token
+        self.calls = 0
+        self._features = {}
+    
+    def _feature(self, word):
+        feature = self._features.get(word)
+        if feature is None:
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            feature = (int.from_bytes(digest[:4], "little") % self.dim, 1.0 if digest[4] & 1 else -1.0)
+            self._features[word] = feature
+        return feature
+    
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True, **kwargs):
+        self.calls += 1
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        longest = 0
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", str(text).lower())[:self.max_seq_length]
+            longest = max(longest, len(words))
+            for word in words:
+                col, sign = self._feature(word)
+                embeddings[row, col] += sign
+        if self.latency_per_token:
+            time.sleep(self.latency_per_token * longest * len(texts))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms == 0, 1.0, norms)
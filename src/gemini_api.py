@@ -1,11 +1,73 @@
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
 import json
+import random
+import time
+from src.rate_limiter import TokenBucket
+from src.telemetry import telemetry
+
+VALID_CATEGORIES = ["Claim", "Counterclaim", "Rebuttal", "Evidence"]
+
+# Bump when the classification prompts change so cached answers are not reused
+CLASSIFY_PROMPT_VERSION = "classify-v1"
+CONCLUSION_PROMPT_VERSION = "conclusion-v1"
+
+def is_quota_error(error):
+    """True for 429 / ResourceExhausted style errors that are worth retrying"""
+    if getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted":
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
 
 class GeminiAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, model=None, model_name="gemini-2.0-flash", rate_limiter=None,
+                 max_workers=4, max_retries=5, backoff=1.0, batch_size=10, cache=None):
         self.api_key = api_key
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model_name = model_name
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        
+        # Optional ClassificationCache consulted before any classification call
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        
+        # Requests per second shared by every call made through this client
+        self.rate_limiter = rate_limiter or TokenBucket(rate=1.0, capacity=5)
+        
+        # A fake model can be injected for offline runs
+        if model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel(model_name)
+        self.model = model
+    
+    def _generate(self, prompt, kind="generate"):
+        """Call the model under the rate limiter, retrying quota errors with exponential backoff"""
+        telemetry.observe("gemini_prompt_chars", len(prompt), kind=kind)
+        for attempt in range(self.max_retries + 1):
+            with telemetry.span("gemini.rate_limit_wait", kind=kind):
+                self.rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                with telemetry.span("gemini.call", kind=kind, attempt=attempt, prompt_chars=len(prompt)):
+                    response = self.model.generate_content(prompt)
+                telemetry.incr("gemini_requests_total", kind=kind, outcome="ok")
+                telemetry.observe("gemini_latency_seconds", time.perf_counter() - start, kind=kind)
+                return response
+            except Exception as e:
+                quota = is_quota_error(e)
+                telemetry.incr("gemini_requests_total", kind=kind, outcome="quota" if quota else "error")
+                telemetry.observe("gemini_latency_seconds", time.perf_counter() - start, kind=kind)
+                if not quota or attempt == self.max_retries:
+                    telemetry.incr("gemini_failures_total", kind=kind, reason="quota" if quota else type(e).__name__)
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+                print(f"Gemini quota error, retrying in {delay:.1f}s: {e}")
+                telemetry.incr("gemini_retries_total", kind=kind)
+                telemetry.incr("gemini_backoff_seconds_total", delay, kind=kind)
+                # Draining the shared bucket is the backoff: the next acquire (this and every other
+                # caller) waits for it to refill, in the gemini.rate_limit_wait span
+                self.rate_limiter.penalize(delay)
     
     def classify_opinion(self, opinion_text):
         """Classify an opinion as Claim, Counterclaim, Rebuttal, or Evidence"""
@@ -19,11 +81,11 @@ Text to classify: "{opinion_text}"
 
 Return ONLY the classification name (Claim, Counterclaim, Rebuttal, or Evidence) without any explanations.
 """
-        response = self.model.generate_content(prompt)
+        response = self._generate(prompt, kind="classify")
         classification = response.text.strip()
         
         # Ensure the response is one of the valid categories
-        valid_categories = ["Claim", "Counterclaim", "Rebuttal", "Evidence"]
+        valid_categories = VALID_CATEGORIES
         if classification not in valid_categories:
             # Try to extract from longer response
             for category in valid_categories:
@@ -35,6 +97,103 @@ Return ONLY the classification name (Claim, Counterclaim, Rebuttal, or Evidence)
         
         return classification
     
+    def classify_batch(self, opinion_texts):
+        """Classify several opinions in one request; unusable answers come back as None"""
+        texts = {str(i): text for i, text in enumerate(opinion_texts)}
+        prompt = f"""Classify each of the following texts into one of these categories:
+- Claim: A statement that supports a position
+- Counterclaim: A statement that counters another claim or presents an opposing reason
+- Rebuttal: A statement that counters a counterclaim
+- Evidence: Ideas or examples that support claims, counterclaims, or rebuttals
+
+Texts to classify, as a JSON object mapping index to text:
+{json.dumps(texts, ensure_ascii=False)}
+
+Return ONLY a JSON object mapping every index to its classification name (Claim, Counterclaim, Rebuttal, or Evidence), for example {{"0": "Claim", "1": "Evidence"}}, without any explanations.
+"""
+        try:
+            response = self._generate(prompt, kind="classify_batch")
+            return self._parse_batch(response.text, len(opinion_texts))
+        except Exception as e:
+            if is_quota_error(e):
+                raise
+            print(f"Batch classification failed for {len(opinion_texts)} opinions: {e}")
+            return [None] * len(opinion_texts)
+    
+    @staticmethod
+    def _parse_batch(reply, count):
+        """Parse a JSON batch reply into a list of categories, None where missing or invalid"""
+        reply = reply.strip()
+        # Tolerate a ```json fenced block
+        if reply.startswith("```"):
+            reply = reply.strip("`")
+            if reply.startswith("json"):
+                reply = reply[4:]
+        try:
+            parsed = json.loads(reply)
+        except json.JSONDecodeError:
+            return [None] * count
+        if not isinstance(parsed, dict):
+            return [None] * count
+        
+        by_name = {category.lower(): category for category in VALID_CATEGORIES}
+        results = []
+        for i in range(count):
+            value = parsed.get(str(i))
+            results.append(by_name.get(value.strip().lower()) if isinstance(value, str) else None)
+        return results
+    
+    def _classify_batch_with_retry(self, opinion_texts):
+        """Classify a batch, splitting malformed or partial answers and retrying the gaps"""
+        if len(opinion_texts) == 1:
+            return [self.classify_opinion(opinion_texts[0])]
+        
+        results = self.classify_batch(opinion_texts)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            missing_texts = [opinion_texts[i] for i in missing]
+            half = (len(missing_texts) + 1) // 2
+            # Retry the gaps in two halves so one bad text cannot sink a whole batch again
+            retried = []
+            for part in (missing_texts[:half], missing_texts[half:]):
+                if part:
+                    retried.extend(self._classify_batch_with_retry(part))
+            for i, result in zip(missing, retried):
+                results[i] = result
+        return results
+    
+    def classify_opinions(self, opinion_texts, max_workers=None, batch_size=None):
+        """Classify several opinions concurrently in batches; results are in input order"""
+        opinion_texts = list(opinion_texts)
+        if not opinion_texts:
+            return []
+        if self.cache is None:
+            return self._classify_uncached(opinion_texts, max_workers, batch_size)
+        
+        # Only texts that have never been classified with this model and prompt hit the API
+        cached = self.cache.get_many(self.model_name, CLASSIFY_PROMPT_VERSION, opinion_texts)
+        missing = list(dict.fromkeys(text for text in opinion_texts if text not in cached))
+        telemetry.incr("cache_requests_total", len(opinion_texts) - len(missing), cache="classification", outcome="hit")
+        telemetry.incr("cache_requests_total", len(missing), cache="classification", outcome="miss")
+        if missing:
+            categories = self._classify_uncached(missing, max_workers, batch_size)
+            self.cache.put_many(self.model_name, CLASSIFY_PROMPT_VERSION, missing, categories)
+            cached.update(zip(missing, categories))
+        return [cached[text] for text in opinion_texts]
+    
+    def _classify_uncached(self, opinion_texts, max_workers=None, batch_size=None):
+        batch_size = batch_size or self.batch_size
+        if batch_size <= 1:
+            batches = [[text] for text in opinion_texts]
+        else:
+            batches = [opinion_texts[i:i + batch_size] for i in range(0, len(opinion_texts), batch_size)]
+        
+        workers = min(max_workers or self.max_workers, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Worker threads report their Gemini calls under the caller's span
+            results = executor.map(telemetry.wrap(self._classify_batch_with_retry), batches)
+            return [category for batch in results for category in batch]
+    
     def generate_conclusion(self, topic_text, opinions_with_types):
         """Generate a conclusion based on topic and classified opinions"""
         prompt = f"""I'm analyzing a topic and related opinions from social media. Based on the topic and the various opinions, generate a concise conclusion that summarizes the overall sentiment and key points.
@@ -57,7 +216,7 @@ Please create a concise conclusion that:
 Format your response as just the conclusion without any additional explanations.
 """
         
-        response = self.model.generate_content(prompt)
+        response = self._generate(prompt, kind="conclusion")
         conclusion = response.text.strip()
         
-        return conclusion
\ No newline at end of file
+        return conclusion
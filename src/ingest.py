@@ -0,0 +1,147 @@
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+def read_records(source, text_field="text"):
+    """Stream opinion records from a JSONL or CSV file, or stdin when source is "-".
+
+    Records are yielded one at a time as dicts with `text` plus any of `id`,
+    `topic_id`, `type` and `effectiveness`; rows without text are skipped.
+    """
+    is_stdin = source == "-"
+    is_csv = not is_stdin and os.path.splitext(source)[1].lower() == ".csv"
+    f = sys.stdin if is_stdin else open(source, "r", encoding="utf-8", newline="" if is_csv else None)
+    try:
+        if is_csv:
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            text = row.get(text_field)
+            if not text:
+                continue
+            record = {key: None if row.get(key) in (None, "") else row.get(key)
+                      for key in ("id", "topic_id", "type", "effectiveness")}
+            record["text"] = text
+            if record["id"] is not None:
+                record["id"] = str(record["id"])
+            yield record
+    finally:
+        if not is_stdin:
+            f.close()
+
+def micro_batches(records, batch_size):
+    """Group a record stream into lists of at most batch_size"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class StreamingIngestor:
+    """Bulk opinion loader: dedupe, micro-batched storage writes and background embedding.
+
+    Stored batches are handed to an embedding thread through a bounded queue;
+    when embedding falls `max_pending_batches` behind, the reader blocks until
+    it catches up, so memory stays flat however long the input is.
+    """
+    def __init__(self, data_processor, embedding_processor=None, batch_size=512, max_pending_batches=4,
+                 report_every=5.0, duplicate_detector=None, lexical_index=None):
+        self.data_processor = data_processor
+        self.embedding_processor = embedding_processor
+        self.duplicate_detector = duplicate_detector
+        self.lexical_index = lexical_index
+        self.batch_size = batch_size
+        self.report_every = report_every
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._embed_error = None
+        self.stats = {"read": 0, "stored": 0, "duplicates": 0, "near_duplicates": 0, "embedded": 0}
+    
+    def _embed_worker(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                if self._embed_error is None:
+                    self.embedding_processor.embed_opinions([row["id"] for row in batch], [row["text"] for row in batch])
+                    self.stats["embedded"] += len(batch)
+            except Exception as e:
+                self._embed_error = e
+            finally:
+                self._queue.task_done()
+    
+    def _dedupe(self, batch):
+        """Drop records whose id repeats within the batch or is already stored"""
+        ids = [record["id"] for record in batch if record["id"]]
+        existing = self.data_processor.existing_opinion_ids(ids) if ids else set()
+        seen = set()
+        unique = []
+        for record in batch:
+            opinion_id = record["id"]
+            if opinion_id and (opinion_id in existing or opinion_id in seen):
+                self.stats["duplicates"] += 1
+                continue
+            seen.add(opinion_id)
+            unique.append(record)
+        return unique
+    
+    def _report(self, start, final=False):
+        elapsed = max(time.monotonic() - start, 1e-9)
+        label = "Ingested" if final else "Ingesting"
+        print(f"{label}: {self.stats['read']} read, {self.stats['stored']} stored, "
+              f"{self.stats['duplicates']} duplicates, {self.stats['near_duplicates']} near-duplicates, "
+              f"{self.stats['embedded']} embedded, "
+              f"{self.stats['stored'] / elapsed:.0f} rows/s")
+    
+    def ingest(self, records):
+        """Consume a record stream; returns the ingest statistics"""
+        worker = None
+        if self.embedding_processor is not None:
+            worker = threading.Thread(target=self._embed_worker, daemon=True)
+            worker.start()
+        
+        start = time.monotonic()
+        last_report = start
+        try:
+            for batch in micro_batches(records, self.batch_size):
+                self.stats["read"] += len(batch)
+                batch = self._dedupe(batch)
+                if batch:
+                    ids = self.data_processor.add_opinions(batch, notify=False)
+                    for record, opinion_id in zip(batch, ids):
+                        record["id"] = opinion_id
+                    self.stats["stored"] += len(batch)
+                    if self.duplicate_detector is not None:
+                        # Near-duplicates are stored but linked to their canonical opinion
+                        links = self.duplicate_detector.add_many(ids, [record["text"] for record in batch])
+                        self.stats["near_duplicates"] += sum(canonical != opinion_id for opinion_id, canonical in links.items())
+                    if self.lexical_index is not None:
+                        self.lexical_index.add_many(ids, [record["text"] for record in batch])
+                    if worker is not None:
+                        if self._embed_error is not None:
+                            raise self._embed_error
+                        # Blocks while the embedding thread is behind (backpressure)
+                        self._queue.put(batch)
+                
+                if time.monotonic() - last_report >= self.report_every:
+                    self._report(start)
+                    last_report = time.monotonic()
+        finally:
+            if worker is not None:
+                self._queue.put(None)
+                worker.join()
+            self.data_processor.flush()
+        
+        if self._embed_error is not None:
+            raise self._embed_error
+        self.stats["seconds"] = time.monotonic() - start
+        self._report(start, final=True)
+        return self.stats
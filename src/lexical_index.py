@@ -0,0 +1,158 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+import numpy as np
+from src.table_log import TableLog
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its of on or so that the their there "
+    "they this to was we were what when which who will with you your not do does did can could would should".split()
+)
+
+def tokenize(text):
+    """Lowercased word tokens without stop words and single characters"""
+    return [token for token in re.findall(r"\w+", str(text).lower()) if len(token) > 1 and token not in STOPWORDS]
+
+class BM25Index:
+    """Incremental BM25 inverted index over opinion text.
+
+    Documents are kept as term counts in an append-only log (re-adding an id
+    replaces it) that is replayed on load, so the index grows with every added
+    opinion without rebuilds. Posting lists are turned into numpy arrays lazily
+    and cached until a document touching that term changes.
+    """
+    def __init__(self, path=os.path.join("data", "bm25.log"), k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.log = TableLog(path)
+        self._lock = threading.RLock()
+        self.doc_ids = []     # doc -> opinion id
+        self.docs = {}        # opinion id -> doc
+        self.doc_terms = []   # doc -> {term: tf}
+        self.doc_lengths = []
+        self.total_length = 0
+        self.postings = {}    # term -> {doc: tf}
+        self._arrays = {}
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        for record in self.log.replay():
+            self._index(record["id"], record["terms"])
+    
+    def __len__(self):
+        return len(self.doc_ids)
+    
+    def _index(self, opinion_id, terms):
+        doc = self.docs.get(opinion_id)
+        if doc is None:
+            doc = self.docs[opinion_id] = len(self.doc_ids)
+            self.doc_ids.append(opinion_id)
+            self.doc_terms.append({})
+            self.doc_lengths.append(0)
+        else:
+            # Replace: drop the old postings of this document
+            for term in self.doc_terms[doc]:
+                self.postings[term].pop(doc, None)
+                self._arrays.pop(term, None)
+        
+        self.total_length += sum(terms.values()) - self.doc_lengths[doc]
+        self.doc_terms[doc] = terms
+        self.doc_lengths[doc] = sum(terms.values())
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc] = tf
+            self._arrays.pop(term, None)
+    
+    def add_many(self, opinion_ids, texts):
+        """Index (or re-index) opinions and append them to the log"""
+        records = []
+        with self._lock:
+            for opinion_id, text in zip(opinion_ids, texts):
+                terms = dict(Counter(tokenize(text)))
+                doc = self.docs.get(str(opinion_id))
+                if doc is not None and self.doc_terms[doc] == terms:
+                    continue
+                self._index(str(opinion_id), terms)
+                records.append({"id": str(opinion_id), "terms": terms})
+            if records:
+                self.log.append_many(records)
+        return len(records)
+    
+    def add(self, opinion_id, text):
+        return self.add_many([opinion_id], [text])
+    
+    def on_opinion_changed(self, opinion):
+        """DataProcessor listener that indexes every added opinion"""
+        self.add(opinion["id"], opinion["text"])
+    
+    def sync(self, opinion_ids, texts):
+        """Index the opinions that are not in the index yet (e.g. after a bulk ingest)"""
+        missing = [(str(opinion_id), text) for opinion_id, text in zip(opinion_ids, texts) if str(opinion_id) not in self.docs]
+        if not missing:
+            return 0
+        return self.add_many([opinion_id for opinion_id, _ in missing], [text for _, text in missing])
+    
+    def lexical_scores(self, query, opinion_ids):
+        """{id: BM25 score} for the given opinions (0 when no query term occurs)"""
+        found_ids, scores = self.search(query, top_k=None)
+        found = dict(zip(found_ids, scores.tolist()))
+        return {opinion_id: found.get(str(opinion_id), 0.0) for opinion_id in opinion_ids}
+    
+    def _posting_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings.get(term, {})
+            arrays = (np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                      np.fromiter(posting.values(), dtype=np.float32, count=len(posting)))
+            self._arrays[term] = arrays
+        return arrays
+    
+    def search(self, query, top_k=100):
+        """Best-matching opinion ids and their BM25 scores, highest first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.doc_ids)
+            if not n_docs or not terms:
+                return [], np.zeros(0, dtype=np.float32)
+            avg_length = self.total_length / n_docs
+            lengths = np.asarray(self.doc_lengths, dtype=np.float32)
+            
+            docs = []
+            scores = []
+            for term in terms:
+                doc_idxs, tfs = self._posting_arrays(term)
+                if not len(doc_idxs):
+                    continue
+                idf = math.log(1.0 + (n_docs - len(doc_idxs) + 0.5) / (len(doc_idxs) + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * lengths[doc_idxs] / avg_length)
+                docs.append(doc_idxs)
+                scores.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+            if not docs:
+                return [], np.zeros(0, dtype=np.float32)
+            
+            # Sum the per-term contributions of each matching document
+            unique_docs, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+            totals = np.bincount(inverse, weights=np.concatenate(scores)).astype(np.float32)
+            if top_k is not None and len(totals) > top_k:
+                best = np.argpartition(-totals, top_k - 1)[:top_k]
+            else:
+                best = np.arange(len(totals))
+            best = best[np.argsort(-totals[best], kind="stable")]
+            return [self.doc_ids[doc] for doc in unique_docs[best]], totals[best]
+    
+    def reset(self):
+        """Forget every indexed opinion"""
+        with self._lock:
+            self.log.truncate()
+            self.doc_ids, self.docs, self.doc_terms, self.doc_lengths = [], {}, [], []
+            self.total_length = 0
+            self.postings, self._arrays = {}, {}
+    
+    def compact(self):
+        """Rewrite the log with one record per indexed opinion"""
+        with self._lock:
+            self.log.truncate()
+            self.log.append_many([{"id": opinion_id, "terms": terms}
+                                  for opinion_id, terms in zip(self.doc_ids, self.doc_terms)])
+            self.log.sync()
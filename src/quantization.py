@@ -0,0 +1,178 @@
+import numpy as np
+import json
+import os
+from src.vector_index import ExactIndex, normalize, top_k_scores
+
+MODES = ("float16", "int8", "binary")
+
+# Number of set bits in every possible byte, for Hamming distances on packed codes
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+class QuantizedIndex:
+    """Compact opinion vectors scored approximately, with exact rescoring of a shortlist.
+
+    Modes: "float16" (2 bytes/dim), "int8" with a per-dimension scale (1 byte/dim)
+    and "binary" sign codes (1 bit/dim, Hamming distance). Only the codes stay in
+    RAM; the shortlist is rescored against full-precision vectors fetched through
+    `rescore_fn(ids)`, typically the memory-mapped EmbeddingStore. Codes live in a
+    buffer that grows by doubling, so adding an opinion never copies them all.
+    """
+    def __init__(self, mode="int8", rescore_factor=10, chunk_size=65536):
+        if mode not in MODES:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+        self.rescore_factor = rescore_factor
+        self.chunk_size = chunk_size
+        self.ids = []
+        self.positions = {}
+        self._codes = None
+        self.scale = None
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    @property
+    def codes(self):
+        return None if self._codes is None else self._codes[:len(self.ids)]
+    
+    def _encode(self, vectors):
+        vectors = normalize(vectors)
+        if self.mode == "float16":
+            return vectors.astype(np.float16)
+        if self.mode == "int8":
+            return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+        return np.packbits(vectors > 0, axis=1)
+    
+    def build(self, ids, vectors):
+        """Quantize vectors chunk by chunk, so a memory-mapped input is never fully copied"""
+        self.ids = list(ids)
+        self.positions = {opinion_id: i for i, opinion_id in enumerate(self.ids)}
+        if not self.ids:
+            self._codes = None
+            return self
+        
+        if self.mode == "int8":
+            # Per-dimension scale from the largest magnitude seen in each dimension
+            max_abs = np.zeros(vectors.shape[1], dtype=np.float32)
+            for start in range(0, len(vectors), self.chunk_size):
+                chunk = normalize(vectors[start:start + self.chunk_size])
+                max_abs = np.maximum(max_abs, np.abs(chunk).max(axis=0))
+            self.scale = np.maximum(max_abs, 1e-6) / 127.0
+        
+        self._codes = np.concatenate([
+            self._encode(vectors[start:start + self.chunk_size])
+            for start in range(0, len(vectors), self.chunk_size)
+        ])
+        return self
+    
+    def add(self, ids, vectors):
+        """Add or replace vectors using the existing quantization parameters"""
+        if self.codes is None:
+            return self.build(ids, vectors)
+        codes = self._encode(vectors)
+        needed = len(self.ids) + len(ids)
+        if len(self._codes) < needed:
+            grown = np.empty((max(needed, 2 * len(self._codes)),) + self._codes.shape[1:], dtype=self._codes.dtype)
+            grown[:len(self.ids)] = self.codes
+            self._codes = grown
+        for opinion_id, code in zip(ids, codes):
+            pos = self.positions.get(opinion_id)
+            if pos is None:
+                pos = self.positions[opinion_id] = len(self.ids)
+                self.ids.append(opinion_id)
+            self._codes[pos] = code
+        return self
+    
+    def approximate_scores(self, query):
+        """Approximate similarity of the query to every stored vector (higher is closer)"""
+        query = normalize(query)
+        if self.mode == "binary":
+            packed = np.packbits(query > 0)
+            dims = len(query)
+            scores = np.empty(len(self.codes), dtype=np.float32)
+            for start in range(0, len(self.codes), self.chunk_size):
+                distance = POPCOUNT[np.bitwise_xor(self.codes[start:start + self.chunk_size], packed)].sum(axis=1)
+                scores[start:start + self.chunk_size] = 1.0 - 2.0 * distance / dims
+            return scores
+        
+        weights = query * self.scale if self.mode == "int8" else query
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), self.chunk_size):
+            # Upcast one chunk at a time so the float32 temporary stays small
+            scores[start:start + self.chunk_size] = self.codes[start:start + self.chunk_size].astype(np.float32) @ weights
+        return scores
+    
+    def search(self, query, top_k=7, threshold=None, rescore_fn=None, mask=None):
+        """Return (ids, scores): shortlist on codes, then exact scores from `rescore_fn` if given.
+
+        With a boolean `mask` over the stored positions, only masked-in vectors are candidates.
+        """
+        if self.codes is None:
+            return [], np.zeros(0, dtype=np.float32)
+        query = normalize(query)
+        approx = self.approximate_scores(query)
+        if mask is not None:
+            approx[~mask] = -np.inf
+        if rescore_fn is None:
+            best = top_k_scores(approx, top_k, -np.inf if threshold is None else threshold)
+            return [self.ids[i] for i in best], approx[best]
+        
+        shortlist = top_k_scores(approx, top_k * self.rescore_factor, threshold=-np.inf)
+        shortlist_ids = [self.ids[i] for i in shortlist]
+        exact = normalize(rescore_fn(shortlist_ids)) @ query
+        best = top_k_scores(exact, top_k, threshold)
+        return [shortlist_ids[i] for i in best], exact[best]
+    
+    def memory_bytes(self):
+        codes = self.codes.nbytes if self.codes is not None else 0
+        scale = self.scale.nbytes if self.scale is not None else 0
+        return codes + scale
+    
+    def save(self, path):
+        if self.codes is None:
+            return
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, codes=self.codes, scale=self.scale if self.scale is not None else np.zeros(0),
+                 params=np.array(json.dumps({"ids": self.ids, "mode": self.mode, "rescore_factor": self.rescore_factor})))
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            index = cls(mode=params["mode"], rescore_factor=params["rescore_factor"])
+            index._codes = data["codes"]
+            index.scale = data["scale"] if len(data["scale"]) else None
+        index.ids = params["ids"]
+        index.positions = {opinion_id: i for i, opinion_id in enumerate(index.ids)}
+        return index
+
+def quantization_report(ids, vectors, queries, top_k=7, modes=MODES, rescore_factor=10):
+    """Memory and recall@k (against exact float32 search) for each mode, with and without rescoring"""
+    ids = list(ids)
+    exact = ExactIndex().build(ids, vectors)
+    positions = {opinion_id: i for i, opinion_id in enumerate(ids)}
+    rescore_fn = lambda found: vectors[[positions[opinion_id] for opinion_id in found]]
+    exact_top = [set(exact.search(query, top_k)[0]) for query in queries]
+    
+    report = [{"mode": "float32", "bytes": int(np.asarray(vectors).nbytes), "recall": 1.0, "recall_rescored": 1.0}]
+    for mode in modes:
+        index = QuantizedIndex(mode, rescore_factor=rescore_factor).build(ids, vectors)
+        recall = []
+        recall_rescored = []
+        for query, truth in zip(queries, exact_top):
+            if not truth:
+                continue
+            recall.append(len(truth & set(index.search(query, top_k)[0])) / len(truth))
+            recall_rescored.append(len(truth & set(index.search(query, top_k, rescore_fn=rescore_fn)[0])) / len(truth))
+        report.append({
+            "mode": mode,
+            "bytes": index.memory_bytes(),
+            "recall": float(np.mean(recall)) if recall else 1.0,
+            "recall_rescored": float(np.mean(recall_rescored)) if recall_rescored else 1.0,
+        })
+    
+    for row in report:
+        row["bytes_per_vector"] = row["bytes"] / max(len(ids), 1)
+        row["compression"] = report[0]["bytes"] / max(row["bytes"], 1)
+    return report
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import threading
+from src.cache import ClassificationCache, ConclusionCache
+from src.data_processor import DataProcessor
+from src.dedup import DuplicateDetector
+from src.embedding import EmbeddingProcessor
+from src.lexical_index import BM25Index
+
+class SharedResources:
+    """Process-wide dataset, embedding model and caches shared by every app session.
+
+    Storage, embedding store and caches guard themselves with locks, so one
+    instance can serve concurrent sessions. The sentence transformer and the
+    BM25 index are only loaded by `warm_up` (in the background) or on first use.
+    """
+    def __init__(self, data_path="data", models_path="models", backend="sqlite", encoder_backend="torch"):
+        self.data_processor = DataProcessor(data_path=data_path, backend=backend)
+        self.embedding_processor = EmbeddingProcessor(cache_dir=models_path, backend=encoder_backend)
+        
+        # Keep the on-disk opinion embeddings current as comments are added
+        self.data_processor.add_opinion_listener(self.embedding_processor.on_opinion_changed)
+        
+        # Link reposts to their canonical opinion (after embedding, so the match can be confirmed by vectors)
+        self.duplicate_detector = DuplicateDetector(
+            os.path.join(data_path, "duplicates.db"), embedding_processor=self.embedding_processor
+        )
+        self.data_processor.add_opinion_listener(self.duplicate_detector.on_opinion_changed)
+        
+        # BM25 inverted index for lexical prefiltering and hybrid ranking; replaying its log grows
+        # with the corpus, so it is loaded in the background (see lexical_index)
+        self.lexical_index_path = os.path.join(data_path, "bm25.log")
+        self._lexical_index = None
+        self._lexical_thread = None
+        self._lexical_lock = threading.Lock()
+        
+        self.classification_cache = ClassificationCache(os.path.join(models_path, "classification_cache.db"))
+        self.conclusion_cache = ConclusionCache(os.path.join(models_path, "conclusion_cache.db"))
+        
+        self._gemini_clients = {}
+        self._gemini_lock = threading.Lock()
+    
+    def warm_up(self):
+        """Start loading the embedding model and the BM25 index without blocking the first page render"""
+        self._start_lexical_load()
+        return self.embedding_processor.warm_up()
+    
+    def _start_lexical_load(self):
+        with self._lexical_lock:
+            if self._lexical_thread is None:
+                self._lexical_thread = threading.Thread(target=self._load_lexical_index, daemon=True)
+                self._lexical_thread.start()
+            return self._lexical_thread
+    
+    def _load_lexical_index(self):
+        try:
+            lexical_index = BM25Index(self.lexical_index_path)
+            # Listen first, then catch up on opinions stored without listeners (bulk ingest),
+            # so nothing added meanwhile is missed
+            self.data_processor.add_opinion_listener(lexical_index.on_opinion_changed)
+            if len(lexical_index) < self.data_processor.count("opinions"):
+                opinions = self.data_processor.opinions
+                lexical_index.sync(opinions["id"].tolist(), opinions["text"].tolist())
+            self._lexical_index = lexical_index
+        except Exception as e:
+            print(f"Error loading the lexical index, using dense retrieval: {e}")
+    
+    @property
+    def lexical_index(self):
+        """The BM25Index, waiting for the background load if it is still running (None if it failed)"""
+        self._start_lexical_load().join()
+        return self._lexical_index
+    
+    def gemini_api(self, api_key):
+        """One GeminiAPI (and rate limiter) per API key, shared by every session using that key"""
+        from src.gemini_api import GeminiAPI
+        
+        key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        with self._gemini_lock:
+            if key not in self._gemini_clients:
+                self._gemini_clients[key] = GeminiAPI(api_key, cache=self.classification_cache)
+            return self._gemini_clients[key]
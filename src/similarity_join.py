@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import os
+from src.vector_index import normalize
+
+def _join_block(topic_embeddings, opinion_embeddings, opinion_rows, opinion_start, block_size, threshold):
+    """Matches for one block of opinions against all topics, one topic block at a time"""
+    if opinion_rows is None:
+        opinions = normalize(opinion_embeddings[opinion_start:opinion_start + block_size])
+    else:
+        # Only this block's rows are read from the (memory-mapped) matrix
+        opinions = normalize(opinion_embeddings[opinion_rows[opinion_start:opinion_start + block_size]])
+    topic_idxs = []
+    opinion_idxs = []
+    scores = []
+    for topic_start in range(0, len(topic_embeddings), block_size):
+        topics = topic_embeddings[topic_start:topic_start + block_size]
+        sims = opinions @ topics.T
+        rows, cols = np.nonzero(sims > threshold)
+        opinion_idxs.append(rows + opinion_start)
+        topic_idxs.append(cols + topic_start)
+        scores.append(sims[rows, cols])
+    return np.concatenate(topic_idxs), np.concatenate(opinion_idxs), np.concatenate(scores)
+
+def similarity_join(topic_embeddings, opinion_embeddings, threshold=0.85, block_size=1024, workers=None,
+                    opinion_rows=None):
+    """All topic/opinion pairs with cosine similarity above threshold, as a sparse table.
+
+    Similarities are computed in block_size x block_size tiles, so peak memory is
+    bounded by the tile size times the number of workers, not by the corpus size.
+    Opinion embeddings may be a memory-mapped array; with `opinion_rows`, opinion i
+    is row `opinion_rows[i]` of it, fetched one tile at a time.
+    """
+    topic_embeddings = normalize(topic_embeddings)
+    columns = ["topic_idx", "opinion_idx", "score"]
+    n_opinions = len(opinion_embeddings) if opinion_rows is None else len(opinion_rows)
+    if len(topic_embeddings) == 0 or n_opinions == 0:
+        return pd.DataFrame(columns=columns)
+    
+    # numpy releases the GIL inside matrix products, so threads spread the tiles across cores
+    workers = workers or os.cpu_count() or 1
+    starts = range(0, n_opinions, block_size)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(
+            lambda start: _join_block(topic_embeddings, opinion_embeddings, opinion_rows, start, block_size, threshold),
+            starts
+        ))
+    
+    return pd.DataFrame({
+        "topic_idx": np.concatenate([part[0] for part in parts]),
+        "opinion_idx": np.concatenate([part[1] for part in parts]),
+        "score": np.concatenate([part[2] for part in parts]).astype(np.float32),
+    }, columns=columns)
+
+def best_matches(pairs):
+    """Keep only the highest scoring topic for each opinion"""
+    if pairs.empty:
+        return pairs
+    best = pairs.sort_values("score", ascending=False, kind="stable").drop_duplicates("opinion_idx")
+    return best.sort_values("opinion_idx").reset_index(drop=True)
+
+def assign_topics(data_processor, embedding_processor, threshold=0.85, block_size=1024, workers=None,
+                  only_unassigned=True, write_back=True):
+    """Match opinions to their best topic and optionally store it as the opinion's topic_id.
+
+    Returns the sparse assignment table with opinion ids, topic ids and scores.
+    """
+    topics = data_processor.topics
+    opinions = data_processor.opinions
+    if only_unassigned:
+        opinions = opinions[opinions["topic_id"].isna()]
+    if topics.empty or opinions.empty:
+        return pd.DataFrame(columns=["opinion_id", "topic_id", "score"])
+    
+    # Topic rows are keyed by `id`; `topic_id` repeats across rows
+    topic_embeddings = embedding_processor.embed_topics(topics["id"].tolist(), topics["text"].tolist())
+    # Opinions are read tile by tile from the memory-mapped store, in row order for locality
+    vectors, rows = embedding_processor.embed_opinion_rows(opinions["id"].tolist(), opinions["text"].tolist())
+    order = np.argsort(rows, kind="stable")
+    
+    best = best_matches(similarity_join(topic_embeddings, vectors, threshold, block_size, workers,
+                                        opinion_rows=rows[order]))
+    assignments = pd.DataFrame({
+        "opinion_id": opinions["id"].to_numpy()[order][best["opinion_idx"].to_numpy(dtype=np.int64)],
+        "topic_id": topics["topic_id"].to_numpy()[best["topic_idx"].to_numpy(dtype=np.int64)],
+        "score": best["score"].to_numpy(),
+    })
+    
+    if write_back:
+        data_processor.update_opinions(
+            (opinion_id, {"topic_id": topic_id})
+            for opinion_id, topic_id in zip(assignments["opinion_id"], assignments["topic_id"])
+        )
+        print(f"Assigned {len(assignments)} of {len(opinions)} opinions to topics.")
+    
+    return assignments
@@ -0,0 +1,379 @@
+import pandas as pd
+import os
+import sqlite3
+import threading
+from src.table_log import TableLog
+
+TABLES = ("topics", "opinions", "conclusions")
+COLUMNS = ["id", "topic_id", "text", "type", "effectiveness"]
+
+class CSVStorage:
+    """Canonical CSV per table plus an append-only log of changes since the last compaction.
+
+    A table is compacted once its log holds `compact_every` records or `compact_ratio`
+    times its row count, whichever is larger, so rewrites stay amortized O(1) per change.
+    """
+    def __init__(self, data_path="data", compact_every=1000, fsync_every=32, compact_ratio=0.25):
+        self.data_path = data_path
+        self.compact_every = compact_every
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self.paths = {
+            "topics": os.path.join(data_path, "topics.csv"),
+            "opinions": os.path.join(data_path, "opinions.csv"),
+            "conclusions": os.path.join(data_path, "conclusions.csv"),
+        }
+        
+        # Create files if they don't exist
+        for path in self.paths.values():
+            if not os.path.exists(path):
+                pd.DataFrame(columns=COLUMNS).to_csv(path, index=False)
+        
+        self._logs = {name: TableLog(os.path.join(data_path, f"{name}.log"), fsync_every=fsync_every) for name in TABLES}
+        self._frames = {}
+        self._pending = {name: [] for name in TABLES}
+        self._dirty = set()
+        # Per-table set of ids (as strings), built on first use and kept current by inserts
+        self._ids = {name: None for name in TABLES}
+        
+        # Load data
+        for name in TABLES:
+            self._frames[name] = self._load_data(self.paths[name])
+            self._replay_log(name)
+    
+    def _load_data(self, file_path):
+        try:
+            return pd.read_csv(file_path)
+        except Exception as e:
+            print(f"Error loading {file_path}: {e}")
+            return pd.DataFrame(columns=COLUMNS)
+    
+    def _replay_log(self, name):
+        """Re-apply changes that were logged but not yet compacted into the CSV.
+
+        Inserts of ids already in the table are skipped: a crash between writing
+        the CSV and truncating the log in `compact` leaves records that are in both.
+        """
+        seen = set(self._frames[name]["id"].astype(str))
+        for record in self._logs[name].replay():
+            if record["op"] == "insert":
+                row_id = str(record["row"].get("id"))
+                if row_id in seen:
+                    continue
+                seen.add(row_id)
+                self._pending[name].append(record["row"])
+            elif record["op"] == "update":
+                self._apply_update(name, record["id"], record["fields"])
+            self._dirty.add(name)
+    
+    def frame(self, name):
+        """Full table; buffered inserts are concatenated in one go when it is read"""
+        with self._lock:
+            if self._pending[name]:
+                rows = pd.DataFrame(self._pending[name])
+                frame = self._frames[name]
+                self._frames[name] = rows if frame.empty else pd.concat([frame, rows], ignore_index=True)
+                self._pending[name] = []
+            return self._frames[name]
+    
+    def replace(self, name, df):
+        with self._lock:
+            self._frames[name] = df
+            self._pending[name] = []
+            self._ids[name] = None
+            self._dirty.add(name)
+    
+    def count(self, name):
+        with self._lock:
+            return len(self._frames[name]) + len(self._pending[name])
+    
+    def find(self, name, column, value):
+        with self._lock:
+            frame = self.frame(name)
+            return frame[frame[column] == value]
+    
+    def _id_set(self, name):
+        if self._ids[name] is None:
+            frame = self._frames[name]
+            self._ids[name] = set(frame["id"].astype(str)) | {str(row.get("id")) for row in self._pending[name]}
+        return self._ids[name]
+    
+    def _add_ids(self, name, rows):
+        if self._ids[name] is not None:
+            self._ids[name].update(str(row.get("id")) for row in rows)
+    
+    def existing_ids(self, name, ids):
+        """Subset of `ids` that are already stored, from the in-memory id set (no frame rebuild)"""
+        with self._lock:
+            stored = self._id_set(name)
+            return {row_id for row_id in ids if str(row_id) in stored}
+    
+    def _apply_update(self, name, row_id, fields):
+        frame = self.frame(name)
+        row_idx = frame[frame["id"] == row_id].index
+        if len(row_idx) == 0:
+            return None
+        for column, value in fields.items():
+            # Columns read from CSV may be all-NaN floats; widen before storing strings
+            if frame[column].dtype != object:
+                frame[column] = frame[column].astype(object)
+            frame.loc[row_idx[0], column] = value
+        return frame.loc[row_idx[0]].to_dict()
+    
+    def insert(self, name, row):
+        """Log and buffer a new row: O(1) amortized, no CSV rewrite"""
+        with self._lock:
+            self._logs[name].append({"op": "insert", "row": row})
+            self._pending[name].append(row)
+            self._add_ids(name, [row])
+            self._dirty.add(name)
+            self._maybe_compact(name)
+    
+    def insert_many(self, name, rows):
+        """Log and buffer several rows with one log write"""
+        with self._lock:
+            self._logs[name].append_many([{"op": "insert", "row": row} for row in rows])
+            self._pending[name].extend(rows)
+            self._add_ids(name, rows)
+            self._dirty.add(name)
+            self._maybe_compact(name)
+    
+    def update(self, name, row_id, fields):
+        """Update one row by id; returns the updated row as a dict, or None if it does not exist"""
+        with self._lock:
+            row = self._apply_update(name, row_id, fields)
+            if row is not None:
+                self._logs[name].append({"op": "update", "id": row_id, "fields": fields})
+                self._dirty.add(name)
+                self._maybe_compact(name)
+            return row
+    
+    def update_many(self, name, updates):
+        """Update several rows by (id, fields) with one log write; returns the updated rows as dicts"""
+        with self._lock:
+            frame = self.frame(name)
+            # First row per id, as in update
+            positions = {}
+            for idx, row_id in zip(frame.index, frame["id"]):
+                positions.setdefault(row_id, idx)
+            
+            records = []
+            rows = []
+            for row_id, fields in updates:
+                idx = positions.get(row_id)
+                if idx is None:
+                    continue
+                for column, value in fields.items():
+                    if frame[column].dtype != object:
+                        frame[column] = frame[column].astype(object)
+                    frame.at[idx, column] = value
+                records.append({"op": "update", "id": row_id, "fields": fields})
+                rows.append(frame.loc[idx].to_dict())
+            if records:
+                self._logs[name].append_many(records)
+                self._dirty.add(name)
+                self._maybe_compact(name)
+            return rows
+    
+    def _maybe_compact(self, name):
+        if self._logs[name].records >= max(self.compact_every, self.compact_ratio * self.count(name)):
+            self.compact([name])
+    
+    def flush(self):
+        """fsync every table log"""
+        with self._lock:
+            for log in self._logs.values():
+                log.sync()
+    
+    def compact(self, names=None):
+        """Rewrite the CSVs of changed tables and truncate their logs"""
+        with self._lock:
+            for name in (names or TABLES):
+                if name not in self._dirty:
+                    continue
+                path = self.paths[name]
+                tmp_path = path + ".tmp"
+                self.frame(name).to_csv(tmp_path, index=False)
+                os.replace(tmp_path, path)
+                self._logs[name].truncate()
+                self._dirty.discard(name)
+
+class SQLiteStorage:
+    """Embedded SQLite store with indexes on id and topic_id.
+    
+    Point lookups go through the indexes and nothing is loaded at startup;
+    full tables are only read (and cached) when a caller asks for one.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._frames = {}
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        for name in TABLES:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} (id TEXT, topic_id TEXT, text TEXT, type TEXT, effectiveness TEXT)"
+            )
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_topic_id ON {name} (topic_id)")
+            try:
+                self.conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_id_unique ON {name} (id)")
+                # Replaced by the unique index in databases created before it existed
+                self.conn.execute(f"DROP INDEX IF EXISTS {name}_id")
+            except sqlite3.IntegrityError:
+                print(f"Table {name} has duplicate ids; keeping its non-unique id index.")
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_id ON {name} (id)")
+        self.conn.commit()
+    
+    @staticmethod
+    def _values(row):
+        values = []
+        for column in COLUMNS:
+            value = row.get(column)
+            values.append(None if value is None or value != value else str(value))
+        return values
+    
+    def _query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self.conn, params=params)
+    
+    def frame(self, name):
+        with self._lock:
+            if name not in self._frames:
+                self._frames[name] = self._query(f"SELECT {', '.join(COLUMNS)} FROM {name} ORDER BY rowid")
+            return self._frames[name]
+    
+    def replace(self, name, df):
+        with self._lock:
+            self.conn.execute(f"DELETE FROM {name}")
+            self.insert_many(name, df.to_dict("records"))
+    
+    def count(self, name):
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+    
+    def find(self, name, column, value):
+        if column not in COLUMNS:
+            raise ValueError(f"Unknown column: {column}")
+        return self._query(f"SELECT {', '.join(COLUMNS)} FROM {name} WHERE {column} = ? ORDER BY rowid", (value,))
+    
+    def existing_ids(self, name, ids):
+        """Subset of `ids` that are already stored, answered from the id index"""
+        ids = list(ids)
+        found = set()
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT id FROM {name} WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+    
+    def insert(self, name, row):
+        self.insert_many(name, [row])
+    
+    def insert_many(self, name, rows):
+        with self._lock:
+            self.conn.executemany(
+                f"INSERT INTO {name} ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                [self._values(row) for row in rows],
+            )
+            self.conn.commit()
+            self._frames.pop(name, None)
+    
+    def update(self, name, row_id, fields):
+        """Update one row by id; returns the updated row as a dict, or None if it does not exist"""
+        columns = [column for column in fields if column in COLUMNS]
+        with self._lock:
+            cursor = self.conn.execute(
+                f"UPDATE {name} SET {', '.join(f'{column} = ?' for column in columns)} "
+                f"WHERE rowid = (SELECT rowid FROM {name} WHERE id = ? LIMIT 1)",
+                [fields[column] for column in columns] + [row_id],
+            )
+            self.conn.commit()
+            if cursor.rowcount == 0:
+                return None
+            self._frames.pop(name, None)
+        rows = self.find(name, "id", row_id)
+        return rows.iloc[0].to_dict()
+    
+    def update_many(self, name, updates):
+        """Update several rows by (id, fields) in one transaction; returns the updated rows as dicts"""
+        updated = []
+        with self._lock:
+            for row_id, fields in updates:
+                columns = [column for column in fields if column in COLUMNS]
+                cursor = self.conn.execute(
+                    f"UPDATE {name} SET {', '.join(f'{column} = ?' for column in columns)} "
+                    f"WHERE rowid = (SELECT rowid FROM {name} WHERE id = ? LIMIT 1)",
+                    [fields[column] for column in columns] + [row_id],
+                )
+                if cursor.rowcount:
+                    updated.append(row_id)
+            self.conn.commit()
+            self._frames.pop(name, None)
+        
+        rows = {}
+        for start in range(0, len(updated), 500):
+            chunk = updated[start:start + 500]
+            found = self._query(
+                f"SELECT {', '.join(COLUMNS)} FROM {name} WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY rowid", chunk
+            )
+            for row in found.to_dict("records"):
+                rows.setdefault(row["id"], row)
+        return [rows[row_id] for row_id in updated if row_id in rows]
+    
+    def flush(self):
+        with self._lock:
+            self.conn.commit()
+    
+    def compact(self, names=None):
+        self.flush()
+    
+    def is_imported(self):
+        """Whether import_csv ran to completion on this database"""
+        with self._lock:
+            return self.conn.execute("SELECT value FROM meta WHERE key = 'csv_imported'").fetchone() is not None
+    
+    def import_csv(self, data_path="data", chunksize=10000):
+        """One-shot import of data/*.csv (plus any un-compacted logs) into empty tables.
+
+        Everything, including the completion flag, is written in one transaction,
+        so an interrupted import leaves empty tables and is redone on the next start.
+        """
+        csv_storage = CSVStorage(data_path)
+        with self._lock:
+            try:
+                for name in TABLES:
+                    if self.count(name):
+                        print(f"Skipping import of {name}: table is not empty.")
+                        continue
+                    frame = csv_storage.frame(name)
+                    # The unique id index already exists, so repeated ids are skipped (first row wins) and reported
+                    duplicated = frame["id"].notna() & frame["id"].astype(str).duplicated()
+                    if duplicated.any():
+                        print(f"Skipping {int(duplicated.sum())} rows of {name} with a repeated id: "
+                              f"{sorted(set(frame.loc[duplicated, 'id'].astype(str)))[:10]}")
+                        frame = frame[~duplicated].reset_index(drop=True)
+                    for start in range(0, len(frame), chunksize):
+                        self.conn.executemany(
+                            f"INSERT INTO {name} ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                            [self._values(row) for row in frame.iloc[start:start + chunksize].to_dict("records")],
+                        )
+                    self._frames.pop(name, None)
+                    print(f"Imported {len(frame)} rows into {name}.")
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('csv_imported', '1')")
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+    
+    def export_csv(self, data_path="data"):
+        """Write every table back out as data/<table>.csv"""
+        for name in TABLES:
+            path = os.path.join(data_path, f"{name}.csv")
+            self.frame(name).to_csv(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
@@ -0,0 +1,73 @@
+import json
+import os
+import time
+
+class TableLog:
+    """Append-only JSON lines log of changes to one table.
+    
+    Each record is written and flushed to the OS immediately; fsync is batched
+    every `fsync_every` records or `fsync_interval` seconds, whichever comes first.
+    """
+    def __init__(self, path, fsync_every=32, fsync_interval=1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.file = None
+        self.records = 0
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+    
+    def replay(self):
+        """Yield every complete record in the log, skipping a torn trailing line"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.records += 1
+                yield record
+    
+    def append(self, record):
+        """Append one record to the log"""
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(json.dumps(record, default=str) + "\n")
+        self.file.flush()
+        self.records += 1
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+    
+    def append_many(self, records):
+        """Append several records with a single flush"""
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.writelines(json.dumps(record, default=str) + "\n" for record in records)
+        self.file.flush()
+        self.records += len(records)
+        self.unsynced += len(records)
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+    
+    def sync(self):
+        """fsync any records written since the last sync"""
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+    
+    def truncate(self):
+        """Empty the log once its records are in the canonical CSV"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.records = 0
+    
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
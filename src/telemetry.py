@@ -0,0 +1,254 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+PREFIX = "digitalpulse_"
+
+# Histogram buckets by metric unit (metric names end in _seconds or _chars)
+BUCKETS = {
+    "seconds": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    "chars": (256, 1024, 4096, 16384, 65536, 262144),
+}
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = [(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class _NoopSpan:
+    """Returned by `span` while telemetry is disabled; does nothing"""
+    records = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def set(self, **attrs):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """One timed stage. The root span of a trace collects every finished span in `records`."""
+    def __init__(self, telemetry, name, parent, attrs):
+        self.telemetry = telemetry
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.trace_id = self.root.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.records = []
+        self.start = None
+    
+    def set(self, **attrs):
+        """Attach attributes (counts, cache hits, ...) to the span"""
+        self.attrs.update(attrs)
+    
+    def __enter__(self):
+        self.telemetry._push(self)
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.telemetry._pop(self)
+        self.telemetry._finish(self, duration, exc)
+        return False
+
+class Telemetry:
+    """Tracing spans, counters and histograms for the analysis stages.
+
+    Disabled by default; then `span` returns a shared no-op object and the
+    metric calls return immediately. When enabled, every finished span is
+    recorded in the `stage_seconds` histogram, appended to its trace and, with
+    a `log_path`, written as one JSON line. Metrics export in Prometheus text
+    format via `prometheus_text` / `write_prometheus`.
+    """
+    def __init__(self, enabled=False, log_path=None):
+        self.enabled = False
+        self.log_path = None
+        self._log_file = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {}
+        self.histograms = {}
+        if enabled:
+            self.enable(log_path)
+    
+    def enable(self, log_path=None):
+        """Start recording; spans are also logged as JSON lines to `log_path` if given"""
+        with self._lock:
+            if log_path and log_path != self.log_path:
+                if self._log_file is not None:
+                    self._log_file.close()
+                os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+                self._log_file = open(log_path, "a", encoding="utf-8", buffering=1)
+                self.log_path = log_path
+            self.enabled = True
+    
+    def disable(self):
+        with self._lock:
+            self.enabled = False
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+                self.log_path = None
+    
+    def reset(self):
+        """Drop all recorded metrics"""
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+    
+    # Spans
+    
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+    
+    def _push(self, span):
+        self._stack().append(span)
+    
+    def _pop(self, span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+    
+    def current_span(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+    
+    def span(self, name, **attrs):
+        """Context manager timing one stage, nested under the current span of this thread"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, self.current_span(), attrs)
+    
+    def traced(self, name):
+        """Decorator running the function inside a span"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapped(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapped
+        return decorator
+    
+    def wrap(self, fn):
+        """Run `fn` (e.g. in a worker thread) with the caller's current span as parent"""
+        if not self.enabled:
+            return fn
+        parent = self.current_span()
+        
+        def wrapped(*args, **kwargs):
+            stack = self._stack()
+            if parent is not None:
+                stack.append(parent)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if parent is not None and stack and stack[-1] is parent:
+                    stack.pop()
+        return wrapped
+    
+    def _finish(self, span, duration, error):
+        record = {
+            "trace": span.trace_id,
+            "span": span.name,
+            "parent": span.parent.name if span.parent is not None else None,
+            "ms": round(duration * 1000.0, 3),
+            "thread": threading.current_thread().name,
+        }
+        record.update(span.attrs)
+        if error is not None:
+            record["error"] = type(error).__name__
+            self.incr("stage_errors_total", stage=span.name)
+        span.root.records.append(record)
+        self.observe("stage_seconds", duration, stage=span.name)
+        if self._log_file is not None:
+            record = dict(record, ts=time.time())
+            with self._lock:
+                if self._log_file is not None:
+                    self._log_file.write(json.dumps(record, default=str) + "\n")
+    
+    # Metrics
+    
+    def incr(self, name, value=1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram (latencies end in _seconds, sizes in _chars)"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                bounds = BUCKETS["seconds"] if name.endswith("_seconds") else BUCKETS["chars"]
+                histogram = self.histograms[key] = {"bounds": bounds, "buckets": [0] * len(bounds), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(histogram["bounds"]):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+    
+    def snapshot(self):
+        """Counters and histogram count/sum as plain dicts, for display"""
+        with self._lock:
+            counters = {(name, key): value for (name, key), value in self.counters.items()}
+            histograms = {(name, key): (h["count"], h["sum"]) for (name, key), h in self.histograms.items()}
+        return counters, histograms
+    
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for (metric, key), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{PREFIX}{name}{_format_labels(key)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (metric, key), h in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(h["bounds"], h["buckets"]):
+                        lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, [('le', str(bound))])} {count}")
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, [('le', '+Inf')])} {h['count']}")
+                    lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {h['sum']}")
+                    lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {h['count']}")
+        return "\n".join(lines) + "\n"
+    
+    def write_prometheus(self, path):
+        """Write the metrics file atomically (e.g. for the node exporter textfile collector)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+# Process-wide instance used by every module; enabled with DIGITALPULSE_TELEMETRY=1
+telemetry = Telemetry(
+    enabled=os.environ.get("DIGITALPULSE_TELEMETRY", "") not in ("", "0", "false"),
+    log_path=os.environ.get("DIGITALPULSE_TRACE_LOG") or None,
+)
@@ -0,0 +1,239 @@
+import numpy as np
+import json
+import os
+
+def normalize(vectors):
+    """L2-normalize rows as float32 so a dot product equals cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        return vectors / max(float(np.linalg.norm(vectors)), 1e-12)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def top_k_scores(scores, top_k=None, threshold=None):
+    """Indices of the best scores above threshold, highest first, without a full sort"""
+    scores = np.asarray(scores)
+    if threshold is not None:
+        candidates = np.flatnonzero(scores > threshold)
+    else:
+        candidates = np.arange(len(scores))
+    
+    if top_k is not None and len(candidates) > top_k:
+        part = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+        candidates = candidates[part]
+    
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+def kmeans(vectors, n_clusters, n_iter=20, seed=0):
+    """Spherical k-means on normalized vectors; returns (centroids, assignments)"""
+    vectors = normalize(vectors)
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, min(n_clusters, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+    for iteration in range(n_iter):
+        new_assignments = np.argmax(vectors @ centroids.T, axis=1)
+        if iteration > 0 and np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+        for c in range(n_clusters):
+            members = vectors[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters from a random point
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = normalize(centroids)
+    
+    return centroids, assignments
+
+class ExactIndex:
+    """Brute-force top-k index: one normalized matrix-vector product plus partial selection"""
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+        self.vectors = None
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def build(self, ids, vectors):
+        self.ids = list(ids)
+        self.positions = {opinion_id: i for i, opinion_id in enumerate(self.ids)}
+        self.vectors = normalize(vectors) if len(self.ids) else None
+        return self
+    
+    def add(self, ids, vectors):
+        """Add or replace vectors for the given ids"""
+        vectors = normalize(vectors)
+        new_ids = []
+        new_vectors = []
+        for opinion_id, vector in zip(ids, vectors):
+            pos = self.positions.get(opinion_id)
+            if pos is None:
+                self.positions[opinion_id] = len(self.ids) + len(new_ids)
+                new_ids.append(opinion_id)
+                new_vectors.append(vector)
+            else:
+                self.vectors[pos] = vector
+        if new_ids:
+            self.ids.extend(new_ids)
+            stacked = np.vstack(new_vectors)
+            self.vectors = stacked if self.vectors is None else np.vstack([self.vectors, stacked])
+    
+    def search(self, query, top_k=7, threshold=None):
+        """Return (ids, scores) of the nearest vectors, best first"""
+        if self.vectors is None:
+            return [], np.zeros(0, dtype=np.float32)
+        scores = self.vectors @ normalize(query)
+        best = top_k_scores(scores, top_k, threshold)
+        return [self.ids[i] for i in best], scores[best]
+
+class IVFIndex:
+    """Approximate inverted-file index.
+    
+    Vectors are bucketed under their nearest k-means centroid; a query only
+    scores the members of its `n_probe` nearest buckets. Vectors live in a
+    buffer that grows by doubling and bucket member lists are appended to, so
+    adding an opinion never copies the whole index.
+    """
+    def __init__(self, n_lists=None, n_probe=8, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids = None
+        self.ids = []
+        self.positions = {}
+        self._vectors = None
+        self._assignments = None
+        self.lists = []       # bucket -> member positions
+        self._arrays = {}     # bucket -> member positions as an array, until the bucket changes
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    @property
+    def vectors(self):
+        return None if self._vectors is None else self._vectors[:len(self.ids)]
+    
+    @property
+    def assignments(self):
+        return None if self._assignments is None else self._assignments[:len(self.ids)]
+    
+    def build(self, ids, vectors):
+        """Train the coarse quantizer and bucket every vector"""
+        self.ids = list(ids)
+        self.positions = {opinion_id: i for i, opinion_id in enumerate(self.ids)}
+        if not self.ids:
+            return self
+        
+        self._vectors = normalize(vectors)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(self.ids))))
+        self.centroids, self._assignments = kmeans(self._vectors, n_lists, seed=self.seed)
+        self.n_lists = len(self.centroids)
+        self._rebuild_lists()
+        return self
+    
+    def _rebuild_lists(self):
+        self.lists = [[] for _ in range(len(self.centroids))]
+        for pos, bucket in enumerate(self.assignments.tolist()):
+            self.lists[bucket].append(pos)
+        self._arrays = {}
+    
+    def _list_array(self, bucket):
+        array = self._arrays.get(bucket)
+        if array is None:
+            array = self._arrays[bucket] = np.asarray(self.lists[bucket], dtype=np.int64)
+        return array
+    
+    def _grow(self, needed):
+        """Grow the vector and assignment buffers (by doubling) to hold `needed` rows"""
+        capacity = len(self._vectors)
+        if capacity >= needed:
+            return
+        capacity = max(needed, capacity * 2)
+        vectors = np.empty((capacity, self._vectors.shape[1]), dtype=np.float32)
+        assignments = np.empty(capacity, dtype=np.int64)
+        vectors[:len(self.ids)] = self.vectors
+        assignments[:len(self.ids)] = self.assignments
+        self._vectors, self._assignments = vectors, assignments
+    
+    def add(self, ids, vectors):
+        """Incrementally add or replace vectors without retraining centroids"""
+        vectors = normalize(vectors)
+        if self.centroids is None:
+            self.build(list(self.ids) + list(ids),
+                       vectors if self.vectors is None else np.vstack([self.vectors, vectors]))
+            return
+        
+        buckets = np.argmax(vectors @ self.centroids.T, axis=1).tolist()
+        self._grow(len(self.ids) + len(ids))
+        for opinion_id, vector, bucket in zip(ids, vectors, buckets):
+            pos = self.positions.get(opinion_id)
+            if pos is None:
+                pos = self.positions[opinion_id] = len(self.ids)
+                self.ids.append(opinion_id)
+            else:
+                previous = int(self._assignments[pos])
+                if previous == bucket:
+                    self._vectors[pos] = vector
+                    continue
+                self.lists[previous].remove(pos)
+                self._arrays.pop(previous, None)
+            self._vectors[pos] = vector
+            self._assignments[pos] = bucket
+            self.lists[bucket].append(pos)
+            self._arrays.pop(bucket, None)
+    
+    def search(self, query, top_k=7, threshold=None, n_probe=None, mask=None):
+        """Return (ids, scores) of the approximate nearest vectors, best first.
+
+        With a boolean `mask` over the stored positions, only masked-in vectors are candidates.
+        """
+        if self.centroids is None:
+            return [], np.zeros(0, dtype=np.float32)
+        query = normalize(query)
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        probe = top_k_scores(self.centroids @ query, n_probe)
+        candidates = np.concatenate([self._list_array(c) for c in probe])
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        scores = self.vectors[candidates] @ query
+        best = top_k_scores(scores, top_k, threshold)
+        return [self.ids[i] for i in candidates[best]], scores[best]
+    
+    def save(self, path):
+        """Save the index to a .npz file"""
+        if self.centroids is None:
+            return
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, vectors=self.vectors,
+                 assignments=self.assignments,
+                 params=np.array(json.dumps({"ids": self.ids, "n_probe": self.n_probe, "seed": self.seed})))
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        """Load an index written by `save`"""
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            index = cls(n_lists=len(data["centroids"]), n_probe=params["n_probe"], seed=params["seed"])
+            index.centroids = data["centroids"]
+            index._vectors = data["vectors"]
+            index._assignments = data["assignments"]
+        index.ids = params["ids"]
+        index.positions = {opinion_id: i for i, opinion_id in enumerate(index.ids)}
+        index._rebuild_lists()
+        return index
+
+def recall_at_k(approx_index, exact_index, queries, top_k=7):
+    """Average fraction of the exact top-k ids that the approximate index also returns"""
+    recalls = []
+    for query in queries:
+        exact_ids, _ = exact_index.search(query, top_k)
+        if not exact_ids:
+            continue
+        approx_ids, _ = approx_index.search(query, top_k)
+        recalls.append(len(set(exact_ids) & set(approx_ids)) / len(exact_ids))
+    return float(np.mean(recalls)) if recalls else 1.0
@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+from src.vector_index import normalize
+
+@pytest.fixture
+def make_vectors():
+    """Factory for (ids, normalized vectors, means): noisy points around `centers` random
+    unit means, or plain random directions (and means None) without centers."""
+    def make(n=400, dim=32, centers=None, noise=0.05, seed=0):
+        rng = np.random.default_rng(seed)
+        ids = [f"o{i}" for i in range(n)]
+        if centers is None:
+            return ids, normalize(rng.normal(size=(n, dim))), None
+        means = normalize(rng.normal(size=(centers, dim)))
+        labels = rng.integers(0, centers, n)
+        return ids, normalize(means[labels] + noise * rng.normal(size=(n, dim))), means
+    return make
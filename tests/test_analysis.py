@@ -0,0 +1,61 @@
+import os
+import pytest
+from src.analysis import TopicAnalyzer
+from src.data_processor import DataProcessor
+from src.embedding import EmbeddingProcessor
+from src.fakes import FakeEmbeddingModel
+from src.lexical_index import BM25Index
+
+@pytest.fixture
+def analyzer_for(tmp_path):
+    data_processor = DataProcessor(str(tmp_path), backend="csv")
+    embedding_processor = EmbeddingProcessor(model_name="fake", cache_dir=str(tmp_path / "models"),
+                                             model=FakeEmbeddingModel())
+    lexical_index = BM25Index(os.path.join(str(tmp_path), "bm25.log"))
+    data_processor.add_opinion_listener(lexical_index.on_opinion_changed)
+    for text in ("remote work improves productivity for developers",
+                 "remote work saves commuting time every day",
+                 "public transport should be free in every city",
+                 "cats are better pets than dogs"):
+        data_processor.add_opinion(text)
+    
+    def build(retrieval, threshold=0.3):
+        return TopicAnalyzer(data_processor, embedding_processor, top_k=3, threshold=threshold,
+                             lexical_index=lexical_index, retrieval=retrieval)
+    return build
+
+@pytest.mark.parametrize("retrieval", ["dense", "prefilter", "hybrid"])
+def test_related_opinions_modes_find_matching_opinions(analyzer_for, retrieval):
+    related = analyzer_for(retrieval).related_opinions("remote work productivity")
+    assert related
+    assert related[0]["text"] == "remote work improves productivity for developers"
+    assert all("remote work" in opinion["text"] for opinion in related)
+
+def test_keyword_matches_need_only_the_lexical_cosine_floor(analyzer_for):
+    # About 0.7 cosine: below the dense threshold, above lexical_min_cosine
+    assert analyzer_for("dense", threshold=0.85).related_opinions("remote work productivity") == []
+    for retrieval in ("hybrid", "prefilter"):
+        related = analyzer_for(retrieval, threshold=0.85).related_opinions("remote work productivity")
+        assert related[0]["text"] == "remote work improves productivity for developers"
+
+def test_hybrid_keeps_a_minimum_similarity(analyzer_for):
+    # One shared word but far below lexical_min_cosine: nothing is related
+    assert analyzer_for("hybrid", threshold=0.9).related_opinions("remote islands and volcanoes") == []
+
+def test_hybrid_reports_both_scores(analyzer_for):
+    related = analyzer_for("hybrid").related_opinions("remote work productivity")
+    assert related[0]["lexical_score"] > 0
+    assert related[0]["dense_score"] >= 0.3
+
+def test_dense_retrieval_uses_a_built_ivf_index(analyzer_for, monkeypatch):
+    analyzer = analyzer_for("dense")
+    exact = analyzer.related_opinions("remote work productivity")
+    opinions = analyzer.data_processor.opinions
+    analyzer.embedding_processor.build_index(opinions["id"].tolist(), opinions["text"].tolist(), n_lists=2, n_probe=2)
+    
+    searched = []
+    search = analyzer.embedding_processor.ann_index.search
+    monkeypatch.setattr(analyzer.embedding_processor.ann_index, "search",
+                        lambda *args, **kwargs: searched.append(1) or search(*args, **kwargs))
+    assert [o["id"] for o in analyzer.related_opinions("remote work productivity")] == [o["id"] for o in exact]
+    assert searched
@@ -0,0 +1,56 @@
+import pytest
+from src.batch import BatchAnalyzer
+from src.data_processor import DataProcessor
+from src.embedding import EmbeddingProcessor
+from src.fakes import FakeEmbeddingModel, FakeGenerativeModel
+from src.gemini_api import GeminiAPI
+from src.rate_limiter import TokenBucket
+
+TEXTS = ["remote work improves productivity", "public transport should be free", "cats are better pets than dogs",
+         "school uniforms limit expression", "video games teach problem solving", "homework should be optional",
+         "cities need more bike lanes", "nuclear power is clean energy", "phones distract students in class",
+         "zoos protect endangered species"]
+
+@pytest.fixture
+def batch_for(tmp_path):
+    # Ten topic rows; r2/r3 and r6/r7 share a topic_id
+    topic_ids = ["T0", "T1", "T1", "T2", "T3", "T4", "T5", "T5", "T6", "T7"]
+    rows = "\n".join(f"r{i},{topic_id},{text},," for i, (topic_id, text) in enumerate(zip(topic_ids, TEXTS), start=1))
+    (tmp_path / "topics.csv").write_text("id,topic_id,text,type,effectiveness\n" + rows + "\n")
+    data_processor = DataProcessor(str(tmp_path), backend="csv")
+    data_processor.add_opinions([{"id": f"o{i}", "text": text} for i, text in enumerate(TEXTS)], notify=False)
+    embedding_processor = EmbeddingProcessor(model_name="fake", cache_dir=str(tmp_path / "models"),
+                                             model=FakeEmbeddingModel())
+    gemini_api = GeminiAPI(None, model=FakeGenerativeModel(latency=0.0),
+                           rate_limiter=TokenBucket(rate=1000.0, capacity=100))
+    
+    def build():
+        # A new analyzer per run, like a restarted `cli.py analyze`
+        return BatchAnalyzer(data_processor, embedding_processor, gemini_api, workers=2, chunk_size=4, threshold=0.9)
+    return build
+
+def test_interrupted_run_resumes_every_topic_row(batch_for):
+    first = batch_for().run(limit=3)
+    assert first["processed"] == 3
+    
+    second = batch_for().run()
+    assert second["skipped"] == 3
+    assert second["processed"] == 7
+    assert batch_for().completed_topics() == {f"r{i}" for i in range(1, 11)}
+
+def test_failed_topic_is_retried_on_the_next_run(batch_for, monkeypatch):
+    batch = batch_for()
+    conclude = batch.analyzer.conclude
+    def flaky(topic_text, *args, **kwargs):
+        if topic_text == TEXTS[2]:
+            raise RuntimeError("interrupted")
+        return conclude(topic_text, *args, **kwargs)
+    monkeypatch.setattr(batch.analyzer, "conclude", flaky)
+    summary = batch.run()
+    assert summary["concluded"] == 9
+    assert "r3" not in batch_for().completed_topics()
+    
+    resumed = batch_for().run()
+    assert resumed["processed"] == 1
+    assert resumed["concluded"] == 1
+    assert len(batch_for().completed_topics()) == 10
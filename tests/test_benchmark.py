@@ -0,0 +1,40 @@
+import pytest
+from src.benchmark import STAGES, compare_results, run_suite, scaled_corpus
+
+@pytest.fixture
+def source_path(tmp_path):
+    header = "id,topic_id,text,type,effectiveness\n"
+    (tmp_path / "topics.csv").write_text(header + "".join(
+        f"t{i},T{i % 3},topic {i} about public transport and remote work,Position,Adequate\n" for i in range(6)
+    ))
+    (tmp_path / "conclusions.csv").write_text(header + "".join(
+        f"c{i},T{i % 3},conclusion {i} on cities and commuting,Concluding Statement,Effective\n" for i in range(4)
+    ))
+    return str(tmp_path)
+
+def test_scaled_corpus_keeps_ids_unique(source_path):
+    topics, opinions = scaled_corpus(source_path, scale=3)
+    assert len(topics) == 18
+    assert len(opinions) == 30
+    assert topics["id"].is_unique
+    assert opinions["id"].is_unique
+    assert topics["topic_id"].nunique() == 9
+    assert topics["text"].nunique() == 18
+
+def test_run_suite_scales_on_sqlite(source_path):
+    results = run_suite(source_path, scale=2, backend="sqlite", queries=3)
+    assert set(results) == set(STAGES)
+    assert results["data.load"]["items"] == 12 + 20
+
+def _results(**p50_ms):
+    return {"results": {stage: {"p50_ms": ms} for stage, ms in p50_ms.items()}}
+
+def test_compare_results_flags_regressions_beyond_tolerance():
+    baseline = _results(**{"data.load": 10.0, "retrieve.exact": 2.0, "retrieve.ivf": 1.0})
+    current = _results(**{"data.load": 11.0, "retrieve.exact": 3.0, "analysis.flow": 5.0})
+    rows = {row["stage"]: row for row in compare_results(baseline, current, tolerance=0.2)}
+    # Stages missing on either side are skipped
+    assert set(rows) == {"data.load", "retrieve.exact"}
+    assert rows["data.load"]["ratio"] == pytest.approx(1.1)
+    assert not rows["data.load"]["regression"]
+    assert rows["retrieve.exact"]["regression"]
@@ -0,0 +1,31 @@
+from src.cache import ClassificationCache, ConclusionCache, conclusion_fingerprint
+
+def test_classification_cache_is_keyed_by_model_and_prompt(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "c.db"))
+    cache.put_many("model", "v1", ["a", "b"], ["Claim", "Evidence"])
+    assert cache.get_many("model", "v1", ["a", "b", "c"]) == {"a": "Claim", "b": "Evidence"}
+    assert cache.get_many("model", "v2", ["a"]) == {}
+    assert cache.get_many("other", "v1", ["a"]) == {}
+
+def test_classification_cache_evicts_least_recently_used(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "c.db"), max_entries=2)
+    cache.put_many("model", "v1", ["a", "b"], ["Claim", "Claim"])
+    cache.conn.execute("UPDATE classifications SET last_used = 0 WHERE category = 'Claim'")
+    cache.get_many("model", "v1", ["a"])
+    cache.put_many("model", "v1", ["c"], ["Rebuttal"])
+    assert len(cache) == 2
+    assert set(cache.get_many("model", "v1", ["a", "b", "c"])) == {"a", "c"}
+
+def test_conclusion_fingerprint_depends_on_every_input():
+    base = conclusion_fingerprint("topic", ["1", "2"], ["Claim", "Evidence"], "model", "v1")
+    assert base == conclusion_fingerprint("topic", ["1", "2"], ["Claim", "Evidence"], "model", "v1")
+    assert base != conclusion_fingerprint("topic", ["2", "1"], ["Claim", "Evidence"], "model", "v1")
+    assert base != conclusion_fingerprint("topic", ["1", "2"], ["Claim", "Claim"], "model", "v1")
+    assert base != conclusion_fingerprint("topic", ["1", "2"], ["Claim", "Evidence"], "model", "v2")
+
+def test_conclusion_cache_expires_entries(tmp_path):
+    cache = ConclusionCache(str(tmp_path / "c.db"), ttl=60)
+    cache.put("fp", "conclusion")
+    assert cache.get("fp") == "conclusion"
+    cache.conn.execute("UPDATE conclusions SET created = 0")
+    assert cache.get("fp") is None
@@ -0,0 +1,61 @@
+import numpy as np
+from src.clustering import OpinionClusterer
+from src.vector_index import normalize
+
+def test_build_groups_similar_opinions(tmp_path, make_vectors):
+    ids, vectors, means = make_vectors(centers=8)
+    clusterer = OpinionClusterer(str(tmp_path / "clusters")).build(ids, vectors, n_clusters=8)
+    assert len(clusterer) == 8
+    assert sum(row["size"] for row in clusterer.stats()) == len(ids)
+    # The members of the nearest cluster to a center are close to it
+    members = clusterer.candidates(means[0], n_probe=1)
+    assert members and np.all(vectors[[int(i[1:]) for i in members]] @ means[0] > 0.8)
+
+def test_save_and_load_keep_clusters_and_settings(tmp_path, make_vectors):
+    ids, vectors, _ = make_vectors(centers=8)
+    cluster_dir = str(tmp_path / "clusters")
+    clusterer = OpinionClusterer(cluster_dir, spawn_threshold=0.3, max_clusters=50).build(ids, vectors, n_clusters=8)
+    clusterer.partial_fit(["new"], vectors[:1])
+    clusterer.save()
+    
+    reloaded = OpinionClusterer(cluster_dir)
+    assert len(reloaded) == len(clusterer)
+    assert reloaded.assignments == clusterer.assignments
+    assert np.allclose(reloaded.centroids, clusterer.centroids)
+    assert (reloaded.spawn_threshold, reloaded.max_clusters) == (0.3, 50)
+
+def test_partial_fit_spawns_cluster_for_new_subject(tmp_path, make_vectors):
+    ids, vectors, _ = make_vectors(centers=8)
+    clusterer = OpinionClusterer(str(tmp_path / "clusters"), spawn_threshold=0.5).build(ids, vectors, n_clusters=8)
+    outlier = normalize(np.random.default_rng(1).normal(size=(1, vectors.shape[1])))
+    assert clusterer.partial_fit(["outlier"], outlier) == [8]
+    assert clusterer.partial_fit(["o0"], vectors[:1]) != [8]
+
+def test_rebuild_is_not_overwritten_by_a_stale_instance(tmp_path, make_vectors):
+    ids, vectors, _ = make_vectors(centers=8)
+    cluster_dir = str(tmp_path / "clusters")
+    stale = OpinionClusterer(cluster_dir).build(ids, vectors, n_clusters=4)
+    OpinionClusterer(cluster_dir).build(ids, vectors, n_clusters=8)
+    # What the stale instance's exit hook does
+    stale._save_if_dirty()
+    assert len(OpinionClusterer(cluster_dir)) == 8
+
+def test_promote_assigns_only_unassigned_members_in_one_write(tmp_path, make_vectors):
+    from src.data_processor import DataProcessor
+    ids, vectors, _ = make_vectors(n=40, centers=2)
+    data_processor = DataProcessor(str(tmp_path), backend="csv")
+    data_processor.add_opinions([{"id": opinion_id, "text": f"opinion {opinion_id}", "topic_id": "T0" if opinion_id == "o0" else None}
+                                 for opinion_id in ids], notify=False)
+    clusterer = OpinionClusterer(str(tmp_path / "clusters")).build(ids, vectors, n_clusters=2)
+    cluster = clusterer.assignments["o0"]
+    members = set(clusterer.members[cluster])
+    
+    writes = []
+    update_many = data_processor.storage.update_many
+    data_processor.storage.update_many = lambda name, updates: writes.append(len(updates)) or update_many(name, updates)
+    topic_id = clusterer.promote(cluster, data_processor, "a new topic")
+    
+    assert writes == [len(members) - 1]
+    opinions = data_processor.opinions.set_index("id")["topic_id"]
+    assert opinions["o0"] == "T0"
+    assert all(opinions[opinion_id] == topic_id for opinion_id in members - {"o0"})
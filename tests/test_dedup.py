@@ -0,0 +1,34 @@
+from src.dedup import DuplicateDetector, shingles
+
+TEXT = "Public transport should be free for everyone in the city, because it cuts traffic and pollution."
+
+def test_shingles_ignore_case_and_punctuation():
+    assert shingles("Hello, World!") == shingles("hello world")
+
+def test_reposts_link_to_the_first_opinion(tmp_path):
+    detector = DuplicateDetector(str(tmp_path / "dup.db"))
+    links = detector.add_many(
+        ["a", "b", "c"],
+        [TEXT, TEXT.upper() + "!!", "Cats are better pets than dogs, they are quiet and independent."],
+    )
+    assert links == {"a": "a", "b": "a", "c": "c"}
+    assert detector.duplicate_ids == {"b"}
+    assert detector.duplicates_of("a") == ["b"]
+    assert detector.stats() == {"opinions": 3, "duplicates": 1, "unique": 2}
+
+def test_links_persist_and_known_ids_keep_their_link(tmp_path):
+    path = str(tmp_path / "dup.db")
+    DuplicateDetector(path).add_many(["a", "b"], [TEXT, TEXT])
+    
+    reopened = DuplicateDetector(path)
+    assert reopened.duplicate_ids == {"b"}
+    assert reopened.add("a", "something else entirely") == "a"
+    assert reopened.add("d", TEXT + " ") == "a"
+    assert reopened.canonical_of(["a", "b", "d", "x"]) == {"a": "a", "b": "a", "d": "a"}
+
+def test_reset_forgets_links(tmp_path):
+    detector = DuplicateDetector(str(tmp_path / "dup.db"))
+    detector.add_many(["a", "b"], [TEXT, TEXT])
+    detector.reset()
+    assert detector.duplicate_ids == set()
+    assert detector.add("b", TEXT) == "b"
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+from src.embedding import EmbeddingProcessor
+from src.fakes import FakeEmbeddingModel
+
+IDS = [f"o{i}" for i in range(200)]
+TEXTS = [f"opinion {i} about subject {i % 13} and theme {i % 7}" for i in range(200)]
+
+def _processor(cache_dir, model_name="fake", dim=64):
+    return EmbeddingProcessor(model_name=model_name, cache_dir=str(cache_dir), model=FakeEmbeddingModel(dim=dim))
+
+def test_store_reuses_embeddings_across_instances(tmp_path):
+    first = _processor(tmp_path)
+    vectors = first.embed_opinions(IDS, TEXTS)
+    second = _processor(tmp_path)
+    assert second.store.count == len(IDS)
+    assert np.allclose(second.store.get(IDS[:5]), vectors[:5])
+
+def test_model_change_drops_derived_indexes(tmp_path):
+    processor = _processor(tmp_path)
+    processor.build_index(IDS, TEXTS, n_lists=4)
+    processor.build_quantized_index(IDS, TEXTS, mode="int8")
+    processor.build_clusters(IDS, TEXTS, n_clusters=4)
+    
+    reloaded = _processor(tmp_path, model_name="other-fake", dim=32)
+    assert reloaded.store.count == 0
+    assert reloaded.ann_index is None
+    assert reloaded.quantized_index is None
+    assert reloaded.clusterer is None
+    assert not os.path.exists(reloaded.index_path)
+    assert not os.path.exists(reloaded.cluster_dir)
+    
+    # New vectors have the new model's dimension
+    assert reloaded.embed_opinions(IDS[:3], TEXTS[:3]).shape == (3, 32)
+
+def test_search_encodes_only_unseen_opinions(tmp_path):
+    processor = _processor(tmp_path)
+    processor.embed_opinions(IDS[:100], TEXTS[:100])
+    calls = processor.model.calls
+    texts, scores, idxs = processor.search_related_opinions(TEXTS[150], IDS, TEXTS, top_k=3, threshold=0.5)
+    assert processor.store.count == len(IDS)
+    # One call for the query, one for the 100 opinions that were not stored yet
+    assert processor.model.calls - calls == 2
+    assert idxs[0] == 150
+
+def test_new_opinions_update_the_index_without_saving_each_time(tmp_path):
+    processor = EmbeddingProcessor(model_name="fake", cache_dir=str(tmp_path), model=FakeEmbeddingModel(dim=64),
+                                   save_every=3)
+    processor.build_index(IDS, TEXTS, n_lists=4)
+    saved = os.path.getmtime(processor.index_path)
+    for i in range(2):
+        processor.on_opinion_changed({"id": f"new{i}", "text": f"brand new opinion {i}"})
+    assert len(processor.ann_index) == len(IDS) + 2
+    assert os.path.getmtime(processor.index_path) == saved
+    
+    processor.close()
+    assert len(_processor(tmp_path).ann_index) == len(IDS) + 2
+
+def test_index_searches_rank_only_the_given_opinions(tmp_path):
+    processor = _processor(tmp_path)
+    processor.build_index(IDS, TEXTS, n_lists=4, n_probe=4)
+    processor.build_quantized_index(IDS, TEXTS, mode="int8")
+    # Leave out the opinions nearest to the query, as dedup filtering would
+    query = TEXTS[0]
+    nearest = set(processor.search_related_opinions(query, IDS, TEXTS, top_k=20, threshold=0.0)[0])
+    kept = [i for i, text in enumerate(TEXTS) if text not in nearest]
+    ids, texts = [IDS[i] for i in kept], [TEXTS[i] for i in kept]
+    
+    exact = processor.search_related_opinions(query, ids, texts, top_k=7, threshold=0.0)
+    assert len(exact[0]) == 7
+    for options in ({"quantized": True}, {"use_index": True}):
+        found = processor.search_related_opinions(query, ids, texts, top_k=7, threshold=0.0, **options)
+        # Hashed fake embeddings tie often, so compare scores rather than positions
+        assert np.allclose(found[1], exact[1], atol=1e-5)
+
+def test_clustered_search_scores_opinions_added_after_clustering(tmp_path):
+    processor = _processor(tmp_path)
+    processor.build_clusters(IDS[:150], TEXTS[:150], n_clusters=4)
+    exact = processor.search_related_opinions(TEXTS[10], IDS[:150], TEXTS[:150], top_k=3, threshold=0.0)
+    clustered = processor.search_related_opinions(TEXTS[10], IDS[:150], TEXTS[:150], top_k=3, threshold=0.0,
+                                                  clustered=True, n_probe=4)
+    assert np.allclose(clustered[1], exact[1], atol=1e-5)
+    
+    # One opinion is clustered as it arrives, the rest are not clustered at all; both are still scored
+    processor.on_opinion_changed({"id": IDS[150], "text": TEXTS[150]})
+    for i in (150, 180):
+        found = processor.search_related_opinions(TEXTS[i], IDS, TEXTS, top_k=1, threshold=0.0, clustered=True, n_probe=1)
+        assert found[2][0] == i
@@ -0,0 +1,44 @@
+import numpy as np
+from src.embedding_store import EmbeddingStore
+from src.fakes import FakeEmbeddingModel
+
+class CountingEncoder:
+    def __init__(self):
+        self.model = FakeEmbeddingModel(dim=16)
+        self.encoded = []
+    
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return self.model.encode(texts)
+
+def test_upsert_encodes_only_new_or_changed_texts(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "fake", initial_capacity=2)
+    encoder = CountingEncoder()
+    assert store.upsert(["a", "b", "c"], ["one", "two", "three"], encoder) == 3
+    assert store.upsert(["a", "b", "c", "d"], ["one", "changed", "three", "four"], encoder) == 2
+    assert encoder.encoded == ["one", "two", "three", "changed", "four"]
+    assert store.count == 4
+    assert np.allclose(np.linalg.norm(store.vectors(), axis=1), 1.0)
+
+def test_store_reloads_from_disk(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "fake", initial_capacity=2)
+    vectors = store.sync(["a", "b", "c"], ["one", "two", "three"], CountingEncoder())
+    store.upsert(["b"], ["changed"], CountingEncoder())
+    
+    reloaded = EmbeddingStore(str(tmp_path), "fake")
+    assert reloaded.count == 3
+    assert np.allclose(reloaded.get(["a", "c"]), vectors[[0, 2]])
+    assert not np.allclose(reloaded.get(["b"]), vectors[1])
+    assert reloaded.upsert(["a", "b", "c"], ["one", "changed", "three"], CountingEncoder()) == 0
+
+def test_add_missing_skips_stored_ids_without_hashing(tmp_path, monkeypatch):
+    store = EmbeddingStore(str(tmp_path), "fake")
+    encoder = CountingEncoder()
+    store.upsert(["a", "b"], ["one", "two"], encoder)
+    
+    hashed = []
+    original = EmbeddingStore.text_hash
+    monkeypatch.setattr(EmbeddingStore, "text_hash", staticmethod(lambda text: hashed.append(text) or original(text)))
+    assert store.add_missing(["a", "b", "c"], ["one", "changed", "three"], encoder) == 1
+    assert hashed == ["three"]
+    assert encoder.encoded == ["one", "two", "three"]
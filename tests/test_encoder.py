@@ -0,0 +1,27 @@
+import numpy as np
+from src.encoder import EncodingEngine, max_deviation
+from src.fakes import FakeEmbeddingModel
+
+TEXTS = ["short", "a somewhat longer text with more words in it", "mid length text here", "x"] * 25
+
+def test_encode_preserves_input_order():
+    model = FakeEmbeddingModel(dim=16)
+    engine = EncodingEngine(model, max_batch_tokens=64, max_batch_size=8)
+    vectors = engine.encode(TEXTS)
+    assert vectors.shape == (len(TEXTS), 16)
+    for text, vector in zip(TEXTS[:4], vectors[:4]):
+        assert np.allclose(vector, engine.encode_one(text))
+
+def test_plan_batches_respects_the_token_budget():
+    engine = EncodingEngine(FakeEmbeddingModel(), max_batch_tokens=20, max_batch_size=4)
+    lengths = [3, 10, 2, 5, 9, 1, 4, 8]
+    batches = engine.plan_batches(lengths)
+    assert sorted(pos for batch in batches for pos in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= 4
+        assert len(batch) == 1 or max(lengths[pos] for pos in batch) * len(batch) <= 20
+
+def test_max_deviation():
+    vectors = np.eye(3, dtype=np.float32)
+    assert max_deviation(vectors, vectors * 2) < 1e-6
+    assert np.isclose(max_deviation(vectors, vectors[::-1]), 1.0)
@@ -0,0 +1,112 @@
+import time
+import pytest
+from src.fakes import FakeGenerativeModel, FakeResponse
+from src.gemini_api import VALID_CATEGORIES, GeminiAPI
+from src.rate_limiter import TokenBucket
+
+def _api(model, backoff=0.05, max_retries=3):
+    return GeminiAPI(None, model=model, rate_limiter=TokenBucket(rate=1000.0, capacity=100),
+                     max_retries=max_retries, backoff=backoff)
+
+def test_quota_errors_are_retried():
+    model = FakeGenerativeModel(latency=0.0, quota_error_every=2)
+    api = _api(model)
+    assert api.classify_opinion("first") in VALID_CATEGORIES
+    assert api.classify_opinion("second") in VALID_CATEGORIES
+    assert model.quota_errors == 1
+    assert model.calls == 3
+
+def test_backoff_is_applied_once():
+    model = FakeGenerativeModel(latency=0.0, quota_error_every=1)
+    api = _api(model, backoff=0.1, max_retries=1)
+    start = time.monotonic()
+    with pytest.raises(Exception):
+        api.classify_opinion("always rate limited")
+    elapsed = time.monotonic() - start
+    # One retry waits backoff * (1 to 1.25); sleeping on top of the drained bucket would double it
+    assert 0.09 <= elapsed < 0.19
+    assert model.calls == 2
+
+def test_other_errors_are_not_retried():
+    class BrokenModel:
+        calls = 0
+        
+        def generate_content(self, prompt):
+            self.calls += 1
+            raise ValueError("bad request")
+    model = BrokenModel()
+    with pytest.raises(ValueError):
+        _api(model)._generate("prompt")
+    assert model.calls == 1
+
+def test_parse_batch_accepts_fenced_replies():
+    reply = '```json\n{"0": "claim", "1": " Evidence "}\n```'
+    assert GeminiAPI._parse_batch(reply, 2) == ["Claim", "Evidence"]
+
+def test_parse_batch_marks_missing_and_invalid_answers():
+    assert GeminiAPI._parse_batch('{"0": "Rebuttal"}', 3) == ["Rebuttal", None, None]
+    assert GeminiAPI._parse_batch('{"0": "Opinion", "1": 3, "2": "Counterclaim"}', 3) == [None, None, "Counterclaim"]
+    assert GeminiAPI._parse_batch('["Claim", "Evidence"]', 2) == [None, None]
+    assert GeminiAPI._parse_batch("Claim, Evidence", 2) == [None, None]
+
+def test_classify_batch_matches_the_model():
+    model = FakeGenerativeModel(latency=0.0)
+    texts = ["cars pollute cities", "buses are cheaper", "bikes are healthy"]
+    assert _api(model).classify_batch(texts) == [model.classify(text) for text in texts]
+    assert model.calls == 1
+
+def test_partial_batch_reply_retries_only_the_gap():
+    # Every batch reply drops its last entry
+    model = FakeGenerativeModel(latency=0.0, partial_batch_every=1)
+    texts = [f"opinion {i}" for i in range(4)]
+    assert _api(model)._classify_batch_with_retry(texts) == [model.classify(text) for text in texts]
+    # One batch call for all four, one single call for the dropped text
+    assert model.batch_calls == 1
+    assert model.calls == 2
+
+def test_malformed_batches_are_split_down_to_single_calls():
+    class MalformedBatchModel(FakeGenerativeModel):
+        def generate_content(self, prompt):
+            if prompt.startswith("Classify each of the following texts"):
+                self.calls += 1
+                return FakeResponse("Sorry, I cannot answer in JSON.")
+            return super().generate_content(prompt)
+    model = MalformedBatchModel(latency=0.0)
+    texts = [f"opinion {i}" for i in range(4)]
+    assert _api(model)._classify_batch_with_retry(texts) == [model.classify(text) for text in texts]
+    # 4 -> 2 + 2 -> 1 + 1 + 1 + 1: three batch calls, then four single calls
+    assert model.calls == 7
+
+def test_concurrent_classification_keeps_order_and_rate():
+    class RecordingModel(FakeGenerativeModel):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.started = []
+            self.in_flight = 0
+            self.max_in_flight = 0
+        
+        def generate_content(self, prompt):
+            with self._lock:
+                self.started.append(time.monotonic())
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                return super().generate_content(prompt)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+    
+    model = RecordingModel(latency=0.02, quota_error_every=7)
+    rate, capacity = 40.0, 4
+    api = GeminiAPI(None, model=model, rate_limiter=TokenBucket(rate=rate, capacity=capacity), max_retries=5,
+                    backoff=0.05)
+    texts = [f"opinion number {i}" for i in range(30)]
+    assert api.classify_opinions(texts, max_workers=4, batch_size=1) == [model.classify(text) for text in texts]
+    
+    assert model.quota_errors > 0
+    assert model.max_in_flight > 1
+    # Every call, retries included, took a token: no window exceeds the burst plus the refill
+    started = sorted(model.started)
+    for first in range(len(started)):
+        for last in range(first, len(started)):
+            assert last - first + 1 <= capacity + rate * (started[last] - started[first]) + 1
@@ -0,0 +1,82 @@
+import io
+import threading
+import time
+import pytest
+from src.data_processor import DataProcessor
+from src.ingest import StreamingIngestor, read_records
+
+def test_read_records_from_csv_skips_rows_without_text(tmp_path):
+    path = tmp_path / "posts.csv"
+    path.write_text("id,topic_id,text,type\n1,T1,buses should be free,Claim\n2,,,\n,T2,bikes are healthy,\n")
+    records = list(read_records(str(path)))
+    assert records == [
+        {"id": "1", "topic_id": "T1", "type": "Claim", "effectiveness": None, "text": "buses should be free"},
+        {"id": None, "topic_id": "T2", "type": None, "effectiveness": None, "text": "bikes are healthy"},
+    ]
+
+def test_read_records_from_jsonl(tmp_path):
+    path = tmp_path / "posts.jsonl"
+    path.write_text('{"id": 7, "body": "cars pollute cities"}\n\n{"id": 8, "body": ""}\n{"body": "trains are fast"}\n')
+    records = list(read_records(str(path), text_field="body"))
+    assert [(record["id"], record["text"]) for record in records] == [("7", "cars pollute cities"), (None, "trains are fast")]
+
+def test_read_records_from_stdin(monkeypatch):
+    monkeypatch.setattr("sys.stdin", io.StringIO('{"text": "first"}\n{"text": "second", "topic_id": "T1"}\n'))
+    records = list(read_records("-"))
+    assert [record["text"] for record in records] == ["first", "second"]
+    assert records[1]["topic_id"] == "T1"
+
+class BlockingEmbedder:
+    """Stand-in EmbeddingProcessor whose embed_opinions waits for `release` and may fail"""
+    def __init__(self, error=None):
+        self.release = threading.Event()
+        self.embedded = []
+        self.error = error
+    
+    def embed_opinions(self, opinion_ids, texts):
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.embedded.extend(opinion_ids)
+
+def _records(ids):
+    return [{"id": opinion_id, "topic_id": None, "type": None, "effectiveness": None, "text": f"opinion {opinion_id}"}
+            for opinion_id in ids]
+
+def test_ingest_dedupes_ids_across_batches(tmp_path):
+    data_processor = DataProcessor(str(tmp_path), backend="csv")
+    data_processor.add_opinions(_records(["x"]), notify=False)
+    ingestor = StreamingIngestor(data_processor, batch_size=2, report_every=60)
+    
+    stats = ingestor.ingest(iter(_records(["a", "b", "a", "x", "c", "b", None, None])))
+    assert stats["read"] == 8
+    assert stats["duplicates"] == 3
+    assert stats["stored"] == 5
+    # The two records without an id get generated ones
+    assert {"a", "b", "c", "x"} <= set(data_processor.opinions["id"])
+    assert data_processor.count("opinions") == 6
+
+def test_ingest_applies_backpressure(tmp_path):
+    data_processor = DataProcessor(str(tmp_path), backend="csv")
+    embedder = BlockingEmbedder()
+    ingestor = StreamingIngestor(data_processor, embedder, batch_size=1, max_pending_batches=1, report_every=60)
+    thread = threading.Thread(target=ingestor.ingest, args=(iter(_records([str(i) for i in range(10)])),))
+    thread.start()
+    
+    # One batch in the embedder, one queued, the reader blocked putting the third
+    time.sleep(0.3)
+    assert ingestor.stats["read"] == 3
+    embedder.release.set()
+    thread.join(5)
+    assert ingestor.stats["embedded"] == 10
+    assert embedder.embedded == [str(i) for i in range(10)]
+
+def test_ingest_surfaces_embedding_errors(tmp_path):
+    data_processor = DataProcessor(str(tmp_path), backend="csv")
+    embedder = BlockingEmbedder(error=RuntimeError("encoder crashed"))
+    embedder.release.set()
+    ingestor = StreamingIngestor(data_processor, embedder, batch_size=2, report_every=60)
+    with pytest.raises(RuntimeError, match="encoder crashed"):
+        ingestor.ingest(iter(_records([str(i) for i in range(20)])))
+    # Rows stored before the failure are kept
+    assert data_processor.count("opinions") >= 2
@@ -0,0 +1,52 @@
+import numpy as np
+from src.lexical_index import BM25Index, tokenize
+
+def _index(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.log"))
+    index.add_many(["a", "b", "c"], [
+        "Remote work improves productivity",
+        "Remote work remote work remote work and long commutes",
+        "Free public transport in the city",
+    ])
+    return index
+
+def test_tokenize_drops_stop_words_and_case():
+    assert tokenize("The City, and THE transport!") == ["city", "transport"]
+
+def test_search_ranks_by_bm25(tmp_path):
+    index = _index(tmp_path)
+    ids, scores = index.search("remote productivity")
+    assert ids == ["a", "b"]
+    assert scores[0] > scores[1] > 0
+    assert index.search("volcano")[0] == []
+    assert len(index.search("remote", top_k=1)[0]) == 1
+
+def test_scores_match_the_bm25_formula(tmp_path):
+    index = _index(tmp_path)
+    # "transport" occurs once, in c (4 terms); documents have 4, 8 and 4 terms
+    idf = np.log(1 + (3 - 1 + 0.5) / (1 + 0.5))
+    expected = idf * 1 * 2.5 / (1 + 1.5 * (0.25 + 0.75 * 4 / (16 / 3)))
+    assert np.isclose(index.search("transport")[1][0], expected, rtol=1e-5)
+
+def test_reindexing_replaces_a_document(tmp_path):
+    index = _index(tmp_path)
+    index.add("a", "cats and dogs")
+    assert index.search("productivity")[0] == []
+    assert index.search("cats")[0] == ["a"]
+    assert len(index) == 3
+
+def test_log_replay_and_compact(tmp_path):
+    index = _index(tmp_path)
+    index.add("a", "cats and dogs")
+    expected = index.search("remote cats")
+    
+    reloaded = BM25Index(str(tmp_path / "bm25.log"))
+    assert reloaded.search("remote cats")[0] == expected[0]
+    reloaded.compact()
+    assert reloaded.log.records == 3
+    assert BM25Index(str(tmp_path / "bm25.log")).search("remote cats")[0] == expected[0]
+
+def test_sync_only_indexes_missing_opinions(tmp_path):
+    index = _index(tmp_path)
+    assert index.sync(["a", "b", "d"], ["changed", "changed", "new opinion"]) == 1
+    assert index.search("changed")[0] == []
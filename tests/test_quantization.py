@@ -0,0 +1,32 @@
+import pytest
+from src.quantization import MODES, QuantizedIndex
+from src.vector_index import ExactIndex, recall_at_k
+
+@pytest.mark.parametrize("mode", MODES)
+def test_rescored_search_matches_exact_search(mode, make_vectors):
+    ids, vectors, _ = make_vectors(n=2000, dim=64)
+    positions = {opinion_id: i for i, opinion_id in enumerate(ids)}
+    index = QuantizedIndex(mode, rescore_factor=20).build(ids, vectors)
+    exact = ExactIndex().build(ids, vectors)
+    
+    class Rescored:
+        def search(self, query, top_k):
+            return index.search(query, top_k=top_k, rescore_fn=lambda found: vectors[[positions[i] for i in found]])
+    assert recall_at_k(Rescored(), exact, vectors[::100], top_k=7) >= (0.95 if mode != "binary" else 0.6)
+
+def test_compact_modes_use_less_memory(make_vectors):
+    ids, vectors, _ = make_vectors(n=500, dim=64)
+    sizes = {mode: QuantizedIndex(mode).build(ids, vectors).memory_bytes() for mode in MODES}
+    assert sizes["float16"] == vectors.nbytes // 2
+    assert sizes["int8"] < sizes["float16"]
+    assert sizes["binary"] < sizes["int8"]
+
+def test_save_load_and_add(tmp_path, make_vectors):
+    ids, vectors, _ = make_vectors(n=300, dim=64)
+    index = QuantizedIndex("int8").build(ids[:200], vectors[:200])
+    index.add(ids[200:], vectors[200:])
+    path = str(tmp_path / "q.npz")
+    index.save(path)
+    reloaded = QuantizedIndex.load(path)
+    assert len(reloaded) == 300
+    assert reloaded.search(vectors[250], top_k=1)[0] == ["o250"]
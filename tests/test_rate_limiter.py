@@ -0,0 +1,42 @@
+import threading
+import time
+from src.rate_limiter import TokenBucket
+
+def test_token_bucket_allows_a_burst_then_throttles():
+    bucket = TokenBucket(rate=10.0, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=50.0, capacity=1)
+    assert bucket.try_acquire()
+    start = time.monotonic()
+    assert bucket.acquire()
+    assert 0.01 <= time.monotonic() - start < 0.2
+
+def test_token_bucket_acquire_times_out():
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    assert bucket.try_acquire()
+    assert not bucket.acquire(timeout=0.05)
+
+def test_token_bucket_penalize_delays_every_caller():
+    bucket = TokenBucket(rate=100.0, capacity=5)
+    bucket.penalize(0.1)
+    assert not bucket.try_acquire()
+    start = time.monotonic()
+    assert bucket.acquire()
+    assert 0.09 <= time.monotonic() - start < 0.3
+
+def test_token_bucket_is_thread_safe():
+    bucket = TokenBucket(rate=0.001, capacity=50)
+    granted = []
+    
+    def worker():
+        for _ in range(20):
+            if bucket.try_acquire():
+                granted.append(1)
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(granted) == 50
@@ -0,0 +1,34 @@
+import threading
+from src import resources as resources_module
+from src.data_processor import DataProcessor
+from src.embedding import EmbeddingProcessor
+from src.fakes import FakeEmbeddingModel
+from src.lexical_index import BM25Index
+from src.resources import SharedResources
+
+def test_lexical_index_loads_in_the_background(tmp_path, monkeypatch):
+    data_path = str(tmp_path)
+    DataProcessor(data_path, backend="csv").add_opinions(
+        [{"id": "o1", "text": "remote work improves productivity"}], notify=False
+    )
+    
+    # Hold the BM25 log replay until the resources are constructed and warming up
+    release = threading.Event()
+    class SlowBM25Index(BM25Index):
+        def __init__(self, path):
+            release.wait(5)
+            super().__init__(path)
+    monkeypatch.setattr(resources_module, "BM25Index", SlowBM25Index)
+    monkeypatch.setattr(resources_module, "EmbeddingProcessor",
+                        lambda cache_dir, backend: EmbeddingProcessor(model_name="fake", cache_dir=cache_dir,
+                                                                      model=FakeEmbeddingModel()))
+    
+    resources = SharedResources(data_path=data_path, models_path=str(tmp_path / "models"), backend="csv")
+    resources._start_lexical_load()
+    assert resources._lexical_index is None
+    
+    # Opinions added while the index loads are not missed
+    resources.data_processor.add_opinion("remote work saves commuting time")
+    release.set()
+    found_ids, _ = resources.lexical_index.search("remote work")
+    assert len(found_ids) == 2
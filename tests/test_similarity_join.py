@@ -0,0 +1,75 @@
+import numpy as np
+from src.similarity_join import best_matches, similarity_join
+from src.vector_index import normalize
+
+def test_similarity_join_matches_dense_product_across_tiles():
+    rng = np.random.default_rng(0)
+    topics = normalize(rng.normal(size=(37, 8)))
+    opinions = normalize(rng.normal(size=(101, 8)))
+    pairs = similarity_join(topics, opinions, threshold=0.5, block_size=16, workers=2)
+    
+    sims = opinions @ topics.T
+    expected = {(int(t), int(o)) for o, t in zip(*np.nonzero(sims > 0.5))}
+    assert set(zip(pairs["topic_idx"].tolist(), pairs["opinion_idx"].tolist())) == expected
+
+def test_best_matches_keeps_the_top_topic_per_opinion():
+    rng = np.random.default_rng(1)
+    topics = normalize(rng.normal(size=(10, 8)))
+    opinions = normalize(rng.normal(size=(50, 8)))
+    best = best_matches(similarity_join(topics, opinions, threshold=0.0, block_size=7))
+    
+    sims = opinions @ topics.T
+    assert best["opinion_idx"].is_unique
+    for opinion_idx, topic_idx in zip(best["opinion_idx"], best["topic_idx"]):
+        assert topic_idx == int(np.argmax(sims[opinion_idx]))
+
+def test_assign_topics_embeds_every_topic_row(tmp_path):
+    from src.data_processor import DataProcessor
+    from src.embedding import EmbeddingProcessor
+    from src.fakes import FakeEmbeddingModel
+    from src.similarity_join import assign_topics
+    
+    # Two rows share topic_id T1 but have different texts
+    (tmp_path / "topics.csv").write_text(
+        "id,topic_id,text,type,effectiveness\n"
+        "r1,T1,remote work improves productivity,,\n"
+        "r2,T1,public transport should be free,,\n"
+        "r3,T2,cats are better pets than dogs,,\n"
+    )
+    data_processor = DataProcessor(str(tmp_path), backend="csv")
+    data_processor.add_opinions([{"id": "o1", "text": "public transport should be free"},
+                                 {"id": "o2", "text": "cats are better pets than dogs"}], notify=False)
+    embedding_processor = EmbeddingProcessor(model_name="fake", cache_dir=str(tmp_path / "models"),
+                                             model=FakeEmbeddingModel())
+    
+    assignments = assign_topics(data_processor, embedding_processor, threshold=0.9, workers=1)
+    assert dict(zip(assignments["opinion_id"], assignments["topic_id"])) == {"o1": "T1", "o2": "T2"}
+    assert dict(zip(data_processor.opinions["id"], data_processor.opinions["topic_id"])) == {"o1": "T1", "o2": "T2"}
+
+def test_similarity_join_reads_opinion_rows_per_tile():
+    rng = np.random.default_rng(2)
+    topics = normalize(rng.normal(size=(9, 8)))
+    matrix = normalize(rng.normal(size=(60, 8)))
+    rows = np.array([5, 40, 41, 7, 59, 0, 33])
+    pairs = similarity_join(topics, matrix, threshold=0.2, block_size=3, opinion_rows=rows)
+    expected = similarity_join(topics, matrix[rows], threshold=0.2, block_size=3)
+    assert sorted(zip(pairs["topic_idx"], pairs["opinion_idx"])) == sorted(zip(expected["topic_idx"], expected["opinion_idx"]))
+
+def test_assign_topics_never_copies_the_opinion_matrix(tmp_path, monkeypatch):
+    from src.data_processor import DataProcessor
+    from src.embedding import EmbeddingProcessor
+    from src.fakes import FakeEmbeddingModel
+    from src.similarity_join import assign_topics
+    
+    (tmp_path / "topics.csv").write_text("id,topic_id,text,type,effectiveness\nr1,T1,cats are better pets than dogs,,\n")
+    data_processor = DataProcessor(str(tmp_path), backend="csv")
+    data_processor.add_opinions([{"id": f"o{i}", "text": f"opinion number {i}"} for i in range(20)]
+                                + [{"id": "cat", "text": "cats are better pets than dogs"}], notify=False)
+    embedding_processor = EmbeddingProcessor(model_name="fake", cache_dir=str(tmp_path / "models"),
+                                             model=FakeEmbeddingModel())
+    def get(opinion_ids):
+        raise AssertionError("full copy of the opinion embeddings")
+    monkeypatch.setattr(embedding_processor.store, "get", get)
+    
+    assignments = assign_topics(data_processor, embedding_processor, threshold=0.9, block_size=4, workers=1)
+    assert assignments["opinion_id"].tolist() == ["cat"]
@@ -0,0 +1,118 @@
+import sqlite3
+import pytest
+from src.data_processor import DataProcessor
+from src.storage import CSVStorage, SQLiteStorage
+from src.table_log import TableLog
+
+def test_csv_storage_replays_uncompacted_log(tmp_path):
+    storage = CSVStorage(str(tmp_path))
+    storage.insert("opinions", {"id": "a", "topic_id": None, "text": "first", "type": None, "effectiveness": None})
+    storage.update("opinions", "a", {"type": "Claim"})
+    storage.flush()
+    
+    reopened = CSVStorage(str(tmp_path))
+    opinions = reopened.frame("opinions")
+    assert opinions["id"].tolist() == ["a"]
+    assert opinions["type"].tolist() == ["Claim"]
+
+def test_csv_storage_crash_during_compact_does_not_duplicate_rows(tmp_path, monkeypatch):
+    storage = CSVStorage(str(tmp_path))
+    storage.insert_many("opinions", [
+        {"id": str(i), "topic_id": None, "text": f"opinion {i}", "type": None, "effectiveness": None} for i in range(3)
+    ])
+    
+    # The CSV is replaced, then the process dies before the log is truncated
+    def crash(self):
+        raise RuntimeError("crash")
+    monkeypatch.setattr(TableLog, "truncate", crash)
+    with pytest.raises(RuntimeError):
+        storage.compact(["opinions"])
+    monkeypatch.undo()
+    
+    reopened = CSVStorage(str(tmp_path))
+    assert sorted(reopened.frame("opinions")["id"].astype(str)) == ["0", "1", "2"]
+    assert reopened.count("opinions") == 3
+
+def test_csv_storage_compacts_relative_to_table_size(tmp_path, monkeypatch):
+    storage = CSVStorage(str(tmp_path), compact_every=10, compact_ratio=0.5)
+    compactions = []
+    compact = storage.compact
+    monkeypatch.setattr(storage, "compact", lambda names=None: compactions.append(storage.count("opinions")) or compact(names))
+    for i in range(200):
+        storage.insert("opinions", {"id": str(i), "text": f"opinion {i}"})
+    # With ratio 0.5 the table doubles between compactions, so 200 inserts rewrite the CSV 5 times, not 20
+    assert compactions == [10, 20, 40, 80, 160]
+    assert storage.count("opinions") == 200
+
+def _write_csv(tmp_path, name, ids):
+    rows = "\n".join(f"{row_id},,text {row_id},," for row_id in ids)
+    (tmp_path / f"{name}.csv").write_text("id,topic_id,text,type,effectiveness\n" + rows + "\n")
+
+def test_sqlite_storage_imports_csv_once(tmp_path):
+    _write_csv(tmp_path, "topics", ["t1", "t2"])
+    storage = DataProcessor(str(tmp_path), backend="sqlite").storage
+    assert storage.is_imported()
+    assert storage.count("topics") == 2
+    
+    storage.insert("topics", {"id": "t3", "text": "new"})
+    reopened = DataProcessor(str(tmp_path), backend="sqlite").storage
+    assert reopened.count("topics") == 3
+
+def test_sqlite_storage_redoes_interrupted_import(tmp_path, monkeypatch):
+    _write_csv(tmp_path, "topics", ["t1", "t2"])
+    _write_csv(tmp_path, "opinions", ["o1"])
+    
+    # Fail after topics were written, before the import finished
+    original = CSVStorage.frame
+    def frame(self, name):
+        if name == "opinions":
+            raise RuntimeError("interrupted")
+        return original(self, name)
+    monkeypatch.setattr(CSVStorage, "frame", frame)
+    with pytest.raises(RuntimeError):
+        DataProcessor(str(tmp_path), backend="sqlite")
+    monkeypatch.undo()
+    
+    storage = DataProcessor(str(tmp_path), backend="sqlite").storage
+    assert storage.count("topics") == 2
+    assert storage.count("opinions") == 1
+
+def test_sqlite_storage_import_skips_repeated_ids(tmp_path):
+    _write_csv(tmp_path, "topics", ["t1", "t2", "t1"])
+    for _ in range(2):
+        storage = DataProcessor(str(tmp_path), backend="sqlite").storage
+        assert storage.is_imported()
+        assert sorted(storage.frame("topics")["id"]) == ["t1", "t2"]
+
+def test_sqlite_storage_export_csv(tmp_path):
+    _write_csv(tmp_path, "topics", ["t1"])
+    storage = DataProcessor(str(tmp_path), backend="sqlite").storage
+    storage.insert("topics", {"id": "t2", "text": "new"})
+    storage.export_csv(str(tmp_path))
+    assert sorted(CSVStorage(str(tmp_path)).frame("topics")["id"]) == ["t1", "t2"]
+
+def test_sqlite_storage_rejects_duplicate_ids(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "test.db"))
+    storage.insert("opinions", {"id": "a", "text": "first"})
+    with pytest.raises(sqlite3.IntegrityError):
+        storage.insert("opinions", {"id": "a", "text": "again"})
+
+def test_sqlite_storage_update_many(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "test.db"))
+    storage.insert_many("opinions", [{"id": row_id, "text": row_id} for row_id in ("a", "b", "c")])
+    rows = storage.update_many("opinions", [("a", {"topic_id": "T1"}), ("missing", {"topic_id": "T2"}), ("c", {"type": "Claim"})])
+    assert [row["id"] for row in rows] == ["a", "c"]
+    assert storage.find("opinions", "id", "a")["topic_id"].tolist() == ["T1"]
+    assert storage.find("opinions", "id", "c")["type"].tolist() == ["Claim"]
+
+def test_csv_storage_existing_ids_tracks_inserts(tmp_path):
+    storage = CSVStorage(str(tmp_path))
+    storage.insert("opinions", {"id": "a", "text": "first"})
+    assert storage.existing_ids("opinions", ["a", "b"]) == {"a"}
+    storage.insert_many("opinions", [{"id": "b", "text": "second"}, {"id": "c", "text": "third"}])
+    assert storage.existing_ids("opinions", ["a", "b", "c", "d"]) == {"a", "b", "c"}
+    # Pending inserts were not folded into the frame to answer the lookup
+    assert len(storage._pending["opinions"]) == 3
+    
+    storage.flush()
+    assert CSVStorage(str(tmp_path)).existing_ids("opinions", ["c", "d"]) == {"c"}
@@ -0,0 +1,30 @@
+from src.table_log import TableLog
+
+def test_replay_returns_appended_records_in_order(tmp_path):
+    log = TableLog(str(tmp_path / "t.log"))
+    log.append({"n": 1})
+    log.append_many([{"n": 2}, {"n": 3}])
+    log.close()
+    assert [record["n"] for record in TableLog(str(tmp_path / "t.log")).replay()] == [1, 2, 3]
+
+def test_replay_skips_torn_trailing_line(tmp_path):
+    path = tmp_path / "t.log"
+    log = TableLog(str(path))
+    log.append_many([{"n": 1}, {"n": 2}])
+    log.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"n": 3')
+    
+    reopened = TableLog(str(path))
+    assert [record["n"] for record in reopened.replay()] == [1, 2]
+    assert reopened.records == 2
+
+def test_truncate_empties_the_log(tmp_path):
+    log = TableLog(str(tmp_path / "t.log"))
+    log.append({"n": 1})
+    log.truncate()
+    assert log.records == 0
+    assert list(log.replay()) == []
+    log.append({"n": 2})
+    log.close()
+    assert [record["n"] for record in TableLog(str(tmp_path / "t.log")).replay()] == [2]
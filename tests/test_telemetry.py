@@ -0,0 +1,41 @@
+import threading
+from src.telemetry import Telemetry
+
+def test_disabled_telemetry_records_nothing():
+    telemetry = Telemetry()
+    with telemetry.span("stage") as span:
+        span.set(rows=1)
+    telemetry.incr("requests_total")
+    assert telemetry.snapshot() == ({}, {})
+
+def test_spans_nest_and_collect_on_the_root():
+    telemetry = Telemetry(enabled=True)
+    with telemetry.span("root") as root:
+        with telemetry.span("child", rows=3):
+            pass
+        def in_thread():
+            with telemetry.span("in_thread"):
+                pass
+        worker = threading.Thread(target=telemetry.wrap(in_thread))
+        worker.start()
+        worker.join()
+    records = {record["span"]: record for record in root.records}
+    assert records["child"]["parent"] == "root"
+    assert records["child"]["rows"] == 3
+    assert records["in_thread"]["parent"] == "root"
+    assert records["root"]["parent"] is None
+
+def test_prometheus_text_exports_counters_and_histograms(tmp_path):
+    telemetry = Telemetry(enabled=True)
+    telemetry.incr("gemini_requests_total", kind="classify", outcome="ok")
+    telemetry.incr("gemini_requests_total", kind="classify", outcome="ok")
+    telemetry.observe("gemini_latency_seconds", 0.2, kind="classify")
+    text = telemetry.prometheus_text()
+    assert 'digitalpulse_gemini_requests_total{kind="classify",outcome="ok"} 2' in text
+    assert 'digitalpulse_gemini_latency_seconds_bucket{kind="classify",le="0.25"} 1' in text
+    assert 'digitalpulse_gemini_latency_seconds_bucket{kind="classify",le="0.1"} 0' in text
+    assert 'digitalpulse_gemini_latency_seconds_count{kind="classify"} 1' in text
+    
+    path = tmp_path / "metrics.prom"
+    telemetry.write_prometheus(str(path))
+    assert path.read_text() == text
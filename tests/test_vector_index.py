@@ -0,0 +1,47 @@
+import numpy as np
+from src.vector_index import ExactIndex, IVFIndex, recall_at_k, top_k_scores
+
+def test_top_k_scores_orders_and_thresholds():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+    assert top_k_scores(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_scores(scores, 10, threshold=0.4).tolist() == [1, 3, 2]
+    assert top_k_scores(scores, 2, threshold=0.95).tolist() == []
+
+def test_exact_index_matches_brute_force(make_vectors):
+    ids, vectors, _ = make_vectors(n=300, centers=20)
+    index = ExactIndex().build(ids, vectors)
+    query = vectors[17]
+    found_ids, scores = index.search(query, top_k=5)
+    expected = np.argsort(-(vectors @ query), kind="stable")[:5]
+    assert found_ids == [ids[i] for i in expected]
+    assert found_ids[0] == "o17"
+    assert np.isclose(scores[0], 1.0, atol=1e-5)
+
+def test_ivf_index_recall(make_vectors):
+    ids, vectors, _ = make_vectors(n=2000, centers=20)
+    exact = ExactIndex().build(ids, vectors)
+    ivf = IVFIndex(n_lists=32, n_probe=8).build(ids, vectors)
+    queries = vectors[::40]
+    assert recall_at_k(ivf, exact, queries, top_k=7) >= 0.9
+
+def test_ivf_index_add_and_reload(tmp_path, make_vectors):
+    ids, vectors, _ = make_vectors(n=500, centers=20)
+    index = IVFIndex(n_lists=8, n_probe=8).build(ids[:400], vectors[:400])
+    index.add(ids[400:], vectors[400:])
+    assert len(index) == 500
+    
+    path = str(tmp_path / "ivf.npz")
+    index.save(path)
+    reloaded = IVFIndex.load(path)
+    assert len(reloaded) == 500
+    assert reloaded.search(vectors[450], top_k=1)[0] == ["o450"]
+
+def test_ivf_index_add_moves_replaced_vectors_between_lists(make_vectors):
+    ids, vectors, _ = make_vectors(n=500, centers=20)
+    index = IVFIndex(n_lists=8, n_probe=1).build(ids, vectors)
+    # Replace o0 with the vector of an opinion in another list
+    other = next(i for i in range(500) if index.assignments[i] != index.assignments[0])
+    index.add(["o0"], vectors[other:other + 1])
+    assert index.assignments[0] == index.assignments[other]
+    assert sorted(pos for bucket in index.lists for pos in bucket) == list(range(500))
+    assert "o0" in index.search(vectors[other], top_k=2)[0]